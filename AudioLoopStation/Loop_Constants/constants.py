@@ -11,3 +11,33 @@ trackStatus = [("Empty", "grey58"),
 playbackDirectionChar = ['F', 'R']
 
 pitchChar = ['N', 'L', 'H']
+
+# value of the volume scale and dial that plays at the recorded level. The
+# gain is value / volumeUnity, so the top of the range doubles the level
+volumeUnity = 50
+
+# semitones the mixer shifts a track by for each entry of pitchChar
+pitchSemitones = [0, -12, 12]
+
+# Disk budget of the effect render cache in .save/cache
+RENDER_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+# WAV files larger than this are memory mapped and streamed to the mixer
+# instead of being decoded into memory
+STREAMING_THRESHOLD_BYTES = 64 * 1024 * 1024
+
+# Peak levels saved per track with a loop, for drawing it before it loads
+PEAK_SUMMARY_POINTS = 64
+
+# Recordings against a playing loop start and end on the next "bar" or
+# "loop" boundary, counted from the start of the loop
+recordQuantize = "bar"
+beatsPerBar = 4
+
+# Channels of the selected input recorded at once, each into its own track
+recordInputChannels = [0]
+
+# Block sizes and seconds per setting IO_manager().auto_tune tries on the
+# selected output; the lowest stable one is cached in .save
+TUNE_BLOCK_SIZES = [64, 128, 256, 512, 1024]
+TUNE_PROBE_SECONDS = 0.5
@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import pathlib
+import hashlib
+import threading
+import Loop_Constants.constants as constants
+
+
+class _RenderCache:
+    """
+    Singleton class that stores rendered effect variants on disk.
+
+    Entries are keyed by a hash of the source audio content plus the effect
+    parameters, so re-recording a file never serves a stale render and the
+    same audio under two different paths shares its renders. An index file
+    keeps size and last use of each entry; once the cache grows past its
+    byte budget the least recently used entries are evicted.
+
+    The RenderCache() function should be used to access this class.
+
+    DO NOT directly create an object of this class.
+    Examples:
+
+    DON'T   -> my_object = _RenderCache()
+    DO      -> my_object = RenderCache()
+    """
+    _instance = None
+
+    def __init__(
+            self,
+            cache_dir: pathlib.Path = None,
+            max_bytes: int = constants.RENDER_CACHE_MAX_BYTES
+            ) -> None:
+        app_root = pathlib.Path(__file__).parent.parent.parent
+        self._cache_dir = cache_dir or app_root / '.save' / 'cache'
+        self._index_path = self._cache_dir / 'index.json'
+        self._max_bytes = max_bytes
+        self._lock = threading.RLock()
+        # key -> {"size": bytes, "last_used": epoch seconds}
+        self._index = {}
+        # path -> (mtime_ns, size, digest) so unchanged files hash once
+        self._source_hashes = {}
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.fspath(self._cache_dir), exist_ok=True)
+        self._load_index()
+
+    # Public functions
+    def key(self, source_path: str, **params) -> str:
+        """Returns the cache key of a render of source_path.
+
+        Args:
+            source_path (str): path of the audio the render is made from
+            **params: effect parameters, e.g. reverse=1, n_steps=12
+
+        Returns:
+            str: hex digest identifying the render
+        """
+        digest = hashlib.sha1(self.source_hash(source_path).encode())
+        digest.update(json.dumps(params, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def source_hash(self, source_path: str) -> str:
+        """Returns a hash of the content of source_path. Hashes are
+        remembered until the file's size or modification time changes.
+        """
+        stat = os.stat(source_path)
+        with self._lock:
+            known = self._source_hashes.get(source_path)
+            if known is not None and known[:2] == (stat.st_mtime_ns,
+                                                   stat.st_size):
+                return known[2]
+
+        digest = hashlib.sha1()
+        with open(source_path, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                digest.update(chunk)
+        with self._lock:
+            self._source_hashes[source_path] = (
+                stat.st_mtime_ns, stat.st_size, digest.hexdigest()
+                )
+        return digest.hexdigest()
+
+    def path_for(self, key: str) -> str:
+        """Returns the file path a render with key is stored at"""
+        return os.fspath(self._cache_dir / f"{key}.wav")
+
+    def contains(self, key: str) -> bool:
+        """Checks for a render without counting a hit or miss"""
+        with self._lock:
+            return key in self._index
+
+    def get(self, key: str) -> str:
+        """Looks up a render and marks it as recently used.
+
+        Returns:
+            str: path of the cached render. None on a cache miss.
+        """
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None or not os.path.exists(self.path_for(key)):
+                self._index.pop(key, None)
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry["last_used"] = time.time()
+            self._save_index()
+            return self.path_for(key)
+
+    def put(self, key: str) -> None:
+        """Registers a render written to path_for(key) and evicts least
+        recently used renders until the cache fits its budget.
+        """
+        path = self.path_for(key)
+        if not os.path.exists(path):
+            return
+        with self._lock:
+            self._index[key] = {
+                "size": os.path.getsize(path),
+                "last_used": time.time()
+            }
+            self._evict()
+            self._save_index()
+
+    def set_max_bytes(self, max_bytes: int) -> None:
+        """Changes the disk budget, evicting renders if needed"""
+        with self._lock:
+            self._max_bytes = max_bytes
+            self._evict()
+            self._save_index()
+
+    def stats(self) -> dict:
+        """Returns cache usage.
+
+        Returns:
+            dict: dict with the following keys:
+
+            ``'hits'``, ``'misses'``
+                Lookups served from and missing in the cache this session.
+            ``'entries'``
+                Number of cached renders.
+            ``'bytes'``, ``'max_bytes'``
+                Disk usage of the cached renders and the budget.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._index),
+                "bytes": self._total_bytes(),
+                "max_bytes": self._max_bytes
+            }
+
+    # Private functions
+    def _total_bytes(self) -> int:
+        return sum(entry["size"] for entry in self._index.values())
+
+    def _evict(self) -> None:
+        total = self._total_bytes()
+        by_age = sorted(self._index.items(),
+                        key=lambda item: item[1]["last_used"])
+        for key, entry in by_age:
+            if total <= self._max_bytes:
+                break
+            try:
+                os.remove(self.path_for(key))
+            except FileNotFoundError:
+                pass
+            del self._index[key]
+            total -= entry["size"]
+
+    def _load_index(self) -> None:
+        """Reads the index and drops entries whose files are gone as well
+        as files the index doesn't know about (e.g. interrupted renders).
+        """
+        if self._index_path.exists():
+            try:
+                with open(os.fspath(self._index_path), "r") as file:
+                    self._index = json.load(file)
+            except (ValueError, OSError):
+                self._index = {}
+
+        for key in list(self._index.keys()):
+            if not os.path.exists(self.path_for(key)):
+                del self._index[key]
+        for cache_file in self._cache_dir.iterdir():
+            if cache_file == self._index_path:
+                continue
+            if cache_file.stem not in self._index:
+                cache_file.unlink()
+        self._evict()
+        self._save_index()
+
+    def _save_index(self) -> None:
+        tmp_path = os.fspath(self._index_path) + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(self._index, file)
+        os.replace(tmp_path, os.fspath(self._index_path))
+
+
+def RenderCache() -> object:
+    """Factory function that produces a _RenderCache object.
+
+    Returns:
+        _RenderCache object
+    """
+    if _RenderCache._instance is None:
+        _RenderCache._instance = _RenderCache()
+    return _RenderCache._instance
@@ -1,37 +1,85 @@
 import os
 import json
 import pathlib
-import re
+import soundfile
 
 
 class SaveManager:
-    def __init__(self):
+    """
+    Saves loops and tracks as json files in .save/loops and .save/tracks.
+
+    An index file in .save keeps name -> path, mtime, track count and
+    duration of everything saved, so listing doesn't touch the saved files.
+    save() and delete() update it entry by entry. Files added or removed
+    behind its back are picked up because every listing compares the
+    directories' mtimes with the ones the index was built from, and only
+    rescans a directory that changed.
+    """
+    def __init__(self, save_dir: pathlib.Path = None):
         self._app_root = pathlib.Path(__file__).parent.parent.parent
-        self._save_dir = self._app_root / '.save'
+        self._save_dir = save_dir or self._app_root / '.save'
         self._track_dir = self._save_dir / 'tracks'
         self._loop_dir = self._save_dir / 'loops'
-        self._saved_loops = set()
-        self._saved_tracks = set()
+        self._index_path = self._save_dir / 'index.json'
+        # "loop"/"track" -> name -> {"path", "mtime", "tracks", "duration"},
+        # plus the directory mtimes the entries were checked against
+        self._index = {"loop": {}, "track": {}, "dir_mtimes": {}}
+        # (mtime, size) of the index file when this object last read or
+        # wrote it, another SaveManager may have updated it since
+        self._index_stamp = None
         self._makedirs()
         self._update_saved_files()
 
     def get_loop_options(self):
         self._update_saved_files()
-        regex = re.compile('[a-zA-Z0-9_ ]+.json')
-        options_list = []
-        for loop in self._saved_loops:
-            loop_name = regex.search(loop).group()
-            options_list.append(loop_name[:-5])  # Removes .json from loop
-        return options_list
+        return list(self._index["loop"])
 
     def get_track_options(self):
         self._update_saved_files()
-        regex = re.compile('[a-zA-Z0-9_ ]+.json')
-        options_list = []
-        for track in self._saved_tracks:
-            track_name = regex.search(track).group()
-            options_list.append(track_name[:-5])  # Removes .json from track
-        return options_list
+        return list(self._index["track"])
+
+    def has_loop(self, name: str) -> bool:
+        """Returns True if a loop named name is saved"""
+        self._update_saved_files()
+        return name in self._index["loop"]
+
+    def get_info(self, obj_type: str, name: str) -> dict:
+        """Returns what the index knows about a saved loop or track.
+
+        Args:
+            obj_type (str): Two acceptable values: "loop" or "track"
+            name (str): Name of LoopChannel or Track. Ex. "default_loop"
+
+        Returns:
+            dict: dict with the following keys, None if name isn't saved:
+
+            ``'path'``
+                The json file.
+            ``'mtime'``
+                Modification time of the json file in nanoseconds.
+            ``'tracks'``
+                Number of track files it refers to.
+            ``'duration'``
+                Length in seconds of its first track file that exists, 0
+                if there is none.
+        """
+        self._update_saved_files()
+        return self._index.get(obj_type.lower(), {}).get(name)
+
+    @staticmethod
+    def track_entries(save_obj: dict) -> list[dict]:
+        """Returns the tracks of a loaded loop as dicts. Loops saved before
+        tracks carried their metadata list plain paths, those become
+        {"path": path}.
+
+        Returns:
+            list[dict]: dicts with the keys of Track.get_data, only
+            ``'path'`` for older saves
+        """
+        return [
+            entry if isinstance(entry, dict) else {"path": entry}
+            for entry in save_obj.get("tracks", [])
+        ]
 
     def save(self, obj_type: str, save_obj):
         """Saves loop and track objects into json files.
@@ -62,12 +110,16 @@ class SaveManager:
             print("SAVE ERROR: Invalid ObjType")
             return
 
+        self._update_saved_files()
         with open(
                 save_name, "w"
                 ) as file:
             json.dump(save_obj, file)
 
-        self._update_saved_files()
+        self._index[obj_type.lower()][pathlib.Path(save_name).stem] = \
+            self._describe(pathlib.Path(save_name), save_obj)
+        self._record_dir_mtimes()
+        self._save_index()
 
     def load(self, obj_type: str, name: str):
         """Loads a Track of LoopChannel object and returns it.
@@ -94,6 +146,33 @@ class SaveManager:
 
         return loaded_obj
 
+    def delete(self, obj_type: str, name: str) -> bool:
+        """Deletes a saved loop or track. The audio files it refers to
+        are kept.
+
+        Args:
+            obj_type (str): Two acceptable values: "loop" or "track"
+            name (str): Name of LoopChannel or Track. Ex. "default_loop"
+
+        Returns:
+            bool: False if nothing was saved under name
+        """
+        directory = self._dirs().get(obj_type.lower())
+        if directory is None:
+            print("DELETE ERROR: Invalid ObjType")
+            return False
+        delete_path = directory / f"{name}.json"
+        if not delete_path.exists():
+            print(f"DELETE ERROR: Could not find {name} of type {obj_type}")
+            return False
+
+        self._update_saved_files()
+        os.remove(os.fspath(delete_path))
+        self._index[obj_type.lower()].pop(name, None)
+        self._record_dir_mtimes()
+        self._save_index()
+        return True
+
     def _makedirs(self):
         save_dir_str = os.fspath(self._save_dir)
         loop_dir_str = os.fspath(self._loop_dir)
@@ -108,16 +187,102 @@ class SaveManager:
             os.makedirs(loop_dir_str)
 
     def _update_saved_files(self):
-        save_dir = self._app_root / '.save'
-
-        self._saved_loops = set()
-        self._saved_tracks = set()
-        # update saved loops
-        loop_dir = save_dir / 'loops'
-        for save_file in loop_dir.iterdir():
-            self._saved_loops.add(os.fspath(save_file))
-
-        # # update saved tracks
-        track_dir = save_dir / 'tracks'
-        for save_file in track_dir.iterdir():
-            self._saved_tracks.add(os.fspath(save_file))
+        #   Brings the index up to date: rereads it if another SaveManager
+        #   wrote it, and rescans the directories whose mtime changed
+        self._reload_index()
+        changed = False
+        for obj_type, directory in self._dirs().items():
+            mtime = self._dir_mtime(directory)
+            if self._index["dir_mtimes"].get(obj_type) == mtime:
+                continue
+            self._rescan(obj_type, directory)
+            self._index["dir_mtimes"][obj_type] = mtime
+            changed = True
+        if changed:
+            self._save_index()
+
+    def _rescan(self, obj_type: str, directory: pathlib.Path):
+        #   Describes new and modified files again, drops removed ones
+        entries = self._index[obj_type]
+        found = {}
+        for save_file in directory.iterdir():
+            if save_file.suffix != ".json":
+                continue
+            entry = entries.get(save_file.stem)
+            try:
+                if entry is None or \
+                        entry["mtime"] != save_file.stat().st_mtime_ns:
+                    with open(os.fspath(save_file), "r") as file:
+                        entry = self._describe(save_file, json.load(file))
+            except (OSError, ValueError):
+                continue
+            found[save_file.stem] = entry
+        self._index[obj_type] = found
+
+    def _describe(self, path: pathlib.Path, save_obj) -> dict:
+        #   Index entry of a saved json file, tracks and duration come from
+        #   the tracks of a loop or the audio path of a track. Tracks saved
+        #   with their format don't need their sound file opened
+        if not isinstance(save_obj, dict):
+            save_obj = {}
+        tracks = self.track_entries(save_obj)
+        if "tracks" not in save_obj and save_obj.get("audio_path"):
+            tracks = [{"path": save_obj["audio_path"]}]
+        duration = 0
+        for track in tracks:
+            if "frames" in track:
+                duration = track["frames"] / track["sample_rate"]
+                break
+            try:
+                duration = soundfile.info(track["path"]).duration
+                break
+            except (RuntimeError, TypeError, OSError):
+                continue
+        return {
+            "path": os.fspath(path),
+            "mtime": path.stat().st_mtime_ns,
+            "tracks": len(tracks),
+            "duration": duration
+        }
+
+    def _dirs(self) -> dict:
+        return {"loop": self._loop_dir, "track": self._track_dir}
+
+    def _dir_mtime(self, directory: pathlib.Path) -> int:
+        return directory.stat().st_mtime_ns
+
+    def _record_dir_mtimes(self):
+        #   After save() or delete() changed a directory itself, so the next
+        #   listing doesn't rescan it
+        for obj_type, directory in self._dirs().items():
+            self._index["dir_mtimes"][obj_type] = self._dir_mtime(directory)
+
+    def _reload_index(self):
+        try:
+            stamp = self._index_stamp_now()
+        except OSError:
+            return
+        if stamp == self._index_stamp:
+            return
+        try:
+            with open(os.fspath(self._index_path), "r") as file:
+                index = json.load(file)
+            self._index = {
+                "loop": dict(index["loop"]),
+                "track": dict(index["track"]),
+                "dir_mtimes": dict(index["dir_mtimes"])
+            }
+        except (OSError, ValueError, KeyError, TypeError):
+            self._index = {"loop": {}, "track": {}, "dir_mtimes": {}}
+        self._index_stamp = stamp
+
+    def _save_index(self):
+        tmp_path = os.fspath(self._index_path) + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(self._index, file)
+        os.replace(tmp_path, os.fspath(self._index_path))
+        self._index_stamp = self._index_stamp_now()
+
+    def _index_stamp_now(self) -> tuple[int, int]:
+        stat = self._index_path.stat()
+        return stat.st_mtime_ns, stat.st_size
@@ -0,0 +1,385 @@
+import os
+import math
+import time
+import weakref
+import threading
+import numpy as np
+
+
+class SoundDeviceBackend:
+    '''
+    Audio backend on the sound hardware, through sounddevice/PortAudio.
+    sounddevice is only imported when the backend is created.
+    '''
+    name = "sounddevice"
+    # listing devices can take seconds, io_manager caches them
+    cache_devices = True
+
+    def __init__(self):
+        import sounddevice
+        self._sd = sounddevice
+        # streams opened through the backend, to tell when PortAudio can
+        # be reinitialised
+        self._streams = weakref.WeakSet()
+
+    def query_devices(self, rescan: bool = False) -> list[dict]:
+        #   PortAudio only lists the devices it found when it started.
+        #   rescan restarts it, which is only safe with no stream open
+        if rescan:
+            if any(not stream.closed for stream in self._streams):
+                print("Unable to look for new audio devices while audio "
+                      "is playing or recording")
+            else:
+                self._sd._terminate()
+                self._sd._initialize()
+        return list(self._sd.query_devices())
+
+    def default_device(self) -> tuple[int, int]:
+        #   Returns the (input, output) device indices used by default
+        input_id, output_id = self._sd.default.device
+        return input_id, output_id
+
+    def output_stream(self, **kwargs):
+        #   Takes the keyword arguments of sounddevice.OutputStream
+        return self._track(self._sd.OutputStream(**kwargs))
+
+    def input_stream(self, **kwargs):
+        #   Takes the keyword arguments of sounddevice.InputStream
+        return self._track(self._sd.InputStream(**kwargs))
+
+    def duplex_stream(self, **kwargs):
+        #   Takes the keyword arguments of sounddevice.Stream
+        return self._track(self._sd.Stream(**kwargs))
+
+    def _track(self, stream):
+        self._streams.add(stream)
+        return stream
+
+
+class _StreamTime:
+    '''
+    Timestamps handed to virtual stream callbacks, named like the fields
+    of the time argument sounddevice passes
+    '''
+    __slots__ = ("currentTime", "inputBufferAdcTime", "outputBufferDacTime")
+
+    def __init__(self, current, adc, dac):
+        self.currentTime = current
+        self.inputBufferAdcTime = adc
+        self.outputBufferDacTime = dac
+
+
+class _CallbackFlags:
+    '''
+    Status handed to virtual stream callbacks, named like the fields of
+    sounddevice.CallbackFlags. True when any flag is set.
+    '''
+    __slots__ = ("input_overflow", "output_underflow")
+
+    def __init__(self, input_overflow=False, output_underflow=False):
+        self.input_overflow = input_overflow
+        self.output_underflow = output_underflow
+
+    def __bool__(self):
+        return self.input_overflow or self.output_underflow
+
+
+class _VirtualStream:
+    '''
+    Input, output or full duplex stream of the VirtualBackend. Calls its
+    callback once per block like a sounddevice stream, on the backend's
+    simulated clock. Duplex streams take (input, output) channel counts.
+    Blocks are always float32.
+    '''
+    def __init__(self, backend, kind: str, samplerate=44100, blocksize=0,
+                 device=None, channels=1, dtype="float32", callback=None,
+                 latency=None, **kwargs):
+        self._backend = backend
+        self.kind = kind
+        self.samplerate = samplerate
+        self.blocksize = blocksize or 512
+        self.device = device
+        self.channels = channels
+        self.latency = backend.latency
+        self.callback = callback
+        self.active = False
+        self.closed = False
+        # frames run through the callback since the stream was created
+        self.frames = 0
+        # backend time the stream's first frame belongs to
+        self._start_time = 0.0
+        if kind == "duplex":
+            input_channels, output_channels = channels
+        elif kind == "input":
+            input_channels, output_channels = channels, 0
+        else:
+            input_channels, output_channels = 0, channels
+        self._input = None
+        self._output = None
+        if input_channels:
+            self._input = np.zeros((self.blocksize, input_channels),
+                                   dtype=np.float32)
+        if output_channels:
+            self._output = np.zeros((self.blocksize, output_channels),
+                                    dtype=np.float32)
+        self._thread = None
+
+    @property
+    def time(self) -> float:
+        #   Backend time of the next block the stream runs
+        return self._start_time + self.frames / self.samplerate
+
+    def start(self):
+        if self.active:
+            return
+        self._start_time = self._backend.time - self.frames / self.samplerate
+        self.active = True
+        self._backend._attach(self)
+
+    def stop(self):
+        self.active = False
+        self._backend._detach(self)
+
+    def close(self):
+        self.stop()
+        self.closed = True
+
+    def _tick(self, status=None):
+        #   Runs one block through the callback
+        now = self.time
+        stamp = _StreamTime(now, now - self.latency, now + self.latency)
+        if self._input is not None:
+            self._backend._produce(self._input, self)
+        if self._output is not None:
+            self._output.fill(0)
+        if self.kind == "duplex":
+            self.callback(self._input, self._output, self.blocksize, stamp,
+                          status)
+        else:
+            block = self._input if self.kind == "input" else self._output
+            self.callback(block, self.blocksize, stamp, status)
+        if self._output is not None:
+            self._backend._consume(self._output, self)
+        self.frames += self.blocksize
+
+
+class VirtualBackend:
+    '''
+    Audio backend without hardware, for headless machines, tests and
+    benchmarks. It has one virtual input and one virtual output device.
+
+    Streams run on a simulated clock. With speed=1 every stream is driven
+    by its own thread in real time, speed=4 runs four times faster and
+    speed=math.inf as fast as the callbacks allow. With speed=None nothing
+    runs by itself and advance() moves the clock, which makes tests
+    deterministic. A real time stream whose callback falls further behind
+    than the latency reports an underflow (or overflow for inputs) in its
+    next callback's status and carries on from the current time, like a
+    sound card that dropped a buffer.
+
+    Input streams read input_signal, a float array shaped (frames,
+    channels) that repeats, or silence. Every block an output stream
+    produces is passed to output_sink if one is set. With loopback set to
+    a delay in seconds, everything the outputs play is also heard by the
+    inputs that much later, like a cable from the output to the input.
+    add_device() and remove_device() simulate hot-plugging.
+    '''
+    name = "virtual"
+    cache_devices = False
+
+    def __init__(self, speed: float = 1.0, input_signal=None,
+                 output_sink=None, samplerate: int = 44100,
+                 channels: int = 2, latency: float = 0.01,
+                 loopback: float = None):
+        self.speed = speed
+        self.input_signal = input_signal
+        self.output_sink = output_sink
+        self.latency = latency
+        self.loopback = loopback
+        self.time = 0.0
+        # loopback ring of 4 seconds, indexed by frame of backend time
+        self._loopback_buffer = np.zeros((samplerate * 4, channels),
+                                         dtype=np.float32)
+        self._lock = threading.Lock()
+        self._streams = []
+        self._devices = [
+            self._device("Virtual Input", 0, channels, 0, samplerate),
+            self._device("Virtual Output", 1, 0, channels, samplerate),
+        ]
+
+    # Public functions
+    def query_devices(self, rescan: bool = False) -> list[dict]:
+        with self._lock:
+            return [dict(device) for device in self._devices]
+
+    def add_device(self, name: str, inputs: int, outputs: int,
+                   samplerate: int = 44100) -> int:
+        """Plugs in another virtual device. Streams on it behave like
+        the default devices'.
+
+        Returns:
+            int: index of the new device
+        """
+        with self._lock:
+            index = max(device["index"] for device in self._devices) + 1
+            self._devices.append(
+                self._device(name, index, inputs, outputs, samplerate))
+        return index
+
+    def remove_device(self, name: str) -> None:
+        with self._lock:
+            self._devices = [device for device in self._devices
+                             if device["name"] != name]
+
+    def default_device(self) -> tuple[int, int]:
+        return 0, 1
+
+    def output_stream(self, **kwargs) -> _VirtualStream:
+        return _VirtualStream(self, "output", **kwargs)
+
+    def input_stream(self, **kwargs) -> _VirtualStream:
+        return _VirtualStream(self, "input", **kwargs)
+
+    def duplex_stream(self, **kwargs) -> _VirtualStream:
+        return _VirtualStream(self, "duplex", **kwargs)
+
+    def advance(self, seconds: float) -> None:
+        """Moves the simulated clock forward, running every started stream
+        until it has caught up. Only used with speed=None. Blocks run in
+        time order across streams, outputs before inputs at equal times.
+        """
+        target = self.time + seconds
+        while True:
+            with self._lock:
+                behind = [stream for stream in self._streams
+                          if stream.active and stream.time < target]
+            if not behind:
+                break
+            min(behind, key=lambda s: (s.time, s.kind == "input"))._tick()
+        self.time = target
+
+    # Private functions
+    def _device(self, name, index, inputs, outputs, samplerate) -> dict:
+        return {
+            "name": name,
+            "index": index,
+            "hostapi": 0,
+            "max_input_channels": inputs,
+            "max_output_channels": outputs,
+            "default_low_input_latency": self.latency,
+            "default_low_output_latency": self.latency,
+            "default_high_input_latency": self.latency * 10,
+            "default_high_output_latency": self.latency * 10,
+            "default_samplerate": float(samplerate),
+        }
+
+    def _attach(self, stream: _VirtualStream) -> None:
+        with self._lock:
+            self._streams.append(stream)
+        if self.speed is not None:
+            stream._thread = threading.Thread(target=self._run,
+                                              args=(stream,), daemon=True)
+            stream._thread.start()
+
+    def _detach(self, stream: _VirtualStream) -> None:
+        with self._lock:
+            if stream in self._streams:
+                self._streams.remove(stream)
+        thread = stream._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        stream._thread = None
+
+    def _run(self, stream: _VirtualStream) -> None:
+        """Drives one stream at speed times real time"""
+        start = time.perf_counter()
+        first_frame = stream.frames
+        status = None
+        while stream.active:
+            stream._tick(status)
+            self.time = max(self.time, stream.time)
+            status = None
+            if math.isinf(self.speed):
+                continue
+            due = (stream.frames - first_frame) / stream.samplerate
+            delay = start + due / self.speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif -delay > self.latency / self.speed:
+                # the buffer ran dry; the missed time is lost
+                status = _CallbackFlags(stream._input is not None,
+                                        stream._output is not None)
+                start = time.perf_counter() - due / self.speed
+
+    def _produce(self, block: np.ndarray, stream: _VirtualStream) -> None:
+        """Fills an input block from input_signal, looping it, plus what
+        the loopback has delivered
+        """
+        signal = self.input_signal
+        if signal is None or len(signal) == 0:
+            block.fill(0)
+        else:
+            if signal.ndim == 1:
+                signal = signal[:, np.newaxis]
+            index = (stream.frames + np.arange(block.shape[0])) % len(signal)
+            block[:] = signal[index][:, :block.shape[1]]
+        if self.loopback is not None:
+            index = self._loopback_index(stream, 0, block.shape[0])
+            channels = min(block.shape[1], self._loopback_buffer.shape[1])
+            block[:, :channels] += self._loopback_buffer[index, :channels]
+            self._loopback_buffer[index] = 0
+
+    def _consume(self, block: np.ndarray, stream: _VirtualStream) -> None:
+        if self.output_sink is not None:
+            self.output_sink(block.copy())
+        if self.loopback is not None:
+            index = self._loopback_index(stream, self.loopback,
+                                         block.shape[0])
+            channels = min(block.shape[1], self._loopback_buffer.shape[1])
+            self._loopback_buffer[index, :channels] += block[:, :channels]
+
+    def _loopback_index(self, stream, delay, frames) -> np.ndarray:
+        #   Ring indices of the frames a block covers, delay seconds later
+        first = int(round((stream.time + delay) * stream.samplerate))
+        return (first + np.arange(frames)) % len(self._loopback_buffer)
+
+
+# the backend in use, see AudioBackend()
+_backend = None
+# io_manager may create the backend on a background thread
+_backend_lock = threading.Lock()
+
+
+def AudioBackend() -> object:
+    """Factory function that produces the audio backend every stream and
+    device query goes through. Uses sounddevice unless the
+    AUDIO_BACKEND environment variable is "virtual" or PortAudio can't be
+    loaded, in which case a real time VirtualBackend is used.
+
+    Returns:
+        SoundDeviceBackend or VirtualBackend object
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = _create_backend()
+    return _backend
+
+
+def _create_backend() -> object:
+    if os.environ.get("AUDIO_BACKEND", "").lower() == "virtual":
+        return VirtualBackend()
+    try:
+        return SoundDeviceBackend()
+    except OSError as e:
+        print(f"Audio hardware unavailable ({e}). "
+              "Using the virtual audio backend")
+        return VirtualBackend()
+
+
+def set_audio_backend(backend) -> None:
+    """Replaces the audio backend, e.g. with VirtualBackend(speed=None) in
+    tests. Streams that are already open keep their backend.
+    """
+    global _backend
+    _backend = backend
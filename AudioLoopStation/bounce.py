@@ -0,0 +1,69 @@
+"""
+Bounces a saved loop to a wav file without starting the GUI or playing
+any audio. Run it from this directory, like controller.py:
+
+    python bounce.py my_loop my_loop.wav --repetitions 4 --reverse 2
+"""
+import argparse
+import time
+from dispatcher import Dispatcher
+from Utilities.SaveManager import SaveManager
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Render a saved loop to a wav file"
+        )
+    parser.add_argument("loop", help="name of a saved loop")
+    parser.add_argument("output", help="wav file to write")
+    parser.add_argument("-n", "--repetitions", type=int, default=1,
+                        help="times the loop repeats in the file")
+    parser.add_argument("--tempo", type=float, default=1,
+                        help="tempo relative to the recorded tempo")
+    parser.add_argument("--reverse", type=int, action="append", default=[],
+                        metavar="TRACK", help="play TRACK backwards")
+    parser.add_argument("--pitch", nargs=2, type=float, action="append",
+                        default=[], metavar=("TRACK", "SEMITONES"),
+                        help="shift TRACK by SEMITONES")
+    parser.add_argument("--float", action="store_true",
+                        help="write 32 bit float instead of 16 bit PCM")
+    args = parser.parse_args(argv)
+
+    if not SaveManager().has_loop(args.loop):
+        print(f"ERROR: Unable to find {args.loop}...")
+        return 1
+
+    dispatcher = Dispatcher()
+    try:
+        dispatcher.load_loop(args.loop)
+        for track_index in args.reverse:
+            dispatcher.change_effects(args.loop, track_index, 1, 0)
+        for track_index, semitones in args.pitch:
+            dispatcher.set_pitch(args.loop, int(track_index), semitones)
+        if args.tempo != 1:
+            # bounce the high quality stretch, not the preview
+            dispatcher.set_tempo_ratio(args.loop, args.tempo)
+            while True:
+                done, total = dispatcher.get_render_progress(args.loop)
+                if done == total:
+                    break
+                time.sleep(0.1)
+
+        start = time.perf_counter()
+        frames = dispatcher.bounce_loop(
+            args.loop,
+            args.output,
+            args.repetitions,
+            "FLOAT" if args.float else "PCM_16"
+            )
+        if frames < 0:
+            return 1
+        elapsed = time.perf_counter() - start
+        print(f"Wrote {frames} frames to {args.output} in {elapsed:.2f}s")
+        return 0
+    finally:
+        dispatcher.shutdown()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,8 +1,11 @@
+import time
+import threading
 from Utilities.SaveManager import SaveManager
 from view import View
 from dispatcher import Dispatcher
 import Loop_Constants.constants as constants
 from recorder import Recorder
+from io_manager import IO_manager
 
 
 class Controller:
@@ -12,9 +15,21 @@ class Controller:
     def __init__(self):
         # bpm is initially set to 100; the user can later modify it through gui
         self.bpm = 100
+        # probes the output's lowest stable latency in the background on
+        # the first launch with a device; cached afterwards. The mixer
+        # opens with the default latency until a result is cached
+        IO_manager().start_auto_tune()
         self.recorder = Recorder()  # Initialize the Recorder instance
+        # measures the round trip latency, see calibrateLatency
+        self._calibration = None
         self.saveManager = SaveManager()
         self.view = View(self)
+        # the device lists fill in the background. The refresh thread only
+        # sets this flag, tkinter is polled for it on its own thread
+        self._devicesChanged = threading.Event()
+        IO_manager().add_device_listener(self._devicesChanged.set)
+        self._showDevices()
+        self._pollDevices()
         self._dispatcher = Dispatcher(self)
         self._dispatcher.create_loop(constants.LOOP1)
         self._dispatcher.create_loop(constants.LOOP2)
@@ -24,6 +39,7 @@ class Controller:
         this function starts the mainloop of View
         '''
         self.view.main()
+        self._dispatcher.shutdown()
 
     def load_loop(self, gui_memory, gui_loop, loopName):
         '''
@@ -36,7 +52,7 @@ class Controller:
 
         # safety check. prevent further execution if name of the loop doesn't
         # match any of the existing loop names
-        if loopName not in self.saveManager.get_loop_options():
+        if not self.saveManager.has_loop(loopName):
             gui_memory.informFailedLoad()
             return
 
@@ -47,25 +63,57 @@ class Controller:
         # clean up GUI in case there are existing tracks
         gui_loop.removeAllTracksfromGui()
 
-        # update gui_loop original length
+        # update gui_loop original length; the loop plays at the current
+        # tempo, which becomes its reference for later tempo changes
         if tracksToAdd > 0:
             gui_loop.setOriginalLength(
                 self._dispatcher.get_loop_length(loopName)
                 )
+            gui_loop.setOriginalBeatsPerMinute(self.bpm)
 
         gui_loop.updateLoopName(loopName)
+        self.setLoopVolume(gui_loop, gui_loop.volumeScale.get())
 
         # controller is telling gui to adding track
         for _ in range(tracksToAdd):
             gui_loop.addTrackToGui()
 
+        # show the effects the tracks were saved with; shifts the pitch
+        # buttons can't show are left alone
+        effects = self._dispatcher.get_track_effects(loopName)
+        for trackNumber, (reverse, semitones) in enumerate(effects, 1):
+            if (reverse, semitones) == (0, 0) or \
+                    semitones not in constants.pitchSemitones:
+                continue
+            gui_track = gui_loop.trackCollection[trackNumber]
+            gui_track.pitch.set(constants.pitchSemitones.index(semitones))
+            gui_track.playbackDirection.set(reverse)
+
+        # overdubs recorded at another tempo are stretched in the
+        # background; report their progress
+        self._poll_render_progress(gui_loop, loopName)
+
+    def _poll_render_progress(self, gui_loop, loopName):
+        '''
+        this function shows background render progress of a loop on the gui
+        and reschedules itself until rendering is finished
+        '''
+        if gui_loop.loopName != loopName:
+            return
+
+        done, total = self._dispatcher.get_render_progress(loopName)
+        gui_loop.updateRenderProgress(done, total)
+        if done < total:
+            self.view.after(250, self._poll_render_progress, gui_loop,
+                            loopName)
+
     def create_loop(self, gui_memory, gui_loop, loopName):
         '''
         this function creates a new loop
         '''
         # safety check. prevent further execution if name matches
         # any of the existing loop names
-        if loopName in self.saveManager.get_loop_options():
+        if self.saveManager.has_loop(loopName):
             gui_memory.informFailedSave()
             return
 
@@ -74,6 +122,7 @@ class Controller:
 
         # update loopName of GuiLoop object
         gui_loop.updateLoopName(loopName)
+        self.setLoopVolume(gui_loop, gui_loop.volumeScale.get())
 
         # update state of gui_memory
         gui_memory.create()
@@ -82,6 +131,7 @@ class Controller:
         '''
         this function discards loop
         '''
+        self._dispatcher.cancel_render(loopName)
         gui_memory.discard()
         gui_loop.removeAllTracksfromGui()
 
@@ -95,14 +145,18 @@ class Controller:
     def record(self, gui_loop, loopName: str):
         '''
         Handles recording functionality, including starting/stopping recording,
-        managing multiple recordings, and updating GUI state.
+        managing multiple recordings, and updating GUI state. Every channel
+        in constants.recordInputChannels is recorded into its own track.
 
         On the first call, it starts the recording process. On the second call,
-        it stops the recording, processes the audio, adds it as a track,
-        and updates the loop's original length and bpm if it's the first track.
-        For subsequent tracks, if the recording length exceeds the original
-        loop length, it trims the recording to keep only the portion that
-        goes past the original length.
+        it stops the recording, adds it as a track, and updates the loop's
+        original length and bpm if it's the first track.
+        Recordings made while the loop plays are quantized on the audio
+        transport clock: they start and stop on the next bar or loop
+        boundary (see constants.recordQuantize), compensated for the round
+        trip latency, so a take is exactly N bars however late the clicks
+        are handled. A first take with nothing playing starts at once and
+        stops on its next bar, so the loop is a whole number of bars.
 
         :param gui_loop: The GUI loop object representing the current loop in
         the interface.
@@ -111,78 +165,84 @@ class Controller:
         '''
 
         if gui_loop.recordBtn['text'] == "Record":
-            # First click: start recording
-            # Initiate recording of a loop
-            self.recorder.start_recording()
+            if self._calibration is not None and \
+                    self._calibration.is_alive():
+                print("Wait for the latency calibration to finish")
+                return
+            # First click: arm recording; against a playing loop it starts
+            # on the next boundary
+            self.recorder.start_recording(
+                loop=self._dispatcher.get_loop(loopName),
+                quantum=self._quantum_frames(),
+                input_channels=constants.recordInputChannels
+            )
+            if not self.recorder.is_recording:
+                return
 
             # Update GUI to indicate ongoing recording
             gui_loop.updateRecordBtnState(new_text="Recording")
 
         elif gui_loop.recordBtn['text'] == "Recording":
-            # Second click: stop recording
-            # Stop the recording and save the audio file
-            recorded_file = self.recorder.stop_recording(
-                file_name_prefix="recording"
-            )
-            if not recorded_file:
+            # Second click: punch out on the next boundary
+            self.recorder.punch_out()
+            gui_loop.updateRecordBtnState(new_text="Stopping")
+            # the boundary is due after the remaining frames; a take that
+            # stops getting audio is finished a second after that
+            deadline = time.monotonic() + 1 + \
+                self.recorder.frames_to_punch_out() / \
+                self.recorder.sample_rate
+            self._finish_recording(gui_loop, loopName, deadline)
+
+    def _finish_recording(self, gui_loop, loopName, deadline):
+        '''
+        this function waits until the take reaches its punch out boundary,
+        then saves it and adds it as a track. it reschedules itself so the
+        gui keeps running meanwhile, until the deadline; past it the take
+        is saved up to its last complete boundary
+        '''
+        if not self.recorder.is_take_complete():
+            if time.monotonic() < deadline:
+                self.view.after(10, self._finish_recording, gui_loop,
+                                loopName, deadline)
                 return
+            print("Recording stopped receiving audio before its punch "
+                  "out. Keeping it up to its last boundary")
+
+        # Stop the recording, the audio files are already saved
+        self.recorder.stop_recording(file_name_prefix="recording")
+        recorded_files = [path for path in self.recorder.last_recordings
+                          if path is not None]
+        if not recorded_files:
+            gui_loop.updateRecordBtnState(new_text="Record")
+            return
 
-            # Add the processed track to the loop
+        # Add the processed tracks to the loop, one per input channel
+        for recorded_file in recorded_files:
             self._dispatcher.add_track(loopName, recorded_file)
 
-            # Process the recording
-            if gui_loop.originalLoopLength == -1:  # First track
-                gui_loop.setOriginalLength(
-                    self._dispatcher.get_loop_length(loopName)
-                    )
-            else:  # Not the first track
-                # Trim the recording to match the original length criteria
-                original_length = gui_loop.originalLoopLength * 1000
-                # Convert to ms
-                recorded_file = self._trim_to_remainder(
-                    recorded_file, original_length
+        # Process the recording. The first take sets the loop's length and
+        # the tempo later tempo changes are measured from; overdubs keep
+        # both and are stretched from the tempo they were recorded at
+        if gui_loop.originalLoopLength == -1:  # First track
+            gui_loop.setOriginalLength(
+                self._dispatcher.get_loop_length(loopName)
                 )
-
-            # Update GUI loop's bpm
             gui_loop.setOriginalBeatsPerMinute(self.bpm)
 
-            # Update the GUI to reset the button state and show the new track
-            gui_loop.updateRecordBtnState(new_text="Record")
+        # Update the GUI to reset the button state and show the new tracks
+        gui_loop.updateRecordBtnState(new_text="Record")
+        for _ in recorded_files:
             gui_loop.addTrackToGui()
 
-    def _trim_to_remainder(self, file_path, original_length):
+    def _quantum_frames(self):
         '''
-        Trims the recorded audio file to keep only the remainder segment
-        that extends past the "original length".
-
-        :param file_path: Path to the recorded audio file.
-        :param original_length: Original loop length in milliseconds.
-        :return: Path to the trimmed audio file.
+        this function returns the frames between the boundaries a recording
+        snaps to: a bar at the current tempo, or None for whole loops
         '''
-        from pydub import AudioSegment
-
-        # Load the audio file
-        audio = AudioSegment.from_file(file_path)
-
-        # Calculate the segment to keep
-        audio_length = len(audio)  # Length in ms
-        if audio_length <= original_length:
-            print(
-                "Recording is within the original length, no trimming needed.")
-            return file_path
-
-        # Calculate the start of the segment to keep
-        start_trim = audio_length % original_length
-
-        # Trim the audio
-        trimmed_audio = audio[start_trim:]
-
-        # Save the trimmed audio to a new file
-        trimmed_file_path = file_path.replace(".wav", "_trimmed.wav")
-        trimmed_audio.export(trimmed_file_path, format="wav")
-        print(f"Trimmed audio saved to {trimmed_file_path}")
-
-        return trimmed_file_path
+        if constants.recordQuantize != "bar":
+            return None
+        return int(round(60 / self.bpm * constants.beatsPerBar *
+                         self.recorder.sample_rate))
 
     def playTrack(self, gui_track, gui_loop):
         '''
@@ -207,6 +267,13 @@ class Controller:
         # call to dispatcher to start playing the loop
         self._dispatcher.play_loop(loopName)
 
+    def getLoopPosition(self, loopName: str):
+        '''
+        this function returns the playback position of a loop in milliseconds
+        as kept by the audio engine; -1 when the loop is not playing
+        '''
+        return self._dispatcher.get_loop_position(loopName)
+
     def changePlaybackDirectionAndPitch(self, gui_track, gui_loop):
         '''
         this function changes the playback direction and pitch for a track
@@ -244,13 +311,122 @@ class Controller:
         gui_loop.stopAllTracks()
         self._dispatcher.stop_loop(loopName)
 
+    def setLoopVolume(self, gui_loop, volume):
+        '''
+        this function sets the level of a loop; the mixer ramps to it so the
+        volume scale can move while the loop plays
+        '''
+        self._dispatcher.set_loop_gain(gui_loop.loopName,
+                                       float(volume) / constants.volumeUnity)
+
+    def setMasterVolume(self, volume):
+        '''
+        this function sets the level of everything that plays
+        '''
+        self._dispatcher.set_master_gain(float(volume) / constants.volumeUnity)
+
+    def setMonitorVolume(self, volume):
+        '''
+        this function sets how loud the live input is heard while playing
+        and recording; 0 turns monitoring off
+        '''
+        self._dispatcher.set_monitoring(
+            float(volume) / constants.volumeUnity,
+            max(constants.recordInputChannels) + 1
+            )
+
+    def calibrateLatency(self):
+        '''
+        this function measures the round trip latency takes are compensated
+        by and saves it for the selected devices. the output has to be
+        connected to the input meanwhile. it runs in the background so the
+        gui keeps running
+        '''
+        if self.recorder.is_recording:
+            print("Stop recording before calibrating the latency")
+            return
+        if self._calibration is not None and self._calibration.is_alive():
+            return
+        self._calibration = threading.Thread(
+            target=self.recorder.calibrate_latency, daemon=True)
+        self._calibration.start()
+
+    def refreshDevices(self):
+        '''
+        this function looks for audio devices plugged in or removed, in the
+        background; the device menus are updated once it is done
+        '''
+        IO_manager().refresh()
+
+    def selectInput(self, name):
+        '''
+        this function selects the input recordings are made from
+        '''
+        if self.recorder.is_recording:
+            print("Stop recording before changing the input")
+            self._showDevices()
+            return
+        IO_manager().select_input(name)
+        self.recorder.load_latency()
+
+    def selectOutput(self, name):
+        '''
+        this function selects the output; it is used the next time the
+        output opens
+        '''
+        if self.recorder.is_recording:
+            print("Stop recording before changing the output")
+            self._showDevices()
+            return
+        IO_manager().select_output(name)
+        self.recorder.load_latency()
+
+    def _pollDevices(self):
+        '''
+        this function updates the device menus when the device lists
+        changed, and reschedules itself for as long as the gui runs
+        '''
+        if self._devicesChanged.is_set():
+            self._devicesChanged.clear()
+            self._showDevices()
+        self.view.after(250, self._pollDevices)
+
+    def _showDevices(self):
+        '''
+        this function shows the known devices in the device menus and
+        loads the latency calibrated for the selected ones. it doesn't
+        wait for devices that are still being listed
+        '''
+        inputs = [device['name'] for device in IO_manager().get_inputs()]
+        outputs = [device['name'] for device in IO_manager().get_outputs()]
+        selectedInput = selectedOutput = ""
+        if inputs or outputs:
+            selectedInput = IO_manager().get_selected_input().get('name', "")
+            selectedOutput = \
+                IO_manager().get_selected_output().get('name', "")
+            # the selection may have changed with the devices
+            self.recorder.load_latency()
+        self.view.rhythm.updateDevices(inputs, outputs, selectedInput,
+                                       selectedOutput)
+
     def update_bpm(self, currGuiBeatsPerMinute):
         '''
-        as of 3Dec24 this function is not functional
+        this function changes the tempo; every loaded loop is time stretched
+        from the tempo it was recorded or loaded at to the new tempo
         '''
 
         self.bpm = currGuiBeatsPerMinute
 
+        for gui_loop in (self.view.loop1, self.view.loop2):
+            if gui_loop.loopName == "" or gui_loop.originalLoopLength == -1:
+                continue
+            self._dispatcher.set_tempo_ratio(
+                gui_loop.loopName,
+                self.bpm / gui_loop.originalBeatsPerMinute
+                )
+            gui_loop.updateBeatsPerMinute(self.bpm)
+            self._poll_render_progress(gui_loop, gui_loop.loopName)
+
 
 if __name__ == '__main__':
     app = Controller()
@@ -1,6 +1,10 @@
+import os
 import re
+import soundfile
 from loop import LoopChannel as Loop
 from Utilities.SaveManager import SaveManager
+from render_service import RenderService
+from mixer import Mixer
 
 
 class Dispatcher:
@@ -8,12 +12,13 @@ class Dispatcher:
     The role of the dispatcher class is manage Audio LoopChannels loaded into
     the application
     '''
-    def __init__(self, controller=None):
+    def __init__(self, controller=None, save_manager: SaveManager = None):
         self.controller = controller
         self._loops = {}
         self._PLAYING_STRING = "playing"
         self._LOOP_STRING = "loop"
-        self._save_manager = SaveManager()
+        self._save_manager = save_manager or SaveManager()
+        self._render_service = RenderService()
 
     def load_loop(self, name: str) -> int:
         '''
@@ -28,21 +33,127 @@ class Dispatcher:
             return -1
 
         loaded_save_obj = self._save_manager.load("loop", name)
+        if name in self._loops:
+            self._loops[name][self._LOOP_STRING].release()
         self._loops[name] = {}
         self._loops[name][self._PLAYING_STRING] = False
         self._loops[name][self._LOOP_STRING] = Loop(
             name
             )
 
-        # load tracks into loaded loop
+        # load tracks into loaded loop with the effect state they were
+        # saved with, skipping files that are gone
         trackCount = 0
-        for path in loaded_save_obj["tracks"]:
-            self.add_track(name, path)
+        for entry in self._save_manager.track_entries(loaded_save_obj):
+            entry = self._check_track(entry)
+            if entry is None:
+                continue
+            self.add_track(name, entry["path"], entry.get("reference_tempo"))
             print("Dispatcher: after self.add_track(name, path)")
+            self._loops[name][self._LOOP_STRING].tracks[-1].apply_data(entry)
             trackCount += 1
 
+        # overdubs recorded at another tempo are stretched to the loop's
+        loop = self._loops[name][self._LOOP_STRING]
+        if any(track.reference_tempo != 1 for track in loop.tracks):
+            self.set_tempo_ratio(name, 1)
+
         return trackCount
 
+    def _check_track(self, entry: dict) -> dict:
+        """Checks a saved track against its file before it is decoded: the
+        header against the format the track was saved with, then the size
+        and modification time against the saved ones. Nothing is read past
+        the header, so loading stays quick however long the tracks are. A
+        changed file is still loaded, with its effect state but without the
+        saved peaks, which no longer describe it.
+
+        Args:
+            entry (dict): track entry of a saved loop, see
+                SaveManager.track_entries
+
+        Returns:
+            dict: the entry to restore the track from, None if the file is
+            missing or unreadable
+        """
+        path = entry["path"]
+        try:
+            info = soundfile.info(path)
+            stat = os.stat(path)
+        except (RuntimeError, TypeError, OSError):
+            print(f"ERROR: Unable to load track {path}. File not found...")
+            return None
+        changed = "frames" in entry and (
+            (info.samplerate, info.frames, info.channels) !=
+            (entry["sample_rate"], entry["frames"], entry["channels"]))
+        if not changed and "size" in entry:
+            changed = (stat.st_size, stat.st_mtime_ns) != (
+                entry["size"], entry["mtime_ns"])
+        if changed:
+            print(f"WARNING: {path} changed since the loop was saved")
+            entry = {key: value for key, value in entry.items()
+                     if key != "peaks"}
+        return entry
+
+    def set_tempo_ratio(self, name: str, ratio: float) -> None:
+        """Time stretches every track of a loop to ratio times its recorded
+        tempo. A quick preview stretch plays from the next loop boundary
+        while high quality stretches render in the background and replace
+        it when they are done.
+
+        Args:
+            name (str): name of loop
+            ratio (float): new tempo / recorded tempo
+        """
+        if name not in self._loops:
+            print(f"ERROR: Unable to find {name}...")
+            return
+        if ratio <= 0:
+            print("Invalid tempo ratio. Needs to be positive")
+            return
+
+        jobs = self._loops[name][self._LOOP_STRING].set_tempo_ratio(ratio)
+        # tracks with the same content share one render and cache key
+        unique_jobs = {}
+        tracks_by_key = {}
+        for job, track in jobs:
+            unique_jobs.setdefault(job[0], job)
+            tracks_by_key.setdefault(job[0], []).append(track)
+
+        def apply_render(key):
+            for track in tracks_by_key[key]:
+                track.apply_stretch_render(key)
+
+        self._render_service.submit(
+            name,
+            list(unique_jobs.values()),
+            on_done=apply_render
+            )
+
+    def get_render_progress(self, name: str) -> tuple[int, int]:
+        """Returns progress of the background tempo renders of a loop
+
+        Args:
+            name (str): name of loop
+
+        Returns:
+            tuple[int, int]: (finished renders, total renders)
+        """
+        return self._render_service.progress(name)
+
+    def cancel_render(self, name: str) -> None:
+        """Cancels pending background tempo renders of a loop. Tracks
+        keep playing their preview renders instead.
+
+        Args:
+            name (str): name of loop
+        """
+        self._render_service.cancel(name)
+
+    def shutdown(self) -> None:
+        """Stops background work owned by the dispatcher"""
+        self._render_service.shutdown()
+
     def create_loop(self, name: str) -> None:
         """Saves audio loop using SaveManager
 
@@ -66,6 +177,42 @@ class Dispatcher:
             "loop", self._loops[name][self._LOOP_STRING].get_data()
             )
 
+    def bounce_loop(
+            self,
+            name: str,
+            path: str,
+            repetitions: int = 1,
+            subtype: str = "PCM_16"
+            ) -> int:
+        """Renders a loaded loop to a wav file faster than real time, with
+        every active track in its current reverse, pitch, tempo, effect and
+        gain state. Playback is not affected.
+
+        Args:
+            name (str): Name of loaded audio loop
+            path (str): wav file to write
+            repetitions (int): how many times the loop repeats in the file
+            subtype (str): soundfile subtype, "PCM_16" or "FLOAT"
+
+        Returns:
+            int: number of frames written, -1 on error
+        """
+        if name not in self._loops:
+            print(f"ERROR: Unable to bounce {name}. Load loop first...")
+            return -1
+        if repetitions < 1:
+            print("Invalid repetitions. Need at least 1")
+            return -1
+        loop = self._loops[name][self._LOOP_STRING]
+        if loop.frames is None:
+            print(f"ERROR: Unable to bounce {name}. Loop has no tracks...")
+            return -1
+        try:
+            return loop.bounce(path, repetitions, subtype)
+        except (OSError, RuntimeError, ValueError) as e:
+            print(f"ERROR: Unable to write {path}: {e}")
+            return -1
+
     def play_loop(self, name: str) -> None:
         """Plays audio loop.
 
@@ -125,14 +272,14 @@ class Dispatcher:
             return
         self._loops[loop_name][self._LOOP_STRING].stop_track(track_index)
 
-    def add_track(self, name: str, path: str):
+    def add_track(self, name: str, path: str, reference_tempo: float = None):
         if name not in self._loops:
             print(
                 f"ERROR: Unable to add track into {name}. \
                     Loop does not exists..."
                 )
             return
-        self._loops[name][self._LOOP_STRING].add_track(path)
+        self._loops[name][self._LOOP_STRING].add_track(path, reference_tempo)
 
     def delete_track(self, name: str, track_num: int):
         if name not in self._loops:
@@ -218,6 +365,39 @@ class Dispatcher:
             loop_list.append(key)
         return loop_list
 
+    def get_loop(self, loop_name: str) -> Loop:
+        """Returns a loaded loop, e.g. as the key the mixer plays it under
+        for recording against its transport
+
+        Args:
+            loop_name (str): Name of loaded audio loop
+
+        Returns:
+            LoopChannel: the loop. None if no loop found
+        """
+        if loop_name not in self._loops:
+            return None
+        return self._loops[loop_name][self._LOOP_STRING]
+
+    def get_track_effects(self, loop_name: str) -> list[tuple[int, float]]:
+        """Returns the effect state of every track of a loaded loop, e.g.
+        to show the state a loop was saved with
+
+        Args:
+            loop_name (str): Name of loaded audio loop
+
+        Returns:
+            list[tuple[int, float]]: (reverse, pitch in semitones) per
+            track, None for deleted tracks
+        """
+        if loop_name not in self._loops:
+            print(f"ERROR: Unable to find {loop_name}...")
+            return []
+        return [
+            (track.reverse, track.pitch) if track is not None else None
+            for track in self._loops[loop_name][self._LOOP_STRING].tracks
+        ]
+
     def get_loop_length(self, loop_name: str) -> int:
         """Returns loop length
 
@@ -232,6 +412,22 @@ class Dispatcher:
             return -1
         return self._loops[loop_name][self._LOOP_STRING].length
 
+    def get_loop_position(self, loop_name: str) -> float:
+        """Returns the playback position of a loop, read from the audio
+        transport
+
+        Args:
+            loop_name (str): Name of loaded audio loop
+
+        Returns:
+            float: position in milliseconds. -1 if the loop isn't loaded or
+            isn't playing
+        """
+        if loop_name not in self._loops:
+            return -1
+        position = self._loops[loop_name][self._LOOP_STRING].get_position()
+        return -1 if position is None else position
+
     def change_effects(
             self,
             loop_name: str,
@@ -245,7 +441,8 @@ class Dispatcher:
             loop_name (str): Name of loaded audio lop
             track_index (int): Index of track within an audio loop [1...n]
             reverse (int): 0 -> not reversed, 1 -> reversed
-            pitch (int): 0 -> no shift, 1 -> upshift, 2 -> downshift
+            pitch (int): 0 -> no shift, 1 -> downshift, 2 -> upshift, see
+                constants.pitchSemitones
         """
         if loop_name not in self._loops:
             print("ERROR: Unable to find {name}...")
@@ -271,6 +468,241 @@ class Dispatcher:
             track_index
             )
 
+    def set_pitch(
+            self,
+            loop_name: str,
+            track_index: int,
+            semitones: float,
+            cents: float = 0
+            ):
+        """Shifts the pitch of an audio track by any amount. The shift is
+        applied live by the mixer and glides while the track plays.
+
+        Args:
+            loop_name (str): Name of loaded audio loop
+            track_index (int): Index of track within an audio loop [1...n]
+            semitones (float): shift in semitones [-24, 24]
+            cents (float): additional shift in cents
+        """
+        if loop_name not in self._loops:
+            print(f"ERROR: Unable to find {loop_name}...")
+            return
+        if (
+            track_index <= 0 or
+            track_index > len(self.list_tracks(loop_name))
+        ):
+            print("Track index is out of valid range")
+            return
+        if abs(semitones + cents / 100) > 24:
+            print("Invalid pitch shift. Semitones [-24, 24]")
+            return
+
+        self._loops[loop_name][self._LOOP_STRING].set_pitch(
+            track_index,
+            semitones,
+            cents
+            )
+
+    def set_loop_gain(self, loop_name: str, gain: float) -> None:
+        """Sets the level of a loop. Applied live by the mixer with a short
+        ramp, so it can move while the loop plays.
+
+        Args:
+            loop_name (str): Name of loaded audio loop
+            gain (float): linear gain [0, 4], 1 is unchanged
+        """
+        if loop_name not in self._loops:
+            print(f"ERROR: Unable to find {loop_name}...")
+            return
+        if not 0 <= gain <= 4:
+            print("Invalid gain. Gain [0, 4]")
+            return
+        self._loops[loop_name][self._LOOP_STRING].set_gain(gain)
+
+    def set_track_gain(
+            self,
+            loop_name: str,
+            track_index: int,
+            gain: float
+            ) -> None:
+        """Sets the level of one track of a loop.
+
+        Args:
+            loop_name (str): Name of loaded audio loop
+            track_index (int): Index of track within an audio loop [1...n]
+            gain (float): linear gain [0, 4], 1 is unchanged
+        """
+        if track_index is None or not self._is_valid_target(loop_name,
+                                                             track_index):
+            return
+        if not 0 <= gain <= 4:
+            print("Invalid gain. Gain [0, 4]")
+            return
+        self._loops[loop_name][self._LOOP_STRING].set_track_gain(
+            track_index,
+            gain
+            )
+
+    def set_master_gain(self, gain: float) -> None:
+        """Sets the level of everything the mixer plays.
+
+        Args:
+            gain (float): linear gain [0, 4], 1 is unchanged
+        """
+        if not 0 <= gain <= 4:
+            print("Invalid gain. Gain [0, 4]")
+            return
+        Mixer().set_master_gain(gain)
+
+    def set_monitoring(self, gain: float, input_channels: int = 1) -> None:
+        """Lets the player hear the live input through the mixer. Above 0
+        the output runs as a full duplex stream at the devices' low
+        latency; 0 goes back to an output only stream.
+
+        Args:
+            gain (float): linear monitor gain [0, 4], 0 turns it off
+            input_channels (int): input channels the stream reads
+        """
+        if not 0 <= gain <= 4:
+            print("Invalid gain. Gain [0, 4]")
+            return
+        Mixer().set_monitoring(gain > 0, gain, input_channels)
+
+    def add_effect(
+            self,
+            loop_name: str,
+            effect_type: str,
+            track_index: int = None,
+            **params
+            ) -> int:
+        """Adds a live effect to a loop or to one of its tracks. Effects run
+        in the mixer in the order they were added, while the loop plays.
+
+        Args:
+            loop_name (str): Name of loaded audio loop
+            effect_type (str): "eq", "delay" or "reverb", see
+                effects.EFFECT_TYPES
+            track_index (int): Index of track within an audio loop [1...n],
+                None to apply the effect to the whole loop
+            **params: effect parameters, e.g. kind="lowshelf", gain_db=6
+
+        Returns:
+            int: position of the effect in its chain, -1 on error
+        """
+        if not self._is_valid_target(loop_name, track_index):
+            return -1
+        try:
+            return self._loops[loop_name][self._LOOP_STRING].add_effect(
+                effect_type,
+                track_index,
+                **params
+                )
+        except ValueError as e:
+            print(f"ERROR: {e}")
+            return -1
+
+    def set_effect_params(
+            self,
+            loop_name: str,
+            position: int,
+            track_index: int = None,
+            **params
+            ) -> None:
+        """Changes parameters of a live effect while it plays.
+
+        Args:
+            loop_name (str): Name of loaded audio loop
+            position (int): position of the effect in its chain [0...n-1]
+            track_index (int): Index of track, None for the loop's chain
+            **params: parameters to change
+        """
+        if not self._is_valid_target(loop_name, track_index, position):
+            return
+        try:
+            self._loops[loop_name][self._LOOP_STRING].set_effect_params(
+                position,
+                track_index,
+                **params
+                )
+        except ValueError as e:
+            print(f"ERROR: {e}")
+
+    def remove_effect(
+            self,
+            loop_name: str,
+            position: int,
+            track_index: int = None
+            ) -> None:
+        """Removes a live effect from a loop or track chain.
+
+        Args:
+            loop_name (str): Name of loaded audio loop
+            position (int): position of the effect in its chain [0...n-1]
+            track_index (int): Index of track, None for the loop's chain
+        """
+        if not self._is_valid_target(loop_name, track_index, position):
+            return
+        self._loops[loop_name][self._LOOP_STRING].remove_effect(
+            position,
+            track_index
+            )
+
+    def list_effects(self, loop_name: str, track_index: int = None) -> list:
+        """Lists the live effects of a loop or track chain.
+
+        Returns:
+            list: (effect type, parameter dict) in processing order
+        """
+        if not self._is_valid_target(loop_name, track_index):
+            return []
+        return self._loops[loop_name][self._LOOP_STRING].list_effects(
+            track_index
+            )
+
+    def get_effect_costs(self, loop_name: str) -> dict:
+        """Returns how long live effects take per mixer block.
+
+        Args:
+            loop_name (str): Name of loaded audio loop
+
+        Returns:
+            dict: dict with the following keys:
+
+            ``'loop'``
+                (name, last, peak) seconds per block for each effect of
+                the loop's chain.
+            ``'tracks'``
+                The same list for each track, None for deleted tracks.
+        """
+        if loop_name not in self._loops:
+            print(f"ERROR: Unable to find {loop_name}...")
+            return {}
+        return self._loops[loop_name][self._LOOP_STRING].get_effect_costs()
+
+    def _is_valid_target(
+            self,
+            loop_name: str,
+            track_index: int,
+            position: int = None
+            ) -> bool:
+        if loop_name not in self._loops:
+            print(f"ERROR: Unable to find {loop_name}...")
+            return False
+        loop = self._loops[loop_name][self._LOOP_STRING]
+        if track_index is not None and (
+            track_index <= 0 or
+            track_index > len(loop.tracks) or
+            loop.tracks[track_index - 1] is None
+        ):
+            print("Track index is out of valid range")
+            return False
+        if position is not None and not (
+            0 <= position < len(loop.list_effects(track_index))
+        ):
+            print("Effect position is out of valid range")
+            return False
+        return True
+
 
 if __name__ == "__main__":
     import Loop_Constants.constants as constants
@@ -1,23 +1,741 @@
-class Effects:
-    def pitch_shift_up(self, file):
-        pass
+import time
+import numpy as np
 
-    def time_stretch(self, file):
-        pass
 
-    def reverse(self, track):
+class Effect:
+    '''
+    Base class of the live effects run by the mixer.
+
+    process() changes a float32 block shaped (frames, channels) in place.
+    Blocks can have any size and all state is allocated up front, so an
+    effect can run inside the audio callback. The time spent is kept in
+    last_cost and peak_cost (seconds per process() call). Subclasses
+    implement _process(), get_params() and set_params().
+    '''
+    # key of the effect in EFFECT_TYPES
+    name = "effect"
+    # frames the output lags the input by, the mixer reads the voice of
+    # the effect that far ahead so it stays aligned with the loop
+    latency = 0
+
+    def __init__(self):
+        self.bypass = False
+        self.last_cost = 0.0
+        self.peak_cost = 0.0
+
+    def process(self, block: np.ndarray):
+        start = time.perf_counter()
+        if not self.bypass:
+            self._process(block)
+        self.last_cost = time.perf_counter() - start
+        if self.last_cost > self.peak_cost:
+            self.peak_cost = self.last_cost
+
+    def reset(self):
+        #   Clears the signal history, e.g. when a voice restarts
         pass
 
+    def get_params(self) -> dict:
+        return {}
+
+    def set_params(self, **params):
+        #   Raises ValueError for unknown parameters
+        for name in params:
+            raise ValueError(f"{self.name} has no parameter {name}")
+
+    def _process(self, block: np.ndarray):
+        raise NotImplementedError
+
+
+class PitchShifter(Effect):
+    '''
+    Streaming phase vocoder pitch shift for the mixer.
+
+    Blocks of any size go through process() and are shifted in place. Every
+    frame_size window is split into regions around its spectral peaks and
+    each region is moved as a whole to where its peak lands at the pitch
+    ratio, keeping the phases of the bins around a peak locked to it, and
+    resynthesised hop by hop. This keeps the level of a shifted tone the
+    same at any ratio, and the shift works on a playing loop without any
+    precomputed files. Changing the shift glides to the new ratio instead
+    of jumping.
+
+    Output is delayed by frame_size samples. Work per block is at
+    most ceil(block / hop) FFT frames, into buffers allocated up front.
+    '''
+    name = "pitch"
+
+    def __init__(
+            self,
+            channels: int,
+            sample_rate: int,
+            frame_size: int = 2048,
+            oversampling: int = 4,
+            glide_time: float = 0.05
+            ):
+        super().__init__()
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.frame_size = frame_size
+        self.oversampling = oversampling
+        self.hop = frame_size // oversampling
+        self.glide_time = glide_time
+
+        bins = frame_size // 2 + 1
+        self._index = np.arange(bins)
+        self._bins = self._index.astype(np.float64)
+        # phase advance of each bin over one hop for a stationary sinusoid
+        self._expected = self._bins * 2 * np.pi / oversampling
+        self._window = np.hanning(frame_size)
+        # the window again for the overlap-add, scaled by the overlap of
+        # the squared hann window with this oversampling
+        self._synthesis = self._window / (np.sum(self._window ** 2)
+                                          / self.hop)
+        self._glide = 1 - np.exp(-self.hop / (sample_rate * glide_time))
+        # flat index offsets per channel. Shifted bins go to a spectrum
+        # with one extra bin at the end that takes whatever leaves it
+        self._channel_offset = (np.arange(channels) * bins)[:, np.newaxis]
+        self._shifted_offset = \
+            (np.arange(channels) * (bins + 1))[:, np.newaxis]
+        self._discard = np.broadcast_to(self._shifted_offset + bins,
+                                        (channels, bins))
+
+        shape = (channels, bins)
+        self._windowed = np.zeros((channels, frame_size))
+        self._frame = np.zeros((channels, frame_size))
+        self._spectrum = np.zeros(shape, dtype=np.complex128)
+        self._shifted = np.zeros((channels, bins + 1), dtype=np.complex128)
+        self._magnitude = np.zeros(shape)
+        self._phase = np.zeros(shape)
+        self._frequency = np.zeros(shape)
+        self._peak_frequency = np.zeros(shape)
+        self._peak_phase = np.zeros(shape)
+        self._out_phase = np.zeros(shape)
+        self._is_peak = np.zeros(shape, dtype=bool)
+        self._closer = np.zeros(shape, dtype=bool)
+        self._below = np.zeros(shape, dtype=np.intp)
+        self._above = np.zeros(shape, dtype=np.intp)
+        self._owner = np.zeros(shape, dtype=np.intp)
+        self._target = np.zeros(shape, dtype=np.intp)
+        self._peak_target = np.zeros(shape, dtype=np.intp)
+
+        self._ratio = 1.0
+        self._target_ratio = 1.0
+        self.reset()
+
+    def reset(self):
+        #   Clears the signal history, e.g. when a voice restarts. A pending
+        #   glide jumps to its target
+        self._ratio = self._target_ratio
+        bins = self._bins.size
+        self._input = np.zeros((self.channels, self.frame_size))
+        self._output = np.zeros((self.channels, self.frame_size))
+        self._ready = np.zeros((self.channels, self.hop), dtype=np.float32)
+        self._last_phase = np.zeros((self.channels, bins))
+        # synthesis phase of every shifted bin, the extra one is discarded
+        self._sum_phase = np.zeros((self.channels, bins + 1))
+        self._pending = 0
+
+    def set_semitones(self, semitones: float, cents: float = 0,
+                      glide: bool = True):
+        #   Sets the shift, e.g. set_semitones(-12) or set_semitones(0, 30)
+        self._target_ratio = 2 ** ((semitones + cents / 100) / 12)
+        if not glide:
+            self._ratio = self._target_ratio
+
+    def get_ratio(self) -> float:
+        return self._target_ratio
+
+    @property
+    def latency(self) -> int:
+        return 0 if self.bypass else self.frame_size
+
+    def get_params(self) -> dict:
+        return {"semitones": round(12 * np.log2(self._target_ratio), 6)}
+
+    def set_params(self, semitones: float = None, cents: float = 0,
+                   **params):
+        super().set_params(**params)
+        if semitones is not None:
+            self.set_semitones(semitones, cents)
+
+    def _process(self, block: np.ndarray):
+        #   Shifts a float32 block shaped (frames, channels) in place
+        frames = block.shape[0]
+        hop_start = self.frame_size - self.hop
+        i = 0
+        while i < frames:
+            n = min(frames - i, self.hop - self._pending)
+            position = hop_start + self._pending
+            self._input[:, position:position + n] = block[i:i + n].T
+            block[i:i + n] = \
+                self._ready[:, self._pending:self._pending + n].T
+            self._pending += n
+            i += n
+            if self._pending == self.hop:
+                self._process_frame()
+                self._pending = 0
+
+    def _process_frame(self):
+        self._ratio += (self._target_ratio - self._ratio) * self._glide
+        ratio = self._ratio
+        bins = self._bins.size
+        spectrum, magnitude = self._spectrum, self._magnitude
+        phase, frequency = self._phase, self._frequency
+
+        np.multiply(self._input, self._window, out=self._windowed)
+        np.fft.rfft(self._windowed, axis=1, out=spectrum)
+        np.abs(spectrum, out=magnitude)
+        np.arctan2(spectrum.imag, spectrum.real, out=phase)
+
+        # true frequency of every bin (in bins) from its phase advance
+        np.subtract(phase, self._last_phase, out=frequency)
+        frequency -= self._expected
+        frequency += np.pi
+        np.mod(frequency, 2 * np.pi, out=frequency)
+        frequency -= np.pi
+        frequency *= self.oversampling / (2 * np.pi)
+        frequency += self._bins
+        self._last_phase[:] = phase
+
+        # every bin belongs to the nearest peak of the magnitude. The
+        # largest bin is always a peak, so every channel has one
+        is_peak, closer = self._is_peak, self._closer
+        below, above, owner = self._below, self._above, self._owner
+        is_peak.fill(True)
+        np.greater_equal(magnitude[:, 1:], magnitude[:, :-1],
+                         out=closer[:, 1:])
+        is_peak[:, 1:] &= closer[:, 1:]
+        np.greater_equal(magnitude[:, :-1], magnitude[:, 1:],
+                         out=closer[:, :-1])
+        is_peak[:, :-1] &= closer[:, :-1]
+        below.fill(-bins)
+        np.copyto(below, self._index, where=is_peak)
+        np.maximum.accumulate(below, axis=1, out=below)
+        above.fill(2 * bins)
+        np.copyto(above, self._index, where=is_peak)
+        np.minimum.accumulate(above[:, ::-1], axis=1, out=above[:, ::-1])
+        np.subtract(self._index, below, out=owner)
+        above -= self._index
+        np.less_equal(owner, above, out=closer)
+        above += self._index
+        np.copyto(owner, above)
+        np.copyto(owner, below, where=closer)
+        owner += self._channel_offset
+
+        # each region moves by the whole bins its peak moves by, the rest
+        # of the shift comes from the phase advance. Bins moved out of the
+        # spectrum land on the extra bin
+        peak_frequency, out_phase = self._peak_frequency, self._out_phase
+        target = self._target
+        np.take(frequency, owner, out=peak_frequency, mode="clip")
+        np.take(phase, owner, out=self._peak_phase, mode="clip")
+        np.multiply(peak_frequency, ratio - 1, out=out_phase)
+        np.rint(out_phase, out=out_phase)
+        np.add(self._index, out_phase, out=target, casting="unsafe")
+        np.less(target, 0, out=closer)
+        np.minimum(target, bins, out=target)
+        np.copyto(target, bins, where=closer)
+        target += self._shifted_offset
+
+        # the peak carries on from the phase its target bin had a hop ago,
+        # the bins around it keep their phase relative to the peak
+        np.take(target, owner, out=self._peak_target, mode="clip")
+        np.take(self._sum_phase, self._peak_target, out=out_phase,
+                mode="clip")
+        peak_frequency *= ratio * 2 * np.pi / self.oversampling
+        out_phase += peak_frequency
+        out_phase += phase
+        out_phase -= self._peak_phase
+        np.mod(out_phase, 2 * np.pi, out=out_phase)
+        np.put(self._sum_phase, target, out_phase, mode="clip")
+        # where regions overlap the peaks keep their own phase, quiet bins
+        # moved onto a peak would break its continuity
+        np.copyto(self._peak_target, self._discard)
+        np.copyto(self._peak_target, target, where=is_peak)
+        np.put(self._sum_phase, self._peak_target, out_phase, mode="clip")
+
+        np.cos(out_phase, out=spectrum.real)
+        np.sin(out_phase, out=spectrum.imag)
+        spectrum *= magnitude
+        self._shifted.fill(0)
+        np.add.at(self._shifted.reshape(-1), target.reshape(-1),
+                  spectrum.reshape(-1))
+        np.fft.irfft(self._shifted[:, :bins], n=self.frame_size, axis=1,
+                     out=self._frame)
+
+        self._frame *= self._synthesis
+        self._output += self._frame
+        self._ready[:] = self._output[:, :self.hop]
+        self._output[:, :-self.hop] = self._output[:, self.hop:]
+        self._output[:, -self.hop:] = 0
+        self._input[:, :-self.hop] = self._input[:, self.hop:]
+
+
+class BiquadFilter(Effect):
+    '''
+    Second order IIR filter for equalizing, with the coefficients of the
+    Audio EQ Cookbook. kind is one of "peaking", "lowshelf", "highshelf",
+    "lowpass" or "highpass"; gain_db only applies to the first three.
+
+    Blocks are filtered step_frames at a time with matrix products into
+    buffers allocated up front, the same transposed direct form II state
+    scipy.signal.lfilter keeps, so nothing is allocated per block.
+    '''
+    name = "eq"
+    KINDS = ("peaking", "lowshelf", "highshelf", "lowpass", "highpass")
+
+    def __init__(self, channels: int, sample_rate: int,
+                 step_frames: int = 128):
+        super().__init__()
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.kind = "peaking"
+        self.frequency = 1000.0
+        self.gain_db = 0.0
+        self.q = 0.707
+        self.step_frames = step_frames
+        # (b, a), and the matrices _process runs them with. Each is
+        # replaced as a whole so the audio thread never sees a mix
+        self._coefficients = self._design()
+        self._matrices = self._step_matrices(*self._coefficients)
+        self._state = np.zeros((2, channels))
+        self._input = np.zeros((step_frames, channels))
+        self._output = np.zeros((step_frames, channels))
+        self._carry = np.zeros((step_frames, channels))
+        self._next_state = np.zeros((2, channels))
+
+    def reset(self):
+        self._state.fill(0)
+
+    def get_params(self) -> dict:
+        return {"kind": self.kind, "frequency": self.frequency,
+                "gain_db": self.gain_db, "q": self.q}
+
+    def set_params(self, kind: str = None, frequency: float = None,
+                   gain_db: float = None, q: float = None, **params):
+        super().set_params(**params)
+        if kind is not None and kind not in self.KINDS:
+            raise ValueError(f"Unknown filter kind {kind}")
+        if frequency is not None and not 0 < frequency < self.sample_rate / 2:
+            raise ValueError("Filter frequency must be below Nyquist")
+        if q is not None and q <= 0:
+            raise ValueError("Filter q must be positive")
+        self.kind = kind or self.kind
+        self.frequency = self.frequency if frequency is None else frequency
+        self.gain_db = self.gain_db if gain_db is None else gain_db
+        self.q = self.q if q is None else q
+        coefficients = self._design()
+        self._matrices = self._step_matrices(*coefficients)
+        self._coefficients = coefficients
+
+    def _design(self):
+        amplitude = 10 ** (self.gain_db / 40)
+        w0 = 2 * np.pi * self.frequency / self.sample_rate
+        cos = np.cos(w0)
+        alpha = np.sin(w0) / (2 * self.q)
+        shelf = 2 * np.sqrt(amplitude) * alpha
+        a_plus, a_minus = amplitude + 1, amplitude - 1
+        if self.kind == "peaking":
+            b = [1 + alpha * amplitude, -2 * cos, 1 - alpha * amplitude]
+            a = [1 + alpha / amplitude, -2 * cos, 1 - alpha / amplitude]
+        elif self.kind == "lowshelf":
+            b = [amplitude * (a_plus - a_minus * cos + shelf),
+                 2 * amplitude * (a_minus - a_plus * cos),
+                 amplitude * (a_plus - a_minus * cos - shelf)]
+            a = [a_plus + a_minus * cos + shelf,
+                 -2 * (a_minus + a_plus * cos),
+                 a_plus + a_minus * cos - shelf]
+        elif self.kind == "highshelf":
+            b = [amplitude * (a_plus + a_minus * cos + shelf),
+                 -2 * amplitude * (a_minus + a_plus * cos),
+                 amplitude * (a_plus + a_minus * cos - shelf)]
+            a = [a_plus - a_minus * cos + shelf,
+                 2 * (a_minus - a_plus * cos),
+                 a_plus - a_minus * cos - shelf]
+        elif self.kind == "lowpass":
+            b = [(1 - cos) / 2, 1 - cos, (1 - cos) / 2]
+            a = [1 + alpha, -2 * cos, 1 - alpha]
+        else:
+            b = [(1 + cos) / 2, -(1 + cos), (1 + cos) / 2]
+            a = [1 + alpha, -2 * cos, 1 - alpha]
+        return np.array(b) / a[0], np.array(a) / a[0]
+
+    def _step_matrices(self, b: np.ndarray, a: np.ndarray):
+        #   The filter as a state space system: with state s (the two
+        #   delays of the transposed direct form II) every frame does
+        #   y = s[0] + b0 x and s = transition @ s + drive x. Unrolled over
+        #   n <= step_frames frames, y = response[:n, :n] @ x +
+        #   from_state[:n] @ s and s = powers[n] @ s +
+        #   to_state[:, step - n:] @ x
+        step = self.step_frames
+        transition = np.array([[-a[1], 1.0], [-a[2], 0.0]])
+        drive = np.array([b[1] - a[1] * b[0], b[2] - a[2] * b[0]])
+        powers = np.zeros((step + 1, 2, 2))
+        powers[0] = np.eye(2)
+        for n in range(step):
+            powers[n + 1] = transition @ powers[n]
+        # impulse response, h[0] = b0 and h[n] = first row of
+        # transition^(n - 1) @ drive
+        impulse = np.empty(step)
+        impulse[0] = b[0]
+        impulse[1:] = powers[:step - 1, 0] @ drive
+        lags = np.subtract.outer(np.arange(step), np.arange(step))
+        response = np.where(lags >= 0, impulse[np.clip(lags, 0, None)], 0)
+        from_state = powers[:step, 0]
+        to_state = (powers[step - 1::-1] @ drive).T
+        return response, from_state, to_state, powers
+
+    def _process(self, block: np.ndarray):
+        response, from_state, to_state, powers = self._matrices
+        step = self.step_frames
+        i = 0
+        while i < block.shape[0]:
+            n = min(block.shape[0] - i, step)
+            x, y, carry = self._input[:n], self._output[:n], self._carry[:n]
+            x[:] = block[i:i + n]
+            np.matmul(response[:n, :n], x, out=y)
+            np.matmul(from_state[:n], self._state, out=carry)
+            y += carry
+            np.matmul(powers[n], self._state, out=self._next_state)
+            np.matmul(to_state[:, step - n:], x, out=self._state)
+            self._state += self._next_state
+            block[i:i + n] = y
+            i += n
+
+
+class _DelayLine:
+    '''
+    Ring buffer holding the last capacity frames written to it
+    '''
+    def __init__(self, capacity: int, channels: int):
+        self._buffer = np.zeros((capacity, channels), dtype=np.float32)
+        self._write = 0
+
+    def clear(self):
+        self._buffer.fill(0)
+
+    def read(self, delay: int, out: np.ndarray):
+        #   Fills out with the frames written delay frames before the next
+        #   len(out) writes. len(out) must not exceed delay
+        capacity = self._buffer.shape[0]
+        n = out.shape[0]
+        start = (self._write - delay) % capacity
+        first = min(n, capacity - start)
+        out[:first] = self._buffer[start:start + first]
+        out[first:] = self._buffer[:n - first]
+
+    def write(self, frames: np.ndarray):
+        capacity = self._buffer.shape[0]
+        n = frames.shape[0]
+        first = min(n, capacity - self._write)
+        self._buffer[self._write:self._write + first] = frames[:first]
+        self._buffer[:n - first] = frames[first:]
+        self._write = (self._write + n) % capacity
+
+
+class FeedbackDelay(Effect):
+    '''
+    Echo that feeds feedback times its output back into itself. time is
+    the delay in seconds, up to max_time; mix is the level of the echoes
+    added to the dry signal.
+    '''
+    name = "delay"
+
+    def __init__(self, channels: int, sample_rate: int,
+                 max_time: float = 2.0, scratch_frames: int = 4096):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.max_time = max_time
+        self.time = 0.35
+        self.feedback = 0.4
+        self.mix = 0.35
+        self._line = _DelayLine(int(max_time * sample_rate) + 1, channels)
+        self._tap = np.zeros((scratch_frames, channels), dtype=np.float32)
+        self._feed = np.zeros_like(self._tap)
+
+    def reset(self):
+        self._line.clear()
+
+    def get_params(self) -> dict:
+        return {"time": self.time, "feedback": self.feedback,
+                "mix": self.mix}
+
+    def set_params(self, time: float = None, feedback: float = None,
+                   mix: float = None, **params):
+        super().set_params(**params)
+        if time is not None and not 0 < time <= self.max_time:
+            raise ValueError(f"Delay time must be in (0, {self.max_time}]")
+        if feedback is not None and not 0 <= feedback < 1:
+            raise ValueError("Delay feedback must be in [0, 1)")
+        self.time = self.time if time is None else time
+        self.feedback = self.feedback if feedback is None else feedback
+        self.mix = self.mix if mix is None else mix
+
+    def _process(self, block: np.ndarray):
+        delay = max(1, int(self.time * self.sample_rate))
+        feedback, mix = self.feedback, self.mix
+        i = 0
+        while i < block.shape[0]:
+            n = min(block.shape[0] - i, delay, self._tap.shape[0])
+            dry = block[i:i + n]
+            tap = self._tap[:n]
+            feed = self._feed[:n]
+            self._line.read(delay, tap)
+            np.multiply(tap, feedback, out=feed)
+            feed += dry
+            self._line.write(feed)
+            tap *= mix
+            dry += tap
+            i += n
+
+
+class SchroederReverb(Effect):
+    '''
+    Schroeder reverb: four parallel feedback combs followed by two series
+    allpasses, with the delays of Freeverb. room_size is the feedback of
+    the combs and sets the decay time; mix is the level of the reverb
+    added to the dry signal.
+    '''
+    name = "reverb"
+    COMB_DELAYS = (1557, 1617, 1491, 1422)
+    ALLPASS_DELAYS = (225, 556)
+    ALLPASS_GAIN = 0.5
+
+    def __init__(self, channels: int, sample_rate: int,
+                 scratch_frames: int = 4096):
+        super().__init__()
+        self.room_size = 0.84
+        self.mix = 0.25
+        scale = sample_rate / 44100
+        self._combs = [
+            (max(1, int(delay * scale)), _DelayLine(
+                max(1, int(delay * scale)), channels))
+            for delay in self.COMB_DELAYS
+        ]
+        self._allpasses = [
+            (max(1, int(delay * scale)), _DelayLine(
+                max(1, int(delay * scale)), channels))
+            for delay in self.ALLPASS_DELAYS
+        ]
+        # frames processed at once, no more than the shortest delay
+        delays = [delay for delay, _ in self._combs + self._allpasses]
+        self._step = min(scratch_frames, *delays)
+        shape = (self._step, channels)
+        self._wet = np.zeros(shape, dtype=np.float32)
+        self._tap = np.zeros(shape, dtype=np.float32)
+        self._feed = np.zeros(shape, dtype=np.float32)
+
+    def reset(self):
+        for _, line in self._combs + self._allpasses:
+            line.clear()
+
+    def get_params(self) -> dict:
+        return {"room_size": self.room_size, "mix": self.mix}
+
+    def set_params(self, room_size: float = None, mix: float = None,
+                   **params):
+        super().set_params(**params)
+        if room_size is not None and not 0 <= room_size < 1:
+            raise ValueError("Reverb room_size must be in [0, 1)")
+        self.room_size = self.room_size if room_size is None else room_size
+        self.mix = self.mix if mix is None else mix
+
+    def _process(self, block: np.ndarray):
+        i = 0
+        while i < block.shape[0]:
+            n = min(block.shape[0] - i, self._step)
+            dry = block[i:i + n]
+            wet, tap, feed = self._wet[:n], self._tap[:n], self._feed[:n]
+            wet.fill(0)
+            for delay, line in self._combs:
+                line.read(delay, tap)
+                wet += tap
+                np.multiply(tap, self.room_size, out=feed)
+                feed += dry
+                line.write(feed)
+            wet *= 1 / len(self._combs)
+            for delay, line in self._allpasses:
+                line.read(delay, tap)
+                np.multiply(tap, self.ALLPASS_GAIN, out=feed)
+                feed += wet
+                line.write(feed)
+                tap -= wet
+                wet[:] = tap
+            wet *= self.mix
+            dry += wet
+            i += n
+
+
+class EffectChain(Effect):
+    '''
+    Runs effects one after another on the same block. A chain attaches to
+    a track or to a whole loop (see LoopChannel) and can be edited while
+    the mixer plays it: the effect list is replaced as a whole, never
+    changed in place. An empty chain is falsy so the mixer can skip it.
+    '''
+    name = "chain"
+
+    def __init__(self):
+        super().__init__()
+        self._effects = ()
+
+    def __len__(self):
+        return len(self._effects)
+
+    def __iter__(self):
+        return iter(self._effects)
+
+    def __getitem__(self, position: int) -> Effect:
+        return self._effects[position]
+
+    def add(self, effect: Effect, position: int = None) -> int:
+        #   Inserts effect at position, at the end by default, and returns
+        #   its position
+        effects = list(self._effects)
+        if position is None:
+            position = len(effects)
+        effects.insert(position, effect)
+        self._effects = tuple(effects)
+        return effects.index(effect)
+
+    def remove(self, position: int) -> Effect:
+        effects = list(self._effects)
+        effect = effects.pop(position)
+        self._effects = tuple(effects)
+        return effect
+
+    def reset(self):
+        for effect in self._effects:
+            effect.reset()
+
+    @property
+    def latency(self) -> int:
+        if self.bypass:
+            return 0
+        return sum(effect.latency for effect in self._effects)
+
+    def copy(self, channels: int, sample_rate: int):
+        #   Returns a chain of new effects with the same parameters, e.g.
+        #   for an offline render that must not disturb playback
+        chain = EffectChain()
+        for effect in self._effects:
+            duplicate = create_effect(effect.name, channels, sample_rate,
+                                      **effect.get_params())
+            duplicate.bypass = effect.bypass
+            chain.add(duplicate)
+        return chain
+
+    def get_costs(self) -> list[tuple[str, float, float]]:
+        #   Returns (name, last, peak) seconds per block for every effect
+        return [(effect.name, effect.last_cost, effect.peak_cost)
+                for effect in self._effects]
+
+    def _process(self, block: np.ndarray):
+        for effect in self._effects:
+            effect.process(block)
+
+
+# effect name -> class, see create_effect
+EFFECT_TYPES = {
+    effect.name: effect
+    for effect in (PitchShifter, BiquadFilter, FeedbackDelay,
+                   SchroederReverb)
+}
+
+
+def create_effect(effect_type: str, channels: int, sample_rate: int,
+                  **params) -> Effect:
+    """Creates a live effect by name.
+
+    Args:
+        effect_type (str): key of EFFECT_TYPES, e.g. "eq" or "reverb"
+        channels (int): channel count of the blocks it will process
+        sample_rate (int): sample rate of the blocks it will process
+        **params: passed to the effect's set_params()
+
+    Raises:
+        ValueError: unknown effect type or invalid parameters
+
+    Returns:
+        Effect: the new effect
+    """
+    if effect_type not in EFFECT_TYPES:
+        raise ValueError(f"Unknown effect {effect_type}")
+    effect = EFFECT_TYPES[effect_type](channels, sample_rate)
+    effect.set_params(**params)
+    effect.reset()
+    return effect
+
+
+def time_stretch(samples: np.ndarray, rate: float,
+                 preview: bool = False) -> np.ndarray:
+    """Changes the tempo of audio without changing its pitch.
+
+    Args:
+        samples (np.ndarray): float32 array shaped (frames, channels)
+        rate (float): tempo ratio, > 1 plays faster and shortens the audio
+        preview (bool): use a fast overlap-add stretch instead of the phase
+            vocoder. Much quicker, but transients smear and tones flutter
+
+    Returns:
+        np.ndarray: float32 array shaped (round(frames / rate), channels)
+    """
+    frames = int(round(samples.shape[0] / rate))
+    if preview:
+        stretched = _overlap_add_stretch(samples, rate, frames)
+    else:
+        import librosa
+        stretched = librosa.effects.time_stretch(samples.T, rate=rate).T
+    stretched = stretched[:frames]
+    if stretched.shape[0] < frames:
+        stretched = np.pad(stretched,
+                           ((0, frames - stretched.shape[0]), (0, 0)))
+    return np.ascontiguousarray(stretched, dtype=np.float32)
+
+
+def _overlap_add_stretch(samples: np.ndarray, rate: float, frames: int,
+                         frame_size: int = 2048) -> np.ndarray:
+    """Stretches by reading hann windowed grains every hop * rate samples
+    and writing them every hop samples. Grains that are a multiple of four
+    apart don't overlap, so each of the four groups is added in one go.
+    """
+    hop = frame_size // 4
+    channels = samples.shape[1]
+    count = frames // hop + 1
+    starts = (np.arange(count) * hop * rate).astype(np.intp)
+    padded = np.pad(samples, ((0, frame_size), (0, 0)))
+    starts = np.minimum(starts, samples.shape[0])
+    window = np.hanning(frame_size).astype(np.float32)[:, np.newaxis]
+
+    grains = padded[starts[:, np.newaxis] + np.arange(frame_size)] * window
+    output = np.zeros(((count + 4) * hop, channels), dtype=np.float32)
+    for group in range(4):
+        grouped = grains[group::4].reshape(-1, channels)
+        offset = group * hop
+        output[offset:offset + grouped.shape[0]] += grouped
+    # four hann windows a hop apart sum to 2
+    output *= 0.5
+    return output[:frames]
+
+
+def render_time_stretch(source_path: str, rate: float, new_path: str) -> str:
+    """Renders a high quality time stretch of source_path into new_path.
+
+    Meant to run in a RenderService worker process. Writes to a temporary
+    file first so an interrupted render never leaves a truncated file.
+
+    Returns:
+        str: new_path
+    """
+    import os
+    import soundfile
+
+    samples, sample_rate = soundfile.read(source_path, dtype="float32",
+                                          always_2d=True)
+    tmp_path = f"{new_path}.{os.getpid()}.part"
+    soundfile.write(tmp_path, time_stretch(samples, rate), sample_rate,
+                    format="WAV", subtype="FLOAT")
+    os.replace(tmp_path, new_path)
+    return new_path
 
-"""
-Potential routes to take:
-    1. Hard code this somehow. Not a very appealing option as it is labor
-       intensive. Pitch shift and time stretch can be accomplished using
-       Fast Fourier Transform
-    2. **Librosa** - a package for music and audio analysis. Has time-stretch
-       and pitch-shift functionality. Might be a little hard to play
-       nice with Pydub, but I believe this is our best route
-    3. pysndfx - we can do different effects using pysndfx, a wrapper for
-       a package called SoX. It supports EQ, reverb, phaser, delay
-    NOTE: Windows users may need to download ffmpeg for librosa to work
-"""
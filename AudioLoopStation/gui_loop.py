@@ -1,6 +1,7 @@
 import tkinter as tk
 import tkinter.ttk as ttk
 from tkdial import Dial
+import Loop_Constants.constants as constants
 from gui_track import GuiTrack
 
 
@@ -32,6 +33,8 @@ class GuiLoop(ttk.Frame):
 
         self.progBarRunning = False
         self.progDialRunning = False
+        # in milliseconds between progDial updates
+        self.dialRefreshInterval = 50
 
         # in milliseconds between beats
         if self.originalBeatsPerMinute == -1:
@@ -41,6 +44,7 @@ class GuiLoop(ttk.Frame):
                 60 / self.modifiedBeatsPerMinute * 1000)
 
         self.loopName = ""
+        self.labelLoopName = labelLoopName
 
         ###################
         # UI Components
@@ -73,7 +77,10 @@ class GuiLoop(ttk.Frame):
                                   self.controller.stopLoop(self, self.loopName)
                                   )
 
-        self.volumeScale = ttk.Scale(self, orient=tk.VERTICAL)
+        self.volumeScale = ttk.Scale(self, orient=tk.VERTICAL, from_=100,
+                                     to=0)
+        self.volumeScale.set(constants.volumeUnity)
+        self.volumeScale.config(command=self.setVolume)
 
         self.progBar = ttk.Progressbar(self, orient=tk.HORIZONTAL,
                                        mode="determinate")
@@ -125,6 +132,16 @@ class GuiLoop(ttk.Frame):
         '''
         self.loopName = loopName
 
+    def updateRenderProgress(self, done, total):
+        '''
+        this function shows how many tempo renders finished in the loop label
+        '''
+        if done < total:
+            self.LabelName.configure(
+                text=f"{self.labelLoopName} (rendering {done}/{total})")
+        else:
+            self.LabelName.configure(text=self.labelLoopName)
+
     def setOriginalLength(self, length):
         '''
         this function sets the original loop length which is used for progDial
@@ -150,7 +167,6 @@ class GuiLoop(ttk.Frame):
     def updateBeatsPerMinute(self, bpm):
         '''
         this function updates the beats per minute and related
-        as of 3Dec24 this functionality is not used
         '''
         self._updateBeatsPerMinute(bpm)
         self._updatePauseBetweenBeats()
@@ -171,7 +187,6 @@ class GuiLoop(ttk.Frame):
     def _updateLoopLength(self):
         '''
         this function updates the loop length
-        as of 3Dec24 this functionality is not used
         '''
         self.modifiedLoopLength = (self.originalLoopLength /
                                    self.modifiedBeatsPerMinute *
@@ -230,13 +245,12 @@ class GuiLoop(ttk.Frame):
         self.progBarRunning = True
         self.updateProgBar(num)
 
-    def startProgressDial(self, num=0):
+    def startProgressDial(self):
         '''
         this function starts the progress dial
         '''
         self.progDialRunning = True
-        # Splits dial to 36 increments
-        self.updateProgDial(num, (self.originalLoopLength / 1000) / 36)
+        self.updateProgDial()
 
     def startAllTracks(self):
         '''
@@ -262,30 +276,21 @@ class GuiLoop(ttk.Frame):
             self.after(self.pauseBetweenBeats, self.updateProgBar,
                        int(curProgressValue))
 
-    def updateProgDial(self, curProgressValue, dialIncrement, i=0):
+    def updateProgDial(self):
         '''
         this function updates the progress dial
+        the dial only shows the loop position kept by the audio engine, which
+        also takes care of repeating the loop
         '''
 
         if self.progDialRunning:
-            # to go a full circle, there are 36 steps
-            # see startProgressDial()
-            if i == 36:
-                for track in self.trackCollection.values():
-                    if not track.isTrackDeleted:
-                        if track.isTrackPlaying:
-                            self.controller.playTrack(track, track.gui_loop)
-                curProgressValue = dialIncrement
-                i = 1
-            else:
-                curProgressValue += dialIncrement
-                i += 1
-
-            self.progDial.set(curProgressValue)
+            position = self.controller.getLoopPosition(self.loopName)
+            if position >= 0:
+                # dial is in seconds, see setOriginalLength()
+                self.progDial.set(position / 1000)
 
-            # waits some time and then increases the dial
-            self.after(int(dialIncrement * 1000), self.updateProgDial,
-                       curProgressValue, dialIncrement, i)
+            # waits some time and then updates the dial again
+            self.after(self.dialRefreshInterval, self.updateProgDial)
 
     def stopAllTracks(self, event=None):
         '''
@@ -309,10 +314,11 @@ class GuiLoop(ttk.Frame):
 
     def setVolume(self, event=None):
         '''
-        this function sets the volume
-        as of 3Dec24 this functionality is not used
+        this function sets the level of the loop from the volume scale
         '''
-        pass
+        if self.loopName == "":
+            return
+        self.controller.setLoopVolume(self, self.volumeScale.get())
 
     def resetVisualization(self):
         '''
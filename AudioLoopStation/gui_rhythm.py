@@ -1,12 +1,14 @@
 import tkinter as tk
 import tkinter.ttk as ttk
 from tkdial import Dial
+import Loop_Constants.constants as constants
 
 
 class GuiRhythm(ttk.Frame):
     '''
     this class is part of View
-    as of 3Dec24 this class puts up the gui elements but they are not used
+    the BPM, Volume and Monitor dials are used; as of 3Dec24 the other gui
+    elements are not
     '''
     def __init__(self, parent, LabelText, controller):
         super().__init__(parent)
@@ -64,11 +66,59 @@ class GuiRhythm(ttk.Frame):
         self.bpmDial.set(controller.bpm)
         self.bpmDial.grid(column=0, row=5, sticky="ew", padx=5, pady=15)
 
-        self.volumeDial = Dial(self, text="Volume", integer=True)
-        self.volumeDial.set(50)
+        self.volumeDial = Dial(self, text="Volume", integer=True,
+                               command=lambda:
+                               controller.setMasterVolume(
+                                   self.volumeDial.get())
+                               )
+        self.volumeDial.set(constants.volumeUnity)
         self.volumeDial.grid(column=1, row=5, sticky="ew", padx=5,
                              pady=15)
 
+        # level the live input is heard at; 0 turns monitoring off
+        self.monitorDial = Dial(self, text="Monitor", integer=True,
+                                command=lambda:
+                                controller.setMonitorVolume(
+                                    self.monitorDial.get())
+                                )
+        self.monitorDial.set(0)
+        self.monitorDial.grid(column=0, row=6, sticky="ew", padx=5,
+                              pady=15)
+
+        # measures the round trip latency recordings are shifted back by;
+        # connect the output to the input first
+        self.calibrateBtn = ttk.Button(self, text="Calibrate Latency",
+                                       command=controller.calibrateLatency)
+        self.calibrateBtn.grid(column=1, row=6, sticky="ew", padx=5)
+
+        # audio devices; opening a menu looks for devices plugged in since,
+        # the lists fill in once the devices have been listed
+        self.inputLabel = tk.Label(self, text="Input")
+        self.inputLabel.grid(column=0, row=7, sticky="w", padx=5)
+        self.inputMenu = ttk.Combobox(self, state="readonly",
+                                      postcommand=controller.refreshDevices)
+        self.inputMenu.bind("<<ComboboxSelected>>", lambda event:
+                            controller.selectInput(self.inputMenu.get()))
+        self.inputMenu.grid(column=1, row=7, sticky="ew", padx=5, pady=2)
+
+        self.outputLabel = tk.Label(self, text="Output")
+        self.outputLabel.grid(column=0, row=8, sticky="w", padx=5)
+        self.outputMenu = ttk.Combobox(self, state="readonly",
+                                       postcommand=controller.refreshDevices)
+        self.outputMenu.bind("<<ComboboxSelected>>", lambda event:
+                             controller.selectOutput(self.outputMenu.get()))
+        self.outputMenu.grid(column=1, row=8, sticky="ew", padx=5, pady=2)
+
+    def updateDevices(self, inputs, outputs, selectedInput, selectedOutput):
+        '''
+        this function refills the device menus with the device names and
+        shows the selected ones
+        '''
+        self.inputMenu['values'] = inputs
+        self.inputMenu.set(selectedInput)
+        self.outputMenu['values'] = outputs
+        self.outputMenu.set(selectedOutput)
+
     def on(self, event=None):
         pass
 
@@ -1,4 +1,11 @@
-import sounddevice as sd
+import os
+import json
+import time
+import pathlib
+import threading
+import numpy as np
+import Loop_Constants.constants as constants
+from audio_backend import AudioBackend
 
 
 class _IO_manager:
@@ -6,6 +13,12 @@ class _IO_manager:
     Singleton class created to allow IO device interaction as well as
     maintaining IO device state across the application.
 
+    Devices are listed on a background thread and cached in .save, so on
+    later launches the cached devices are available at once while the
+    backend is queried again. On the first launch the lists stay empty
+    until the query finishes; looking up or selecting a device waits for
+    it. refresh() looks for devices plugged in or removed since.
+
     The IO_manager() function should be used to access this class.
 
     DO NOT directly create an object of this class.
@@ -16,12 +29,49 @@ class _IO_manager:
     """
     _instance = None
 
-    def __init__(self) -> None:
+    def __init__(
+            self,
+            tuning_path: pathlib.Path = None,
+            devices_path: pathlib.Path = None
+            ) -> None:
+        app_root = pathlib.Path(__file__).parent.parent
+        self._tuning_path = tuning_path or \
+            app_root / '.save' / 'audio_tuning.json'
+        self._devices_path = devices_path or \
+            app_root / '.save' / 'audio_devices.json'
         self._inputs = []
         self._outputs = []
+        # device index -> device and device name -> device, rebuilt with
+        # the lists above
+        self._inputs_by_index = {}
+        self._outputs_by_index = {}
+        self._inputs_by_name = {}
+        self._outputs_by_name = {}
         self._selected_input = {}
         self._selected_output = {}
-        self._fetch_IO()
+        # system defaults of the last query; a selection that is still the
+        # default follows the default when it changes
+        self._default_input = {}
+        self._default_output = {}
+        # "device name|host api|sample rate" -> auto_tune result, and
+        # "round trip|input|output|sample rate" -> {"frames": latency}
+        self._tuning = {}
+        self._lock = threading.Lock()
+        # held while a stream is opened and started, and for a whole
+        # auto_tune probe, so probing never opens the output together with
+        # the mixer or a latency calibration
+        self.stream_lock = threading.Lock()
+        self._listeners = []
+        self._refresh_thread = None
+        # rescan flag of a query asked for while another one runs, None
+        # if there is none. Guarded by _refresh_lock like _refresh_thread
+        self._refresh_request = None
+        self._refresh_lock = threading.Lock()
+        # set once the lists were filled, from the cache or the backend
+        self._devices_known = threading.Event()
+        self._load_devices()
+        self.refresh()
+        self._load_tuning()
 
     # Public functions
     def get_inputs(self) -> list[dict]:
@@ -98,6 +148,7 @@ class _IO_manager:
             ``'default_samplerate'``
                 The default sampling frequency of the device.
         """
+        self._wait_for_devices()
         return self._selected_input
 
     def get_selected_output(self) -> dict:
@@ -124,24 +175,52 @@ class _IO_manager:
             ``'default_samplerate'``
                 The default sampling frequency of the device.
         """
+        self._wait_for_devices()
         return self._selected_output
 
+    def get_device(self, id: str or int, output: bool = False) -> dict:
+        """Looks up an input or output device by index or name.
+
+        Args:
+            id (str or int): device index or device name
+            output (bool): look among the outputs instead of the inputs
+
+        Returns:
+            dict: the device, empty dict if there is no such device. See
+            get_inputs for its keys.
+        """
+        self._wait_for_devices()
+        by_index = self._outputs_by_index if output else \
+            self._inputs_by_index
+        by_name = self._outputs_by_name if output else self._inputs_by_name
+        if isinstance(id, str) and id in by_name:
+            return by_name[id]
+        try:
+            return by_index.get(int(id), {})
+        except (ValueError, TypeError, OverflowError):
+            return {}
+
     def select_input(self, id: str or int) -> None:
         """Select the audio input that should be used for recording.
         Updates self._selected_input.
 
         Args:
-            id (str or int): id of the device to use for audio input.
-            See get_inputs for info regrarding extracting device id.
+            id (str or int): index or name of the device to use for audio
+            input. See get_inputs for info regrarding extracting device id.
         """
         if id == "":
             print("Could not save selected input. " +
                   "Wrong type: Requires int or str")
             return
+        self._wait_for_devices()
+
+        if isinstance(id, str) and id in self._inputs_by_name:
+            self._selected_input = self._inputs_by_name[id]
+            return
 
         try:
             converted_id = int(id)
-            self._selected_input = self._match_id(self._inputs, converted_id)
+            self._selected_input = self._inputs_by_index.get(converted_id, {})
         except (ValueError, TypeError, OverflowError):
             print("Could not save selected input. " +
                   "Wrong type: Requires int or str")
@@ -152,42 +231,366 @@ class _IO_manager:
         Updates self._selected_output.
 
         Args:
-            id (str or int): id of the device to use for audio output.
-            See get_outputs for info regrarding extracting device id.
+            id (str or int): index or name of the device to use for audio
+            output. See get_outputs for info regrarding extracting device id.
         """
         if id == "":
             print("Could not save selected output. " +
                   "Wrong type: Requires int or str")
             return
+        self._wait_for_devices()
+
+        if isinstance(id, str) and id in self._outputs_by_name:
+            self._selected_output = self._outputs_by_name[id]
+            return
 
         try:
             converted_id = int(id)
-            self._selected_output = self._match_id(self._outputs, converted_id)
+            self._selected_output = self._outputs_by_index.get(converted_id,
+                                                               {})
         except (ValueError, TypeError, OverflowError):
             print("Could not save selected output. " +
                   "Wrong type: Requires int or str")
 
+    def refresh(self, rescan: bool = False, block: bool = False) -> None:
+        """Queries the audio backend for devices again on a background
+        thread, e.g. after an interface was plugged in, and updates the
+        device lists and the cache. The selected devices stay selected if
+        they are still there, by name, and fall back to the system
+        defaults otherwise. Listeners are called once the lists changed.
+
+        Args:
+            rescan (bool): make the backend look for new hardware.
+                PortAudio can only do that while none of its streams are
+                open, so stop playback and recording first
+            block (bool): wait for the query to finish
+        """
+        with self._refresh_lock:
+            # a query already running may have missed what changed, so it
+            # runs once more afterwards
+            self._refresh_request = bool(self._refresh_request) or rescan
+            thread = self._refresh_thread
+            if thread is None:
+                thread = threading.Thread(target=self._refresh_devices,
+                                          daemon=True)
+                self._refresh_thread = thread
+                thread.start()
+        if block:
+            thread.join()
+
+    def add_device_listener(self, callback) -> None:
+        """Calls callback() every time refresh() changes the device lists.
+        It runs on the refresh thread; GUI code has to hand over to Tk,
+        e.g. with after().
+        """
+        self._listeners.append(callback)
+
+    def remove_device_listener(self, callback) -> None:
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def auto_tune(
+            self,
+            sample_rate: int = 44100,
+            channels: int = 2,
+            block_sizes: list[int] = None,
+            probe_seconds: float = constants.TUNE_PROBE_SECONDS,
+            retune: bool = False
+            ) -> dict:
+        """Finds the lowest stable block size and latency of the selected
+        output. Opens the output at every block size with the device's low
+        and high latency, lowest total latency first, plays silence for
+        probe_seconds and times the callbacks. The first setting without
+        xruns whose callbacks never fall further behind than the latency
+        wins. The result is cached per device name and host API, so later
+        launches skip the probing.
+
+        Args:
+            sample_rate (int): sample rate the mixer runs at
+            channels (int): output channels the mixer plays
+            block_sizes (list[int]): block sizes to try, defaults to
+                constants.TUNE_BLOCK_SIZES
+            probe_seconds (float): how long each setting plays
+            retune (bool): probe again even if a result is cached
+
+        Returns:
+            dict: ``'blocksize'``, ``'latency'`` (seconds), ``'jitter'``
+            (standard deviation of the callback interval in seconds),
+            ``'late'`` (seconds the latest callback was behind) and
+            ``'xruns'``. Empty dict if there is no output device.
+        """
+        device = self.get_selected_output()
+        if not device:
+            print("Unable to tune audio. No output device selected")
+            return {}
+        key = self._tuning_key(device, sample_rate)
+        if key in self._tuning and not retune:
+            return self._tuning[key]
+
+        candidates = sorted(
+            (block_size / sample_rate + latency, block_size, latency)
+            for block_size in block_sizes or constants.TUNE_BLOCK_SIZES
+            for latency in {device['default_low_output_latency'],
+                            device['default_high_output_latency']}
+            )
+        result = {}
+        for _, block_size, latency in candidates:
+            print(f"Probing {device['name']}: block size {block_size}, "
+                  f"latency {latency * 1000:.1f} ms")
+            result = self._probe(device, sample_rate, channels, block_size,
+                                 latency, probe_seconds)
+            if result['stable']:
+                break
+        # nothing was stable; the last candidate has the most headroom
+        result.pop('stable', None)
+        self._tuning[key] = result
+        self._save_tuning()
+        return result
+
+    def start_auto_tune(self, **kwargs) -> threading.Thread:
+        """Runs auto_tune on a background thread, so probing doesn't hold
+        up the GUI. Streams opened meanwhile get the backend's default
+        settings, see get_stream_settings.
+
+        Args:
+            **kwargs: passed to auto_tune
+
+        Returns:
+            threading.Thread: the thread probing, already started
+        """
+        thread = threading.Thread(target=self.auto_tune, kwargs=kwargs,
+                                  daemon=True)
+        thread.start()
+        return thread
+
+    def get_stream_settings(self, sample_rate: int = 44100) -> dict:
+        """Returns the auto_tune result of the selected output at
+        sample_rate, empty dict if it hasn't been tuned
+        """
+        return self._tuning.get(
+            self._tuning_key(self.get_selected_output(), sample_rate), {})
+
+    def get_round_trip_latency(self, sample_rate: int = 44100) -> int:
+        """Returns the round trip latency in frames measured for the
+        selected input and output at sample_rate, 0 if it hasn't been
+        calibrated, see recorder.Recorder.calibrate_latency
+        """
+        entry = self._tuning.get(self._latency_key(sample_rate), {})
+        return entry.get("frames", 0)
+
+    def set_round_trip_latency(self, frames: int,
+                               sample_rate: int = 44100) -> None:
+        """Caches a measured round trip latency of the selected input and
+        output with the auto_tune results, so later launches compensate
+        takes without calibrating again
+        """
+        self._tuning[self._latency_key(sample_rate)] = {"frames": int(frames)}
+        self._save_tuning()
+
     # Private functions
-    def _fetch_IO(self):
-        """Funtion that queries user device for IO devices.
+    def _probe(
+            self,
+            device: dict,
+            sample_rate: int,
+            channels: int,
+            block_size: int,
+            latency: float,
+            seconds: float
+            ) -> dict:
+        """Plays silence at one setting and measures callback timing. The
+        first callbacks are skipped, PortAudio runs them back to back to
+        fill its buffers.
+        """
+        warmup = 4
+        count = warmup + max(int(seconds * sample_rate / block_size), 8)
+        stamps = []
+        xruns = []
+
+        def callback(outdata, frames, time_info, status):
+            stamps.append(time.perf_counter())
+            if status and len(stamps) > warmup:
+                xruns.append(status)
+            outdata.fill(0)
+
+        result = {"blocksize": block_size, "latency": latency,
+                  "jitter": 0.0, "late": 0.0, "xruns": 0, "stable": False}
+        with self.stream_lock:
+            try:
+                stream = AudioBackend().output_stream(
+                    samplerate=sample_rate,
+                    blocksize=block_size,
+                    device=device['index'],
+                    channels=channels,
+                    dtype='float32',
+                    latency=latency,
+                    callback=callback
+                    )
+            except Exception as e:
+                # PortAudioError when the device rejects the setting
+                print(f"Unable to open {device['name']} at block size "
+                      f"{block_size}: {e}")
+                return result
+            try:
+                stream.start()
+            except Exception as e:
+                # PortAudioError when the device is busy or went away
+                print(f"Unable to start {device['name']} at block size "
+                      f"{block_size}: {e}")
+                stream.close()
+                return result
+            deadline = time.perf_counter() + \
+                4 * count * block_size / sample_rate
+            while len(stamps) < count and time.perf_counter() < deadline:
+                time.sleep(0.01)
+            stream.stop()
+            stream.close()
+        if len(stamps) < count:
+            print(f"{device['name']} stalled at block size {block_size}")
+            return result
+
+        stamps = np.array(stamps[warmup:count])
+        period = block_size / sample_rate
+        # how far each callback ran behind the earliest one's schedule
+        behind = stamps - period * np.arange(len(stamps))
+        late = float(behind.max() - behind.min())
+        result.update(jitter=float(np.diff(stamps).std()), late=late,
+                      xruns=len(xruns),
+                      stable=not xruns and late < latency)
+        return result
+
+    def _wait_for_devices(self) -> None:
+        """Waits for the first device query, unless it is the caller"""
+        thread = self._refresh_thread
+        if self._devices_known.is_set() or thread is None or \
+                thread is threading.current_thread():
+            return
+        thread.join()
+
+    def _tuning_key(self, device: dict, sample_rate: int) -> str:
+        return f"{device.get('name')}|{device.get('hostapi')}|{sample_rate}"
+
+    def _latency_key(self, sample_rate: int) -> str:
+        device_in = self.get_selected_input()
+        device_out = self.get_selected_output()
+        return (f"round trip|{device_in.get('name')}|"
+                f"{device_in.get('hostapi')}|{device_out.get('name')}|"
+                f"{device_out.get('hostapi')}|{sample_rate}")
+
+    def _load_tuning(self) -> None:
+        try:
+            with open(os.fspath(self._tuning_path), "r") as file:
+                self._tuning = json.load(file)
+        except (OSError, ValueError):
+            self._tuning = {}
+
+    def _save_tuning(self) -> None:
+        # auto_tune may save from its thread while latency is calibrated
+        with self._lock:
+            os.makedirs(os.fspath(self._tuning_path.parent), exist_ok=True)
+            with open(os.fspath(self._tuning_path), "w") as file:
+                json.dump(self._tuning, file)
+
+    def _refresh_devices(self) -> None:
+        """Refresh thread: queries the backend until no refresh is asked
+        for anymore"""
+        try:
+            while True:
+                with self._refresh_lock:
+                    rescan = self._refresh_request
+                    if rescan is None:
+                        return
+                    self._refresh_request = None
+                self._fetch_IO(rescan)
+        finally:
+            with self._refresh_lock:
+                self._refresh_thread = None
+                self._refresh_request = None
+
+    def _fetch_IO(self, rescan: bool = False):
+        """Funtion that queries the audio backend for IO devices.
         Updates self._selected_input, self._selected_output,
-        self._inputs, and self._outputs.
+        self._inputs, and self._outputs, and caches them if the backend
+        is slow to list its devices.
+        """
+        backend = AudioBackend()
+        fetchedData = [dict(device) for device in
+                       backend.query_devices(rescan=rescan)]
+        # default.device: (in,out)
+        defaults = backend.default_device()
+        changed = self._set_devices(fetchedData, defaults)
+        if getattr(backend, "cache_devices", False):
+            self._save_devices(fetchedData, defaults)
+        if changed:
+            for listener in list(self._listeners):
+                listener()
+
+    def _set_devices(
+            self,
+            fetchedData: list[dict],
+            defaults: tuple[int, int]
+            ) -> bool:
+        """Replaces the device lists and their indexes, keeping the
+        selected devices by name.
+
+        Returns:
+            bool: True if the devices differ from the previous ones
+        """
+        # parse input and output lists
+        inputs = self._parse_input(fetchedData)
+        outputs = self._parse_output(fetchedData)
+        with self._lock:
+            changed = inputs != self._inputs or outputs != self._outputs
+            self._inputs_by_index = {d['index']: d for d in inputs}
+            self._outputs_by_index = {d['index']: d for d in outputs}
+            self._inputs_by_name = {d['name']: d for d in inputs}
+            self._outputs_by_name = {d['name']: d for d in outputs}
+            self._inputs = inputs
+            self._outputs = outputs
+            default_input, default_output = \
+                self._grab_defaults(fetchedData, *defaults)
+            selected_input, selected_output = default_input, default_output
+            if self._selected_input is not self._default_input:
+                selected_input = self._inputs_by_name.get(
+                    self._selected_input.get('name'), default_input)
+            if self._selected_output is not self._default_output:
+                selected_output = self._outputs_by_name.get(
+                    self._selected_output.get('name'), default_output)
+            self._default_input = default_input
+            self._default_output = default_output
+            self._selected_input = selected_input
+            self._selected_output = selected_output
+        self._devices_known.set()
+        return changed
+
+    def _load_devices(self) -> bool:
+        """Fills the device lists from the cache.
+
+        Returns:
+            bool: False if there is no usable cache
         """
-        fetchedData = sd.query_devices()
-        # parse input and save in _inputs
-        self._inputs = self._parse_input(fetchedData)
-        # parse output and save in _outputs
-        self._outputs = self._parse_output(fetchedData)
-        # set defaults for input and output -> default.device: (in,out)
-        input_id, output_id = sd.default.device
-        self._selected_input, self._selected_output = \
-            self._grab_defaults(fetchedData, input_id, output_id)
+        try:
+            with open(os.fspath(self._devices_path), "r") as file:
+                cached = json.load(file)
+            self._set_devices(cached["devices"], tuple(cached["default"]))
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        return True
+
+    def _save_devices(
+            self,
+            fetchedData: list[dict],
+            defaults: tuple[int, int]
+            ) -> None:
+        os.makedirs(os.fspath(self._devices_path.parent), exist_ok=True)
+        with open(os.fspath(self._devices_path), "w") as file:
+            json.dump({"devices": fetchedData, "default": list(defaults)},
+                      file)
 
     def _parse_input(
             self,
-            fetchedData: sd.DeviceList
+            fetchedData: list[dict]
             ) -> list[dict]:
-        """Function that parses an sd.DeviceList and returns list of
+        """Function that parses a device list and returns list of
         dicts for each input device.
         """
         input_list = []
@@ -198,9 +601,9 @@ class _IO_manager:
 
     def _parse_output(
             self,
-            fetchedData: sd.DeviceList
+            fetchedData: list[dict]
             ) -> list[dict]:
-        """Function that parses an sd.DeviceList and returns list of
+        """Function that parses a device list and returns list of
         dicts for each output device.
         """
         output_list = []
@@ -214,36 +617,15 @@ class _IO_manager:
             deviceList: list[dict],
             input: int,
             output: int) -> tuple[dict, dict]:
-        """function that scans a list of Device dicts and returns
-        a tuple of the input and output devices matching the provided
-        input and output id int parameters.
+        """function that returns a tuple of the input and output devices
+        matching the provided input and output id int parameters, looked
+        up in the indexes built from deviceList.
 
         Returns:
             tuple[dict, dict]: (input_device, output_device)
         """
-        input_device = {}
-        output_device = {}
-        for d in deviceList:
-            if d['index'] == input:
-                input_device = d
-            if d['index'] == output:
-                output_device = d
-        return (input_device, output_device)
-
-    def _match_id(self, device_list: list[dict], id: int) -> dict:
-        """Function that checks whether a device matching the provided id
-        exists in the provided device list
-
-        Returns:
-            dict: Returns dict matching id. Returns empty dict if no matching
-            device found.
-        """
-        match = {}
-        for d in device_list:
-            if d['index'] == id:
-                match = d
-                break
-        return match
+        return (self._inputs_by_index.get(input, {}),
+                self._outputs_by_index.get(output, {}))
 
 
 def IO_manager() -> object:
@@ -1,7 +1,108 @@
 import os
-from pydub import AudioSegment, playback
+import numpy as np
 import soundfile
-import librosa
+from mixer import Mixer
+from streaming import map_wav, StreamingSource
+from effects import (PitchShifter, EffectChain, create_effect, time_stretch,
+                     render_time_stretch)
+from Utilities.RenderCache import RenderCache
+import Loop_Constants.constants as constants
+
+
+class AudioBuffer:
+    '''
+    Block of audio samples stored in a NumPy array shaped
+    (frames, channels), either float32 in [-1, 1] or int16 PCM.
+
+    Slicing, trimming and reversing return new AudioBuffer objects that are
+    views on the same memory, so none of them copy samples. Buffers made
+    with map_file() read their samples from disk on demand.
+    '''
+    __slots__ = ("samples", "sample_rate")
+
+    def __init__(self, samples: np.ndarray, sample_rate: int):
+        if not isinstance(samples, np.ndarray):
+            samples = np.asarray(samples)
+        if samples.ndim == 1:
+            samples = samples[:, np.newaxis]
+        if samples.dtype not in (np.float32, np.int16):
+            samples = samples.astype(np.float32)
+        self.samples = samples
+        self.sample_rate = sample_rate
+
+    @classmethod
+    def from_file(cls, path: str, dtype: str = "float32"):
+        #   Decodes a sound file, dtype is "float32" or "int16"
+        samples, sample_rate = soundfile.read(
+            path,
+            dtype=dtype,
+            always_2d=True
+        )
+        return cls(samples, sample_rate)
+
+    @classmethod
+    def map_file(cls, path: str):
+        #   Memory maps a 16 bit PCM or float wav file without reading it,
+        #   raises ValueError for other formats
+        samples, sample_rate = map_wav(path)
+        return cls(samples, sample_rate)
+
+    @property
+    def is_mapped(self) -> bool:
+        return isinstance(self.samples, np.memmap)
+
+    @property
+    def channels(self) -> int:
+        return self.samples.shape[1]
+
+    @property
+    def frames(self) -> int:
+        return self.samples.shape[0]
+
+    def __len__(self):
+        return self.samples.shape[0]
+
+    def __getitem__(self, index: slice):
+        #   Slices by frame, always returning a view
+        if not isinstance(index, slice):
+            raise TypeError("AudioBuffer only supports slicing by frames")
+        return AudioBuffer(self.samples[index], self.sample_rate)
+
+    def get_length(self) -> float:
+        #   Returns the length in milliseconds
+        return self.frames / self.sample_rate * 1000
+
+    def ms_to_frames(self, milliseconds: float) -> int:
+        return int(round(milliseconds * self.sample_rate / 1000))
+
+    def trim(self, start: int = 0, stop: int = None):
+        #   Returns a view of frames [start, stop)
+        return self[start:stop]
+
+    def reversed(self):
+        #   Returns a view reading the samples backwards
+        return self[::-1]
+
+    def as_float32(self):
+        #   Returns self when already float32, a converted copy otherwise
+        if self.samples.dtype == np.float32:
+            return self
+        return AudioBuffer(
+            self.samples * np.float32(1 / 32768),
+            self.sample_rate
+        )
+
+    def as_int16(self):
+        #   Returns self when already int16, a converted copy otherwise
+        if self.samples.dtype == np.int16:
+            return self
+        scaled = np.clip(self.samples, -1.0, 1.0) * np.iinfo(np.int16).max
+        return AudioBuffer(scaled.astype(np.int16), self.sample_rate)
+
+    def write(self, path: str):
+        #   Writes a wav file, 16 bit PCM for int16 and float for float32
+        subtype = "PCM_16" if self.samples.dtype == np.int16 else "FLOAT"
+        soundfile.write(path, self.samples, self.sample_rate, subtype=subtype)
 
 
 class LoopChannel:
@@ -15,56 +116,143 @@ class LoopChannel:
         for file in args:
             self.tracks.append(Track(file))
 
-        #   The length of the loop in seconds, None if there are no tracks
-        self.length = self.tracks[0].get_length()/1000 if self.tracks else None
+        #   The length of the loop in milliseconds and in sample frames,
+        #   None if there are no tracks. The first track sets the length
+        self.length = None
+        self.frames = None
+        #   Tempo relative to the recorded tempo, see set_tempo_ratio
+        self.tempo_ratio = 1
+        #   Live effects the mixer runs on the sum of all tracks
+        self.effect_chain = EffectChain()
+        #   Linear gain of the whole loop, applied after its effects
+        self.gain = 1.0
+        if self.tracks:
+            self._set_length(self.tracks[0])
 
     def play(self):
-        i = 0
-        while i < len(self.tracks):
-            if self.tracks[i] is not None and self.tracks[i].is_active:
-                self.tracks[i].play()
-            i = i + 1
+        #   All active tracks start together and repeat every self.frames
+        #   samples on the mixer's transport
+        if self.frames is None:
+            return
+        voices = {}
+        for track in self.tracks:
+            if track is not None and track.is_active():
+                voices[track] = track.start_voice()
+        self.effect_chain.reset()
+        Mixer().start_loop(self, self.get_play_frames(), voices,
+                           self.effect_chain)
 
     def stop(self):
-        i = 0
-        while i < len(self.tracks):
-            if self.tracks[i] is not None:
-                self.tracks[i].stop()
-            i = i + 1
-
-    def add_track(self, file):
-        self.tracks.append(Track(file))
+        Mixer().stop_loop(self)
+
+    def get_position(self):
+        #   Returns the playback position in milliseconds, None if stopped
+        position = Mixer().get_position(self)
+        if position is None:
+            return None
+        return position / Mixer().sample_rate * 1000
+
+    def add_track(self, file, reference_tempo=None):
+        #   reference_tempo is the loop's tempo ratio the track was recorded
+        #   at, by default the current one. Later tempo changes stretch the
+        #   track from there
+        track = Track(file)
+        track.reference_tempo = (self.tempo_ratio if reference_tempo is None
+                                 else reference_tempo)
+        self.tracks.append(track)
         if self.length is None:
-            self.length = self.tracks[0].get_length()
+            self._set_length(self.tracks[0])
+
+    def get_play_frames(self):
+        #   Returns the loop length in frames at the current tempo
+        return int(round(self.frames / self.tempo_ratio))
+
+    def set_tempo_ratio(self, ratio):
+        #   Stretches every track to ratio times the recorded tempo, each
+        #   from the tempo it was recorded at. A playing loop switches over
+        #   at its next boundary. Returns (job, track) pairs for the high
+        #   quality renders still needed
+        if self.frames is None:
+            return []
+        self.tempo_ratio = ratio
+        jobs = []
+        for track in self.tracks:
+            if track is not None:
+                job = track.set_tempo_ratio(ratio / track.reference_tempo)
+                if job is not None:
+                    jobs.append((job, track))
+
+        voices = {}
+        for track in Mixer().get_voice_keys(self):
+            voices[track] = (track.voice_samples(), track.effect_chain)
+        Mixer().schedule_loop(self, self.get_play_frames(), voices)
+        return jobs
+
+    def _set_length(self, track):
+        #   The length at the recorded tempo
+        self.frames = int(round(track.get_frames() * track.reference_tempo))
+        self.length = track.get_length() * track.reference_tempo
 
     #   Overwrite sound files to each track
     def overwrite_track(self, file, track_num):
         real_index = track_num - 1
+        if self.tracks[real_index] is not None:
+            Mixer().remove_gain(self.tracks[real_index])
         self.tracks[real_index] = Track(file)
+        self.tracks[real_index].reference_tempo = self.tempo_ratio
 
     def delete_track(self, track_num):
         real_index = track_num - 1
+        if self.tracks[real_index] is not None:
+            self.tracks[real_index].stop()
+            Mixer().remove_gain(self.tracks[real_index])
         self.tracks[real_index] = None
 
+    def set_gain(self, gain: float):
+        #   Sets the level of the whole loop, ramped by the mixer
+        self.gain = gain
+        Mixer().set_gain(self, gain)
+
+    def set_track_gain(self, track_num: int, gain: float):
+        real_index = track_num - 1
+        self.tracks[real_index].set_gain(gain)
+
+    def release(self):
+        #   Drops what the mixer keeps about the loop and its tracks, for
+        #   when the loop is replaced
+        self.stop()
+        Mixer().remove_gain(self)
+        for track in self.tracks:
+            if track is not None:
+                Mixer().remove_gain(track)
+
     def toggle_track(self, track_num):
         real_index = track_num - 1
         self.tracks[real_index].toggle_activation()
 
     def get_data(self):
-        #   Returns data needed for saving loops
-        file_paths = []
+        #   Returns data needed for saving loops. Every track is saved with
+        #   its file's format, content hash, effect state and peaks, see
+        #   Track.get_data, so the loop can be described without decoding
+        track_data = []
         for track in self.tracks:
             if track is not None:
-                file_paths.append(track.get_path())
+                track_data.append(track.get_data())
         save_obj = {
             "loop_name": self.name,
-            "tracks": file_paths
+            "tracks": track_data
         }
         return save_obj
 
     def play_track(self, track_num):
+        #   Joins the loop's transport at its current position, starting
+        #   the loop if no other track is playing
         real_index = track_num - 1
-        self.tracks[real_index].play()
+        track = self.tracks[real_index]
+        if track.is_active():
+            Mixer().add_voice(self, self.get_play_frames(), track,
+                              *track.start_voice(),
+                              loop_effect=self.effect_chain)
 
     def stop_track(self, track_num):
         real_index = track_num - 1
@@ -75,131 +263,389 @@ class LoopChannel:
         real_index = track_num - 1
         self.tracks[real_index].update_effects(reverse, pitch)
 
+    def set_pitch(self, track_num: int, semitones: float, cents: float = 0):
+        real_index = track_num - 1
+        self.tracks[real_index].set_pitch(semitones, cents)
+
+    def bounce(self, path, repetitions=1, subtype="PCM_16",
+               block_size=65536):
+        #   Renders repetitions of the loop into a wav file with every
+        #   active track in its current reverse, pitch, tempo, effect and
+        #   gain state. Blocks are written as they are mixed, so the whole
+        #   mix is never in memory. Returns the number of frames written
+        if self.frames is None:
+            return 0
+        voices = {}
+        gains = {self: self.gain}
+        for track in self.tracks:
+            if track is not None and track.is_active():
+                voices[track] = track.offline_voice()
+                gains[track] = track.gain
+        length = self.get_play_frames()
+        frames = length * repetitions
+        blocks = Mixer().render(
+            self,
+            length,
+            voices,
+            self.effect_chain.copy(Mixer().channels, Mixer().sample_rate),
+            gains,
+            frames,
+            block_size
+        )
+        #   written next to the target first, so a failed bounce never
+        #   leaves a truncated file behind
+        tmp_path = f"{path}.{os.getpid()}.part"
+        try:
+            with soundfile.SoundFile(tmp_path, "w", Mixer().sample_rate,
+                                     Mixer().channels, subtype=subtype,
+                                     format="WAV") as file:
+                for block in blocks:
+                    file.write(block)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return frames
+
+    def add_effect(self, effect_type: str, track_num: int = None,
+                   **params):
+        #   Adds a live effect to the end of the loop's chain, or of a
+        #   track's chain when track_num is given. Returns its position.
+        #   Raises ValueError for unknown effects or parameters
+        if track_num is not None:
+            return self.tracks[track_num - 1].add_effect(effect_type,
+                                                         **params)
+        effect = create_effect(effect_type, Mixer().channels,
+                               Mixer().sample_rate, **params)
+        return self.effect_chain.add(effect)
+
+    def remove_effect(self, position: int, track_num: int = None):
+        if track_num is not None:
+            self.tracks[track_num - 1].remove_effect(position)
+        else:
+            self.effect_chain.remove(position)
+
+    def set_effect_params(self, position: int, track_num: int = None,
+                          **params):
+        #   Raises ValueError for invalid parameters
+        self._get_effect_chain(track_num)[position].set_params(**params)
+
+    def list_effects(self, track_num: int = None):
+        #   Returns (effect type, parameters) for every effect of the chain
+        return [(effect.name, effect.get_params())
+                for effect in self._get_effect_chain(track_num)]
+
+    def _get_effect_chain(self, track_num):
+        if track_num is None:
+            return self.effect_chain
+        return self.tracks[track_num - 1].effect_chain
+
+    def get_effect_costs(self):
+        #   Returns (name, last, peak) seconds of live effect processing per
+        #   mixer block, for the loop's chain and for every track (None
+        #   for deleted tracks)
+        return {
+            "loop": self.effect_chain.get_costs(),
+            "tracks": [
+                track.effect_chain.get_costs() if track is not None else None
+                for track in self.tracks
+            ]
+        }
+
 
 class Track:
     def __init__(self, audio):
         self.path = audio
         '''
-            The effects attribute is a 2D array that holds the different
-            permutations of effects per the following schema:
-            [regular track, regular_upshift, regular_downshift],
-            [reversed, reversed_upshift, reversed_downshift]
+            The effects attribute holds the track in both playback
+            directions: [regular track, reversed]. The reversed entry is a
+            view that reads the regular track backwards, so reversing costs
+            no decode, file or memory. Pitch is not rendered ahead of time,
+            the mixer shifts it live, see set_pitch. WAV files above
+            constants.STREAMING_THRESHOLD_BYTES are memory mapped and
+            streamed to the mixer, see voice_samples
         '''
-        self.effects = []
-        #   Initial call  to cut down on time switching between effects
-        self.create_effects_files()
+        #   Unstretched regular track, the source of every tempo change
+        self._original = self._load_samples(self.path)
+        self.effects = [self._original, self._original.reversed()]
         #   Flag for if a track is reversed, 0 for no, 1 for yes
         self.reverse = 0
-        #   Flag for if a track is pitched up or down.
-        #   0 for none, -1 for down, 1 for up.
+        #   Tempo relative to the recorded tempo and the RenderCache key of
+        #   the high quality stretch for it, None at the recorded tempo
+        self.tempo_ratio = 1
+        self._stretch_key = None
+        #   Tempo ratio of the loop when the track was recorded, see
+        #   LoopChannel.add_track
+        self.reference_tempo = 1
+        #   Pitch shift in semitones, 0 for none
         self.pitch = 0
+        #   effects.PitchShifter, created the first time the pitch changes
+        self.pitch_shifter = None
+        #   Live effects the mixer runs on this track. The pitch shifter
+        #   goes first once there is one
+        self.effect_chain = EffectChain()
+        #   Linear gain of the track, applied after its effects
+        self.gain = 1.0
+        #   StreamingSource per playback direction of a mapped track
+        self._sources = {}
         #   Current version of the track set to play, init to original version
-        self.track = self.effects[self.reverse][self.pitch]
-        self._play_obj = None
+        #   Variants are float32 AudioBuffers in the mixer's sample rate and
+        #   channel count, or memory maps of large files, see _load_samples
+        self.track = self.effects[self.reverse]
         #   Length of the track in milliseconds
-        self.length = len(self.track)
+        self.length = self.track.get_length()
         #   Indicates whether track should be played for loop.play method
         self.active = True
+        #   Peak summary saved with the loop, computed on the first save
+        self._peaks = None
 
     def play(self):
         if self.active is True:
-            self._play_obj = playback._play_with_simpleaudio(self.track)
+            Mixer().play(self, *self.start_voice())
 
     def stop(self):
-        if self._play_obj is not None:
-            self._play_obj.stop()
+        Mixer().stop(self)
+
+    def start_voice(self):
+        #   Returns (samples, effect) for a voice starting from the top
+        self.effect_chain.reset()
+        return self.voice_samples(position=0), self.effect_chain
+
+    def voice_samples(self, position=None):
+        #   Returns what the mixer plays for the current variant: the samples
+        #   array, or a StreamingSource reading a mapped track ahead of
+        #   playback. position is where the voice reads next, by default
+        #   where it is playing now
+        if not self.track.is_mapped:
+            return self.track.samples
+        source = self._sources.get(self.reverse)
+        if source is None:
+            source = self._new_source()
+            self._sources[self.reverse] = source
+        if position is None:
+            position = Mixer().get_voice_position(self)
+        if position is not None:
+            source.prime(position)
+        return source
+
+    def _new_source(self):
+        return StreamingSource(
+            self.effects[0].samples,
+            Mixer().channels,
+            Mixer().sample_rate,
+            reverse=bool(self.reverse)
+        )
+
+    def offline_voice(self):
+        #   Returns (samples, effect) for an offline render of the current
+        #   variant. Effects are copies and a mapped track gets its own
+        #   reader, so rendering never disturbs playback
+        samples = self.track.samples
+        if self.track.is_mapped:
+            samples = self._new_source()
+        return samples, self.effect_chain.copy(Mixer().channels,
+                                               Mixer().sample_rate)
+
+    def set_tempo_ratio(self, ratio):
+        """Stretches the track to ratio times its recorded tempo. Uses the
+        cached high quality stretch when there is one and a quick preview
+        stretch otherwise. The caller hands the new samples to the mixer.
+
+        Returns:
+            tuple: RenderService job (cache_key, function, args) for the
+            high quality stretch, None when no render is needed
+        """
+        self.tempo_ratio = ratio
+        if ratio == 1:
+            self._stretch_key = None
+            self._set_regular_track(self._original)
+            return None
+
+        cache = RenderCache()
+        key = cache.key(self.path, tempo_ratio=round(ratio, 4))
+        self._stretch_key = key
+        stretched_path = cache.get(key)
+        if stretched_path is not None:
+            self._set_regular_track(self._load_samples(stretched_path))
+            return None
+
+        self._set_regular_track(AudioBuffer(
+            time_stretch(self._decoded_original(), ratio, preview=True),
+            self._original.sample_rate
+        ))
+        return (key, render_time_stretch, (self.path, ratio))
+
+    def apply_stretch_render(self, key):
+        #   Swaps the preview stretch for the finished high quality render,
+        #   unless the tempo changed again in the meantime. A playing track
+        #   switches at the next loop boundary, like the preview did
+        if key != self._stretch_key:
+            return
+        stretched_path = RenderCache().get(key)
+        if stretched_path is None:
+            return
+        self._set_regular_track(self._load_samples(stretched_path))
+        Mixer().schedule_voice(self, self.voice_samples(position=0),
+                               self.effect_chain)
+
+    def _set_regular_track(self, regular_track):
+        self.effects = [regular_track, regular_track.reversed()]
+        self.track = self.effects[self.reverse]
+        #   sources of the old variant stop once the mixer lets go of them
+        self._sources = {}
 
     def toggle_activation(self):
         self.active = not self.active
         if self.active is False:
             self.stop()
 
-    def create_effects_files(self):
-        # Create forward track with and without effects
-        regular_track = AudioSegment.from_wav(self.path)
-        forward_pitch_up = self.create_pitch_shift_up(self.path)
-        forward_pitch_down = self.create_pitch_shift_down(self.path)
-        forward_array = [regular_track, forward_pitch_up, forward_pitch_down]
-        self.effects.append(forward_array)
-
-        # Create reversed track
-        reversed_track, reverse_path = self.create_reverse()
-        reverse_pitch_up = self.create_pitch_shift_up(reverse_path)
-        reverse_pitch_down = self.create_pitch_shift_down(reverse_path)
-        reverse_array = [reversed_track, reverse_pitch_up, reverse_pitch_down]
-        self.effects.append(reverse_array)
-
-    def create_pitch_shift_up(self, path):
-        cut_front = self.path[9:]
-        cut_back = cut_front[:-4]
-
-        if path == self.path:
-            new_path = f"../Audio/Mods/{cut_back}_upshift.wav"
-        else:
-            new_path = f"../Audio/Mods/reversed_{cut_back}_upshift.wav"
-
-        if os.path.exists(new_path):
-            return AudioSegment.from_wav(new_path)
-
-        #   y is the data, sr is sample rate
-        y, sr = librosa.load(path)
-        y_high = librosa.effects.pitch_shift(
-            y,
-            sr=sr,
-            n_steps=12,
-            bins_per_octave=12
-        )
-        soundfile.write(new_path, y_high, sr)
-        return AudioSegment.from_wav(new_path)
-
-    def create_pitch_shift_down(self, path):
-        cut_front = self.path[9:]
-        cut_back = cut_front[:-4]
-
-        if path == self.path:
-            new_path = f"../Audio/Mods/{cut_back}_downshift.wav"
-        else:
-            new_path = f"../Audio/Mods/reversed_{cut_back}_downshift.wav"
-
-        if os.path.exists(new_path):
-            return AudioSegment.from_wav(new_path)
-
-        #   y is the data, sr is sample rate
-        y, sr = librosa.load(path)
-        y_high = librosa.effects.pitch_shift(
-            y,
-            sr=sr,
-            n_steps=-12,
-            bins_per_octave=12
+    def _load_samples(self, path):
+        #   Decodes a wav file into the mixer's format. Large files the mixer
+        #   can play as they are get memory mapped instead
+        if os.path.getsize(path) > constants.STREAMING_THRESHOLD_BYTES:
+            try:
+                audio = AudioBuffer.map_file(path)
+            except ValueError:
+                audio = None
+            if (audio is not None and
+                    audio.sample_rate == Mixer().sample_rate and
+                    audio.channels in (1, Mixer().channels)):
+                return audio
+        audio = AudioBuffer.from_file(path)
+        if (audio.sample_rate == Mixer().sample_rate and
+                audio.channels == Mixer().channels):
+            return audio
+        return AudioBuffer(
+            Mixer().conform(audio.samples, audio.sample_rate),
+            Mixer().sample_rate
         )
-        soundfile.write(new_path, y_high, sr)
-        return AudioSegment.from_wav(new_path)
 
-    def create_reverse(self):
-        cut_front = self.path[9:]
-        cut_back = cut_front[:-4]
-        new_path = f"../Audio/Mods/reverse_{cut_back}.wav"
-
-        if os.path.exists(new_path):
-            reverse_track = AudioSegment.from_wav(self.path).reverse()
-            return reverse_track, new_path
-
-        reverse_track = AudioSegment.from_wav(self.path).reverse()
-        reverse_track.export(new_path, format="wav")
-
-        return reverse_track, new_path
+    def _decoded_original(self):
+        #   Returns the unstretched samples in the mixer's format, reading
+        #   the whole file if the track is mapped
+        if not self._original.is_mapped:
+            return self._original.samples
+        return Mixer().conform(self._original.as_float32().samples,
+                               self._original.sample_rate)
 
     def change_effects(self, reverse, pitch):
-        self.track = self.effects[reverse][pitch]
+        self.update_effects(reverse, pitch)
 
     def get_length(self):
         return self.length
 
+    def get_frames(self):
+        return len(self.track)
+
     def get_path(self):
         return self.path
 
+    def get_data(self):
+        #   Returns what a saved loop keeps about the track: the sound
+        #   file's sample rate, frame and channel count as they are on disk,
+        #   its size, modification time and a hash of its content, the
+        #   effect state, the loop tempo it was recorded at and a peak
+        #   summary
+        info = soundfile.info(self.path)
+        stat = os.stat(self.path)
+        return {
+            "path": self.path,
+            "sample_rate": info.samplerate,
+            "frames": info.frames,
+            "channels": info.channels,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "hash": RenderCache().source_hash(self.path),
+            "reverse": self.reverse,
+            "pitch": self.pitch,
+            "active": self.active,
+            "reference_tempo": self.reference_tempo,
+            "peaks": self.get_peaks()
+        }
+
+    def apply_data(self, data: dict):
+        #   Restores the effect state saved by get_data, and its peaks so
+        #   saving the loop again doesn't read the whole track
+        if data.get("reverse", 0) != self.reverse:
+            self.set_reverse(data["reverse"])
+        if data.get("pitch", 0) != self.pitch:
+            self.set_pitch(data["pitch"])
+        self.active = data.get("active", True)
+        if "peaks" in data:
+            self._peaks = list(data["peaks"])
+
+    def get_peaks(self, points=constants.PEAK_SUMMARY_POINTS):
+        #   Returns the highest absolute level of each of points equal
+        #   parts of the unstretched track, 0 to 1, for drawing the track
+        #   before it is loaded. A mapped track is read one part at a time
+        if self._peaks is None or len(self._peaks) != points:
+            samples = self._original.samples
+            scale = 32768 if samples.dtype == np.int16 else 1
+            edges = np.linspace(0, len(samples), points + 1).astype(int)
+            peaks = []
+            for start, stop in zip(edges[:-1], edges[1:]):
+                part = samples[start:stop]
+                if len(part) == 0:
+                    peaks.append(0.0)
+                    continue
+                level = max(float(part.max()), -float(part.min()))
+                peaks.append(round(min(level / scale, 1.0), 4))
+            self._peaks = peaks
+        return self._peaks
+
     def is_active(self):
         return self.active
 
     def update_effects(self, reverse: int, pitch: int):
-        self.track = self.effects[reverse][pitch]
+        #   pitch is an index into constants.pitchChar, see set_pitch for
+        #   arbitrary shifts
+        self.set_pitch(constants.pitchSemitones[pitch])
+        self.set_reverse(reverse)
+
+    def set_reverse(self, reverse: int):
+        #   A playing track switches direction without losing its position
+        self.reverse = reverse
+        self.track = self.effects[reverse]
+        Mixer().set_voice(self, self.voice_samples(), self.effect_chain)
+
+    def set_pitch(self, semitones: float, cents: float = 0):
+        #   Shifts the track by any amount while it plays, gliding from the
+        #   previous shift
+        self.pitch = semitones + cents / 100
+        if self.pitch == 0:
+            #   back to the original pitch: drop the shifter so the track
+            #   loses its latency and smearing again
+            if self.pitch_shifter is not None:
+                position = list(self.effect_chain).index(self.pitch_shifter)
+                self.effect_chain.remove(position)
+                self.pitch_shifter = None
+            return
+        if self.pitch_shifter is None:
+            self.pitch_shifter = PitchShifter(
+                Mixer().channels,
+                Mixer().sample_rate
+            )
+            self.pitch_shifter.set_semitones(self.pitch, glide=False)
+            self.effect_chain.add(self.pitch_shifter, 0)
+        else:
+            self.pitch_shifter.set_semitones(self.pitch)
+
+    def set_gain(self, gain: float):
+        #   Sets the level of the track, ramped by the mixer
+        self.gain = gain
+        Mixer().set_gain(self, gain)
+
+    def add_effect(self, effect_type: str, **params):
+        #   Adds a live effect to the end of the track's chain and returns
+        #   its position. The pitch shifter is managed by set_pitch
+        if effect_type == PitchShifter.name:
+            raise ValueError("Use set_pitch to shift a track")
+        effect = create_effect(effect_type, Mixer().channels,
+                               Mixer().sample_rate, **params)
+        return self.effect_chain.add(effect)
+
+    def remove_effect(self, position: int):
+        effect = self.effect_chain.remove(position)
+        if effect is self.pitch_shifter:
+            self.pitch_shifter = None
+            self.pitch = 0
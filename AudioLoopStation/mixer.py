@@ -0,0 +1,755 @@
+import threading
+import numpy as np
+
+
+class _Voice:
+    '''
+    One playing buffer of a loop and the live effect it goes through
+    '''
+    __slots__ = ("samples", "effect")
+
+    def __init__(self, samples: np.ndarray, effect=None):
+        self.samples = samples
+        # None, or an effects.Effect processing blocks in place. Falsy
+        # effects (an empty effects.EffectChain) are skipped
+        self.effect = effect
+
+
+class _Gain:
+    '''
+    Level of a voice, a loop or the master output. A change is applied as
+    a linear ramp across the next block, so moving a fader never clicks.
+    Other threads only write target; the audio thread owns current.
+    '''
+    __slots__ = ("current", "target")
+
+    def __init__(self, gain: float = 1.0):
+        self.current = gain
+        self.target = gain
+
+    def is_unity(self) -> bool:
+        return self.current == 1.0 and self.target == 1.0
+
+    def apply(self, block: np.ndarray, steps: np.ndarray,
+              ramp: np.ndarray) -> None:
+        """Audio thread: scales block in place. steps holds 1, 2, 3, ...
+        and ramp is scratch space, both at least as long as block
+        """
+        target = self.target
+        current = self.current
+        if current == target:
+            if target != 1.0:
+                block *= target
+            return
+        frames = block.shape[0]
+        ramp = ramp[:frames]
+        np.multiply(steps[:frames], (target - current) / frames, out=ramp)
+        ramp += current
+        block *= ramp[:, np.newaxis]
+        self.current = target
+
+
+class _Transport:
+    '''
+    Playback clock of one loop inside the mixer. Every voice of the loop
+    is read at the transport position, which wraps at exactly length
+    frames, so the loop repeats gaplessly and its tracks stay aligned.
+    The voices are summed on a bus that goes through the loop's effect
+    and gain before it reaches the output.
+    '''
+    __slots__ = ("length", "position", "voices", "pending", "effect",
+                 "clock", "_lock", "_scratch", "_bus", "_steps", "_ramp")
+
+    def __init__(self, length: int, channels: int, block_size: int,
+                 lock: threading.Lock):
+        self.length = length
+        self.position = 0
+        # key -> _Voice. Replaced as a whole, never mutated in place
+        self.voices = {}
+        # (length, voices) to switch to when the loop wraps next, or None
+        self.pending = None
+        # None or effects.Effect applied to the sum of the voices
+        self.effect = None
+        # (position, stream time it was reached at) after the last block
+        # that came with time info, see _Mixer.position_at
+        self.clock = None
+        # the mixer's lock, held by other threads while they edit voices
+        self._lock = lock
+        # voices with an effect are rendered here before being summed
+        self._scratch = np.zeros((block_size, channels), dtype=np.float32)
+        # the voices are summed here when the loop has an effect
+        self._bus = np.zeros((block_size, channels), dtype=np.float32)
+        # gain ramp buffers, see _Gain.apply()
+        self._steps = np.arange(1, block_size + 1, dtype=np.float32)
+        self._ramp = np.zeros(block_size, dtype=np.float32)
+
+    def mix_into(self, outdata: np.ndarray, frames: int,
+                 gains: dict, loop_key) -> None:
+        """Adds frames of the loop to outdata. gains maps voice and loop
+        keys to _Gain objects; keys without one play at unity.
+        """
+        remaining = self.length - self.position
+        # the audio thread never waits: if voices are being edited right
+        # now the switch moves to the following repeat
+        if (self.pending is None or remaining > frames or
+                not self._lock.acquire(blocking=False)):
+            self._mix(outdata, frames, gains, loop_key)
+            return
+        try:
+            # the loop wraps inside this block: finish it with the old
+            # voices and start the next repeat with the pending ones
+            self._mix(outdata[:remaining], remaining, gains, loop_key)
+            self.length, self.voices = self.pending
+            self.pending = None
+            self.position = 0
+        finally:
+            self._lock.release()
+        self._mix(outdata[remaining:], frames - remaining, gains, loop_key)
+
+    def edit_voices(self, edit) -> None:
+        """Applies edit(voices) to copies of the current and the pending
+        voices and swaps them in. Callers hold the mixer's lock.
+        """
+        voices = dict(self.voices)
+        edit(voices)
+        self.voices = voices
+        if self.pending is not None:
+            length, pending_voices = self.pending
+            pending_voices = dict(pending_voices)
+            edit(pending_voices)
+            self.pending = (length, pending_voices)
+
+    def _mix(self, outdata: np.ndarray, frames: int, gains: dict,
+             loop_key) -> None:
+        if frames == 0:
+            return
+        if self._scratch.shape[0] < frames:
+            self._scratch = np.zeros((frames, outdata.shape[1]),
+                                     dtype=np.float32)
+            self._bus = np.zeros((frames, outdata.shape[1]),
+                                 dtype=np.float32)
+            self._steps = np.arange(1, frames + 1, dtype=np.float32)
+            self._ramp = np.zeros(frames, dtype=np.float32)
+        # voices and loops at unity gain without effects are summed
+        # straight into the output
+        loop_gain = gains.get(loop_key)
+        bus = outdata
+        if self.effect or (loop_gain is not None and
+                           not loop_gain.is_unity()):
+            bus = self._bus[:frames]
+            bus.fill(0)
+        for key, voice in self.voices.items():
+            gain = gains.get(key)
+            if not voice.effect and (gain is None or gain.is_unity()):
+                self._read(voice.samples, bus, frames)
+                continue
+            scratch = self._scratch[:frames]
+            scratch.fill(0)
+            # read ahead by the effect's latency, so its delayed output
+            # lines up with the voices without one
+            self._read(voice.samples, scratch, frames,
+                       voice.effect.latency if voice.effect else 0)
+            if voice.effect:
+                voice.effect.process(scratch)
+            if gain is not None:
+                gain.apply(scratch, self._steps, self._ramp)
+            bus[:frames] += scratch
+        if bus is not outdata:
+            if self.effect:
+                self.effect.process(bus)
+            if loop_gain is not None:
+                loop_gain.apply(bus, self._steps, self._ramp)
+            outdata[:frames] += bus
+        self.position = (self.position + frames) % self.length
+
+    def preroll(self) -> None:
+        """Feeds every voice effect with latency the frames it lags by, so
+        the first block comes out aligned and complete. Only for offline
+        renders: the effects must not be playing at the same time.
+        """
+        for voice in self.voices.values():
+            latency = voice.effect.latency if voice.effect else 0
+            if latency == 0:
+                continue
+            block = np.zeros((latency, self._scratch.shape[1]),
+                             dtype=np.float32)
+            self._read(voice.samples, block, latency)
+            voice.effect.process(block)
+
+    def _read(self, samples, out: np.ndarray, frames: int,
+              offset: int = 0):
+        """Adds frames samples from offset frames past the transport
+        position into out, wrapping at the loop length
+        """
+        position = (self.position + offset) % self.length
+        written = 0
+        while written < frames:
+            n = min(frames - written, self.length - position)
+            # tracks shorter than the loop are silent past their end
+            available = len(samples) - position
+            if available > 0:
+                m = n if n < available else available
+                if isinstance(samples, np.ndarray):
+                    out[written:written + m] += samples[position:position + m]
+                else:
+                    # streamed from disk, see streaming.StreamingSource
+                    samples.add_into(out[written:written + m], position)
+            written += n
+            position += n
+            if position >= self.length:
+                position = 0
+
+
+class _Mixer:
+    """
+    Singleton class that owns the single audio output stream of the
+    application. Every playing track is a voice whose samples are summed
+    into the output block by the stream callback, so all tracks of all
+    loops share one device stream and start sample aligned.
+
+    Voices are grouped by loop. Each loop has a transport that repeats it
+    at its exact length in frames, so looping is driven by the audio clock
+    and the GUI only observes get_position(). Voices, loops and the whole
+    output have a gain, see set_gain() and set_master_gain().
+
+    Voices are float32 NumPy arrays shaped (frames, channels) in the
+    mixer's sample rate and channel count, see conform(), or a
+    streaming.StreamingSource for tracks played from disk. Voices and
+    loops can carry a live effect (an effects.Effect such as an
+    EffectChain) that processes their output block by block inside the
+    callback.
+
+    The Mixer() function should be used to access this class.
+
+    DO NOT directly create an object of this class.
+    Examples:
+
+    DON'T   -> my_object = _Mixer()
+    DO      -> my_object = Mixer()
+    """
+    _instance = None
+
+    def __init__(
+            self,
+            sample_rate: int = 44100,
+            channels: int = 2,
+            block_size: int = 512
+            ) -> None:
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.block_size = block_size
+        self._stream = None
+        # loop key -> _Transport. Replaced as a whole (never mutated in
+        # place) so the audio callback can iterate it without taking a lock
+        self._transports = {}
+        # voice or loop key -> _Gain. Replaced as a whole like _transports
+        self._gains = {}
+        self._master_gain = _Gain()
+        self._steps = np.arange(1, block_size + 1, dtype=np.float32)
+        self._ramp = np.zeros(block_size, dtype=np.float32)
+        self._lock = threading.Lock()
+        # input channels of the full duplex stream, None while the stream
+        # is output only, see set_monitoring
+        self.input_channels = None
+        # level the live input is heard at while monitoring
+        self._monitor_gain = _Gain(0.0)
+        # input arranged like the output, then scaled by the monitor gain
+        self._monitor = np.zeros((block_size, channels), dtype=np.float32)
+        # callbacks fed every input block of the duplex stream. A tuple
+        # replaced as a whole like _transports
+        self._input_callbacks = ()
+        # (enabled, input_channels) set_monitoring was asked for while
+        # input callbacks depended on the stream, applied once they are gone
+        self._pending_monitoring = None
+
+    # Public functions
+    def start_loop(self, loop_key, length: int, voices: dict,
+                   effect=None) -> None:
+        """Starts a loop from its beginning with the given voices. Replaces
+        the loop if it is already playing.
+
+        Args:
+            loop_key: hashable owner of the loop, e.g. a LoopChannel object
+            length (int): loop length in frames
+            voices (dict): voice key (e.g. a Track) -> (samples, effect)
+                where samples are float32 shaped (frames, channels) and
+                effect is None or an effects.Effect
+            effect: None or effects.Effect applied to the whole loop
+        """
+        transport = _Transport(length, self.channels, self.block_size,
+                               self._lock)
+        transport.effect = effect
+        transport.voices = {
+            key: _Voice(samples, effect)
+            for key, (samples, effect) in voices.items()
+        }
+        with self._lock:
+            transports = dict(self._transports)
+            transports[loop_key] = transport
+            self._transports = transports
+        self._open_stream()
+
+    def add_voice(self, loop_key, length: int, key, samples,
+                  effect=None, loop_effect=None) -> None:
+        """Adds a voice to a loop at the loop's current position. Starts
+        the loop when it isn't playing yet. Replaces the samples when key
+        is already playing, which keeps its position.
+
+        Args:
+            loop_key: hashable owner of the loop
+            length (int): loop length in frames, used if the loop starts
+            key: hashable owner of the voice
+            samples (np.ndarray): float32 array shaped (frames, channels)
+            effect: None or live effect of the voice
+            loop_effect: None or live effect of the loop, used if the
+                loop starts
+        """
+        with self._lock:
+            transport = self._transports.get(loop_key)
+            if transport is not None:
+                transport.edit_voices(
+                    lambda voices: voices.update({key: _Voice(samples,
+                                                              effect)})
+                    )
+                return
+        self.start_loop(loop_key, length, {key: (samples, effect)},
+                        loop_effect)
+
+    def schedule_loop(self, loop_key, length: int, voices: dict) -> bool:
+        """Replaces the length and voices of a playing loop the next time
+        it wraps, so the change lands on the loop boundary without stopping
+        playback. A later call before the boundary replaces the earlier one.
+
+        Args:
+            loop_key: hashable owner of the loop
+            length (int): new loop length in frames
+            voices (dict): voice key -> (samples, effect), see start_loop()
+
+        Returns:
+            bool: False if the loop isn't playing
+        """
+        with self._lock:
+            transport = self._transports.get(loop_key)
+            if transport is None:
+                return False
+            transport.pending = (length, {
+                key: _Voice(samples, effect)
+                for key, (samples, effect) in voices.items()
+            })
+            return True
+
+    def set_voice(self, key, samples, effect=None) -> None:
+        """Swaps the samples and effect of a playing voice without moving
+        its position, e.g. after reversing it. Does nothing if key isn't
+        playing.
+        """
+        def replace(voices):
+            if key in voices:
+                voices[key] = _Voice(samples, effect)
+
+        with self._lock:
+            for transport in self._transports.values():
+                transport.edit_voices(replace)
+
+    def schedule_voice(self, key, samples, effect=None) -> None:
+        """Swaps the samples and effect of a playing voice the next time
+        its loop wraps, e.g. for a render of a different length. Joins a
+        change already scheduled with schedule_loop(). Does nothing if key
+        isn't playing.
+        """
+        with self._lock:
+            for transport in self._transports.values():
+                if transport.pending is not None:
+                    length, voices = transport.pending
+                elif key in transport.voices:
+                    length, voices = transport.length, transport.voices
+                else:
+                    continue
+                if key in voices:
+                    voices = dict(voices)
+                    voices[key] = _Voice(samples, effect)
+                    transport.pending = (length, voices)
+
+    def play(self, key, samples: np.ndarray, effect=None) -> None:
+        """Loops samples on their own, using key as loop and voice key"""
+        self.start_loop(key, len(samples), {key: (samples, effect)})
+
+    def stop(self, key) -> None:
+        """Stops the voice playing under key. A loop stops once its last
+        voice is stopped.
+        """
+        with self._lock:
+            transports = {}
+            for loop_key, transport in self._transports.items():
+                transport.edit_voices(lambda voices: voices.pop(key, None))
+                if transport.voices:
+                    transports[loop_key] = transport
+            self._transports = transports
+
+    def stop_loop(self, loop_key) -> None:
+        """Stops a loop and all of its voices"""
+        with self._lock:
+            transports = dict(self._transports)
+            transports.pop(loop_key, None)
+            self._transports = transports
+
+    def is_playing(self, key) -> bool:
+        """Checks whether key is a playing loop or voice"""
+        transports = self._transports
+        if key in transports:
+            return True
+        return any(key in t.voices for t in transports.values())
+
+    def get_voice_keys(self, loop_key) -> list:
+        """Returns the keys of the voices playing in a loop"""
+        transport = self._transports.get(loop_key)
+        return [] if transport is None else list(transport.voices.keys())
+
+    def get_position(self, loop_key) -> int:
+        """Returns the position of a playing loop in frames.
+
+        Returns:
+            int: position within [0, length). None if the loop isn't playing
+        """
+        transport = self._transports.get(loop_key)
+        return None if transport is None else transport.position
+
+    def position_at(self, loop_key, when: float) -> tuple[int, int]:
+        """Returns where a playing loop is, was or will be at a time of the
+        audio backend's stream clock, e.g. the time an input block arrived.
+        Assumes the loop keeps its length in between.
+
+        Args:
+            loop_key: key the loop was started with
+            when (float): stream time in seconds
+
+        Returns:
+            tuple[int, int]: (position, length) in frames. None if the loop
+            isn't playing or hasn't output a block with time info yet
+        """
+        transport = self._transports.get(loop_key)
+        if transport is None or transport.clock is None:
+            return None
+        position, clock_time = transport.clock
+        offset = int(round((when - clock_time) * self.sample_rate))
+        return (position + offset) % transport.length, transport.length
+
+    def set_gain(self, key, gain: float) -> None:
+        """Sets the linear gain of a voice or loop key, playing or not. The
+        level ramps to the new value over the next block.
+
+        Args:
+            key: voice key (e.g. a Track) or loop key (e.g. a LoopChannel)
+            gain (float): linear gain, 1 leaves the level unchanged
+        """
+        with self._lock:
+            current = self._gains.get(key)
+            if current is not None:
+                current.target = gain
+                return
+            if gain == 1.0:
+                return
+            gains = dict(self._gains)
+            # a new key starts at unity so its first change ramps too
+            gains[key] = _Gain()
+            gains[key].target = gain
+            self._gains = gains
+
+    def get_gain(self, key) -> float:
+        gain = self._gains.get(key)
+        return 1.0 if gain is None else gain.target
+
+    def remove_gain(self, key) -> None:
+        """Forgets the gain of a key that is gone, e.g. a deleted track"""
+        with self._lock:
+            gains = dict(self._gains)
+            gains.pop(key, None)
+            self._gains = gains
+
+    def set_master_gain(self, gain: float) -> None:
+        """Sets the linear gain of the whole output"""
+        self._master_gain.target = gain
+
+    def get_master_gain(self) -> float:
+        return self._master_gain.target
+
+    def set_monitoring(self, enabled: bool, gain: float = None,
+                       input_channels: int = 1) -> None:
+        """Switches the output to a full duplex stream that also reads the
+        input selected in io_manager, at the low latencies the devices
+        report, and mixes the input into the output. The recorder reads
+        its blocks from the same stream, see add_input_callback. While it
+        does, the stream isn't switched; the switch waits until the last
+        input callback is removed, the gain changes at once.
+
+        Args:
+            enabled (bool): True for the duplex stream, False to go back
+                to an output only stream
+            gain (float): linear monitor level, unchanged when None
+            input_channels (int): input channels the stream reads
+        """
+        if gain is not None:
+            self.set_monitor_gain(gain)
+        channels = input_channels if enabled else None
+        if channels == self.input_channels and self._stream is not None:
+            self._pending_monitoring = None
+            return
+        if self._input_callbacks:
+            print("Monitoring changes once the recording stops")
+            self._pending_monitoring = (enabled, input_channels)
+            return
+        self.input_channels = channels
+        self._close_stream()
+        if enabled or self._transports:
+            self._open_stream()
+
+    def is_monitoring(self) -> bool:
+        return self.input_channels is not None
+
+    def set_monitor_gain(self, gain: float) -> None:
+        """Sets the linear level the input is heard at, ramped like the
+        other gains. Input channels map to output channels one to one, a
+        mono input plays on every output channel.
+        """
+        self._monitor_gain.target = gain
+
+    def get_monitor_gain(self) -> float:
+        return self._monitor_gain.target
+
+    def add_input_callback(self, callback) -> None:
+        """Feeds every input block of the duplex stream to
+        callback(indata, frames, time, status) on the audio thread
+        """
+        with self._lock:
+            self._input_callbacks = self._input_callbacks + (callback,)
+
+    def remove_input_callback(self, callback) -> None:
+        """Stops feeding callback, then makes a monitoring change that
+        waited for it, see set_monitoring
+        """
+        with self._lock:
+            self._input_callbacks = tuple(
+                other for other in self._input_callbacks
+                if other != callback)
+        pending = self._pending_monitoring
+        if pending is not None and not self._input_callbacks:
+            self._pending_monitoring = None
+            self.set_monitoring(*pending)
+
+    def get_voice_position(self, key) -> int:
+        """Returns the frame a playing voice reads next, None if key isn't
+        playing
+        """
+        for transport in self._transports.values():
+            if key in transport.voices:
+                return transport.position
+        return None
+
+    def get_effect_costs(self) -> dict:
+        """Returns the processing time of every live effect.
+
+        Returns:
+            dict: voice or loop key -> (last, peak) seconds spent in its
+            effect per callback block
+        """
+        costs = {}
+        for loop_key, transport in self._transports.items():
+            if transport.effect:
+                costs[loop_key] = (transport.effect.last_cost,
+                                   transport.effect.peak_cost)
+            for key, voice in transport.voices.items():
+                if voice.effect:
+                    costs[key] = (voice.effect.last_cost,
+                                  voice.effect.peak_cost)
+        return costs
+
+    def conform(self, samples: np.ndarray, sample_rate: int) -> np.ndarray:
+        """Converts decoded audio into the mixer's format.
+
+        Args:
+            samples (np.ndarray): array shaped (frames, channels)
+            sample_rate (int): sample rate of samples
+
+        Returns:
+            np.ndarray: C-contiguous float32 array shaped
+            (frames, self.channels) at self.sample_rate
+        """
+        samples = np.asarray(samples, dtype=np.float32)
+        if samples.ndim == 1:
+            samples = samples[:, np.newaxis]
+        if sample_rate != self.sample_rate:
+            import soxr
+            samples = soxr.resample(samples, sample_rate, self.sample_rate)
+        if samples.shape[1] != self.channels:
+            # mono is spread to every output channel, anything else is
+            # downmixed to mono first
+            if samples.shape[1] != 1:
+                samples = samples.mean(axis=1, keepdims=True)
+            samples = np.repeat(samples, self.channels, axis=1)
+        return np.ascontiguousarray(samples, dtype=np.float32)
+
+    def render(self, loop_key, length: int, voices: dict, effect=None,
+               gains: dict = None, frames: int = None,
+               block_size: int = 8192):
+        """Mixes a loop offline, as fast as the CPU allows, with the same
+        code the output stream uses. Nothing is shared with playback, so
+        voices and effect must not be playing at the same time.
+
+        Args:
+            loop_key: key of the loop in gains
+            length (int): loop length in frames
+            voices (dict): voice key -> (samples, effect), see start_loop()
+            effect: None or effects.Effect applied to the whole loop
+            gains (dict): voice or loop key -> linear gain, unity if missing
+            frames (int): frames to render, one repetition by default
+            block_size (int): frames mixed at a time
+
+        Yields:
+            np.ndarray: consecutive float32 blocks shaped
+            (frames, self.channels), clipped like the output. The same
+            buffer is reused, so use each block before asking for the next
+        """
+        transport = _Transport(length, self.channels, block_size,
+                               threading.Lock())
+        transport.effect = effect
+        transport.voices = {
+            key: _Voice(samples, voice_effect)
+            for key, (samples, voice_effect) in voices.items()
+        }
+        transport.preroll()
+        gains = {key: _Gain(gain) for key, gain in (gains or {}).items()}
+        block = np.zeros((block_size, self.channels), dtype=np.float32)
+        remaining = length if frames is None else frames
+        while remaining > 0:
+            n = min(block_size, remaining)
+            out = block[:n]
+            out.fill(0)
+            transport.mix_into(out, n, gains, loop_key)
+            np.clip(out, -1.0, 1.0, out=out)
+            yield out
+            remaining -= n
+
+    def close(self) -> None:
+        """Stops all voices and closes the output stream"""
+        with self._lock:
+            self._transports = {}
+        self._close_stream()
+
+    # Private functions
+    def _open_stream(self) -> None:
+        """Opens the output stream on the output selected in io_manager,
+        through the current audio backend. The stream stays open and
+        outputs silence while no loop plays. While monitoring it is a full
+        duplex stream that also reads the selected input.
+        """
+        if self._stream is not None:
+            return
+        from audio_backend import AudioBackend
+        from io_manager import IO_manager
+
+        output = IO_manager().get_selected_output()
+        # latency auto_tune found stable, else the sounddevice default
+        latency = IO_manager().get_stream_settings(self.sample_rate).get(
+            'latency', 'high')
+        source = IO_manager().get_selected_input()
+        # the auto_tune probe may be opening the same device
+        with IO_manager().stream_lock:
+            try:
+                if self.input_channels is None:
+                    self._stream = AudioBackend().output_stream(
+                        samplerate=self.sample_rate,
+                        blocksize=self.block_size,
+                        device=output.get('index'),
+                        channels=self.channels,
+                        dtype='float32',
+                        latency=latency,
+                        callback=self._callback
+                        )
+                else:
+                    self._stream = AudioBackend().duplex_stream(
+                        samplerate=self.sample_rate,
+                        blocksize=self.block_size,
+                        device=(source.get('index'), output.get('index')),
+                        channels=(self.input_channels, self.channels),
+                        dtype='float32',
+                        latency=(
+                            source.get('default_low_input_latency', 'low'),
+                            output.get('default_low_output_latency', 'low')
+                            ),
+                        callback=self._duplex_callback
+                        )
+                self._stream.start()
+            except Exception as e:
+                # PortAudioError when the device is busy, went away or
+                # rejects the settings. The next loop started tries again
+                print(f"Unable to start audio output: {e}")
+                if self._stream is not None:
+                    self._stream.close()
+                    self._stream = None
+
+    def _close_stream(self) -> None:
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+
+    def _callback(self, outdata, frames, time, status):
+        """Audio thread: sums every loop into the output block"""
+        self._mix_block(outdata, frames, time)
+        np.clip(outdata, -1.0, 1.0, out=outdata)
+
+    def _duplex_callback(self, indata, outdata, frames, time, status):
+        """Audio thread: mixes the loops and the monitored input into the
+        output, then hands the input block on to the recorder
+        """
+        self._mix_block(outdata, frames, time)
+        gain = self._monitor_gain
+        if gain.current != 0 or gain.target != 0:
+            # only a stream that ignores the block size allocates here
+            if self._monitor.shape[0] < frames:
+                self._monitor = np.zeros((frames, outdata.shape[1]),
+                                         dtype=np.float32)
+                self._steps = np.arange(1, frames + 1, dtype=np.float32)
+                self._ramp = np.zeros(frames, dtype=np.float32)
+            monitor = self._monitor[:frames]
+            if indata.shape[1] == 1:
+                monitor[:] = indata
+            else:
+                shared = min(indata.shape[1], monitor.shape[1])
+                monitor[:, :shared] = indata[:, :shared]
+                monitor[:, shared:] = 0
+            gain.apply(monitor, self._steps, self._ramp)
+            outdata += monitor
+        np.clip(outdata, -1.0, 1.0, out=outdata)
+        for callback in self._input_callbacks:
+            callback(indata, frames, time, status)
+
+    def _mix_block(self, outdata, frames, time):
+        """Audio thread: sums every loop into outdata at the master gain"""
+        outdata.fill(0)
+        gains = self._gains
+        for loop_key, transport in self._transports.items():
+            transport.mix_into(outdata, frames, gains, loop_key)
+            if time is not None:
+                transport.clock = (transport.position, time.currentTime +
+                                   frames / self.sample_rate)
+        if not self._master_gain.is_unity():
+            if self._steps.shape[0] < frames:
+                self._steps = np.arange(1, frames + 1, dtype=np.float32)
+                self._ramp = np.zeros(frames, dtype=np.float32)
+            self._master_gain.apply(outdata, self._steps, self._ramp)
+
+
+def Mixer() -> object:
+    """Factory function that produces a _Mixer object. Uses the block
+    size IO_manager().auto_tune found for the selected output, if any.
+
+    Returns:
+        _Mixer object
+    """
+    if _Mixer._instance is None:
+        from io_manager import IO_manager
+        settings = IO_manager().get_stream_settings()
+        _Mixer._instance = _Mixer(
+            block_size=settings.get('blocksize', 512))
+    return _Mixer._instance
@@ -1,7 +1,275 @@
-import sounddevice as sd
-from scipy.io.wavfile import write
 import wave
 import os
+import time
+import threading
+from collections import deque
+import numpy as np
+import soundfile
+from scipy import signal
+from loop import AudioBuffer
+from mixer import Mixer
+from io_manager import IO_manager
+from audio_backend import AudioBackend
+
+
+def measure_latency(sample_rate=44100, channels=2, burst_frames=4096,
+                    capture_seconds=2.0, timeout=5.0) -> int:
+    """Measures the round trip latency of the audio backend: the time
+    from an output callback writing a frame until an input callback
+    receives it, with the output connected back to the input by a cable
+    or a microphone. A noise burst is played and found in the recording
+    by cross correlation.
+
+    Args:
+        sample_rate (int): sample rate of both streams
+        channels (int): output channels, the burst plays on all of them
+        burst_frames (int): length of the noise burst
+        capture_seconds (float): how long the input is recorded for, must
+            cover the burst plus the latency
+        timeout (float): seconds to wait for the recording
+
+    Returns:
+        int: latency in frames, None when the burst wasn't heard
+    """
+    burst = np.random.default_rng(0).uniform(
+        -0.5, 0.5, burst_frames).astype(np.float32)
+    # the burst starts after 100 ms of silence
+    lead = sample_rate // 10
+    capture = np.zeros(int(capture_seconds * sample_rate), dtype=np.float32)
+    played = 0
+    captured = 0
+    emit_time = None
+    capture_time = None
+    done = threading.Event()
+
+    def play(outdata, frames, time, status):
+        nonlocal played, emit_time
+        outdata.fill(0)
+        start = max(lead - played, 0)
+        offset = played + start - lead
+        if start < frames and offset < burst_frames:
+            count = min(frames - start, burst_frames - offset)
+            outdata[start:start + count] = \
+                burst[offset:offset + count, np.newaxis]
+            if offset == 0:
+                emit_time = time.currentTime + start / sample_rate
+        played += frames
+
+    def record(indata, frames, time, status):
+        nonlocal captured, capture_time
+        if capture_time is None:
+            capture_time = time.currentTime
+        count = min(frames, len(capture) - captured)
+        capture[captured:captured + count] = indata[:count, 0]
+        captured += count
+        if captured == len(capture):
+            done.set()
+
+    backend = AudioBackend()
+    output_device = IO_manager().get_selected_output().get('index')
+    input_device = IO_manager().get_selected_input().get('index')
+    # the auto_tune probe may be opening the same output
+    with IO_manager().stream_lock:
+        output = backend.output_stream(
+            samplerate=sample_rate,
+            device=output_device,
+            channels=channels,
+            dtype='float32',
+            callback=play
+            )
+        source = backend.input_stream(
+            samplerate=sample_rate,
+            device=input_device,
+            channels=1,
+            dtype='float32',
+            callback=record
+            )
+        # listen before playing, the burst must not go out before the
+        # capture starts
+        source.start()
+        output.start()
+    done.wait(timeout)
+    source.stop()
+    output.stop()
+    source.close()
+    output.close()
+
+    if emit_time is None or capture_time is None or captured < burst_frames:
+        return None
+    recording = capture[:captured]
+    correlation = signal.correlate(recording, burst, mode="valid",
+                                   method="fft")
+    found = int(np.argmax(correlation))
+    heard = recording[found:found + burst_frames]
+    # normalised correlation, 1 for a perfect copy of the burst
+    similarity = correlation[found] / (
+        np.linalg.norm(burst) * np.linalg.norm(heard) + 1e-12)
+    if similarity < 0.5:
+        return None
+    return max(int(round(
+        (capture_time + found / sample_rate - emit_time) * sample_rate)), 0)
+
+
+class TakeWriter:
+    """Streams a take to a 16 bit wav file while it is recorded. The audio
+    thread copies blocks into preallocated chunks and hands every full one
+    to a writer thread through a deque, whose append and popleft need no
+    lock. The writer converts and writes each chunk, then gives it back
+    for reuse, so memory stays the same however long the take runs. The
+    file header is flushed every flush_interval seconds, so a crash keeps
+    what was recorded up to then. The take can be placed sample
+    accurately without rewriting it: skip drops leading frames before
+    they are written, pad puts silence before them, limit stops accepting
+    frames once the file reaches that length and close can cut the end
+    off the file.
+    """
+    def __init__(self, path: str, sample_rate: int, channels=1,
+                 chunk_frames=16384, spare_chunks=16, flush_interval=1.0,
+                 poll_interval=0.05):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.chunk_frames = chunk_frames
+        self.spare_chunks = spare_chunks
+        self.flush_interval = flush_interval
+        self.poll_interval = poll_interval
+        # frames written to the file so far
+        self.frames = 0
+        # frames lost because the writer fell behind, should stay 0
+        self.dropped = 0
+        # leading frames still to drop, and frames of silence written
+        # before the first one kept. Set by the audio thread before its
+        # first block
+        self.skip = 0
+        self.pad = 0
+        # frames accepted from the audio thread
+        self.received = 0
+        # file length after which frames are no longer accepted, or None
+        self.limit = None
+        # length the file is cut to when closed, see close
+        self._cut = None
+        self._padded = False
+        # chunks created, only grows when the writer falls behind
+        self.allocated = 0
+        self._spare = deque(self._new_chunk() for _ in range(spare_chunks))
+        # full chunks waiting for the writer
+        self._ready = deque()
+        self._chunk = None
+        # frames written to self._chunk
+        self._fill = chunk_frames
+        self._scratch = np.empty((chunk_frames, channels), dtype=np.float32)
+        self._pcm = np.empty((chunk_frames, channels), dtype=np.int16)
+        self._closed = False
+        self._file = soundfile.SoundFile(path, "w", sample_rate, channels,
+                                         subtype="PCM_16", format="WAV")
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, block: np.ndarray) -> None:
+        """Audio thread: copies block in place after the frames so far"""
+        frames = len(block)
+        offset = min(self.skip, frames)
+        self.skip -= offset
+        if self.limit is not None:
+            frames = min(frames, offset + max(
+                self.limit - self.pad - self.received, 0))
+        while offset < frames:
+            if self._fill == self.chunk_frames:
+                if self._chunk is not None:
+                    self._ready.append(self._chunk)
+                    self._chunk = None
+                if not self._spare:
+                    self.dropped += frames - offset
+                    return
+                self._chunk = self._spare.popleft()
+                self._fill = 0
+            count = min(frames - offset, self.chunk_frames - self._fill)
+            self._chunk[self._fill:self._fill + count] = \
+                block[offset:offset + count]
+            self._fill += count
+            self.received += count
+            offset += count
+
+    @property
+    def length(self) -> int:
+        #   Frames the file has once everything received is written
+        return self.pad + self.received if self.received else 0
+
+    @property
+    def complete(self) -> bool:
+        #   True once the take has reached its limit
+        return self.limit is not None and self.length >= self.limit
+
+    def close(self, cut: int = None) -> int:
+        """Writes what is left and closes the file. Call once no more
+        blocks arrive.
+
+        Args:
+            cut (int): when given, the file is cut to this many frames if
+                it is longer
+
+        Returns:
+            int: frames in the file
+        """
+        if self._chunk is not None and self._fill:
+            self._ready.append(self._chunk[:self._fill])
+        self._chunk = None
+        self._cut = cut
+        self._closed = True
+        self._thread.join()
+        return self.frames
+
+    def _run(self) -> None:
+        last_flush = time.monotonic()
+        try:
+            while True:
+                # chunks handed over before close are all written
+                closed = self._closed
+                while self._ready:
+                    chunk = self._ready.popleft()
+                    if not self._padded:
+                        self._write_silence(self.pad)
+                        self._padded = True
+                    self._write_chunk(chunk)
+                    if len(chunk) == self.chunk_frames:
+                        self._spare.append(chunk)
+                if closed:
+                    return
+                while len(self._spare) < self.spare_chunks // 2:
+                    self._spare.append(self._new_chunk())
+                if time.monotonic() - last_flush >= self.flush_interval:
+                    self._file.flush()
+                    last_flush = time.monotonic()
+                time.sleep(self.poll_interval)
+        finally:
+            if self._cut is not None and self.frames > self._cut:
+                self.frames = self._cut
+                self._file.truncate(self.frames)
+            self._file.close()
+
+    def _write_chunk(self, chunk: np.ndarray) -> None:
+        #   Converts like AudioBuffer.as_int16, into preallocated buffers
+        frames = len(chunk)
+        scratch = self._scratch[:frames]
+        np.clip(chunk, -1.0, 1.0, out=scratch)
+        scratch *= np.iinfo(np.int16).max
+        pcm = self._pcm[:frames]
+        np.copyto(pcm, scratch, casting="unsafe")
+        self._file.write(pcm)
+        self.frames += frames
+
+    def _write_silence(self, frames: int) -> None:
+        pcm = self._pcm
+        pcm.fill(0)
+        while frames > 0:
+            count = min(frames, len(pcm))
+            self._file.write(pcm[:count])
+            self.frames += count
+            frames -= count
+
+    def _new_chunk(self) -> np.ndarray:
+        self.allocated += 1
+        return np.zeros((self.chunk_frames, self.channels), dtype=np.float32)
 
 
 class Recorder:
@@ -9,59 +277,261 @@ class Recorder:
         self.output_directory = output_directory
         self.sample_rate = sample_rate
         self.is_recording = False
+        # TakeWriter per recorded input channel, in the order of
+        # self._input_channels
         self.recorded_data = []
+        self._input_channels = [0]
+        # prefix the takes being recorded are named with
+        self._file_name_prefix = None
+        # round trip latency in frames, see calibrate_latency and
+        # load_latency. Takes are shifted earlier by it
+        self.latency_frames = 0
+        # mixer loop key the takes are aligned to, and the requested
+        # quantum in frames, None for the loop length
+        self._loop = None
+        self._quantum = None
+        # length of that loop and the quantum the takes snap to, once the
+        # first block has been aligned. Takes without a playing loop have
+        # no loop length and snap to the quantum from their own start
+        self._loop_frames = None
+        self._quantum_frames = None
+        # True until the first block of a take has been aligned
+        self._align = False
+        # paths of the most recent takes, one per input channel, None for
+        # empty ones
+        self.last_recordings = []
+        # AudioBuffer of the most recent take of the first input channel,
+        # mapped from its file
+        self.last_take = None
 
-    def start_recording(self):
-        """Starts audio recording."""
+    def load_latency(self):
+        """Compensates takes by the latency calibrated earlier for the
+        selected input and output, none if they were never calibrated.
+        Waits for the devices if they are still being listed"""
+        self.latency_frames = IO_manager().get_round_trip_latency(
+            self.sample_rate)
+
+    def calibrate_latency(self):
+        """Measures the round trip latency with measure_latency and
+        compensates later takes by it. The output has to be connected to
+        the input while this runs. The result is saved per device pair,
+        see load_latency. Returns the latency in frames, None when it
+        couldn't be measured."""
+        latency = measure_latency(self.sample_rate, Mixer().channels)
+        if latency is None:
+            print("Latency calibration failed. Is the output connected "
+                  "to the input?")
+            return None
+        self.latency_frames = latency
+        IO_manager().set_round_trip_latency(latency, self.sample_rate)
+        print(f"Round trip latency is {latency} frames")
+        return latency
+
+    def start_recording(self, file_name_prefix="recording", loop=None,
+                        quantum=None, input_channels=None):
+        """Starts audio recording from the input selected in io_manager,
+        streaming it to a file with a unique name. While the mixer is
+        monitoring, the input comes from its duplex stream.
+        input_channels lists the channels of the input to record, by
+        default the first one.
+        They are captured by one stream and each goes into its own file,
+        to become its own track.
+        With loop, the key of a loop playing in the mixer, recording
+        is armed: the take starts on the next boundary as the performer
+        heard it, found on the transport clock. Boundaries are every
+        quantum frames (e.g. a bar) from the loop's start, or the loop's
+        start only. The file starts at the loop's start, with silence up
+        to the punch in, so it plays in place as a track, and ends with
+        the loop's first repeat, the part a track plays. Without a
+        playing loop the take starts at once and a quantum still makes it
+        end on a whole number of quanta, e.g. bars."""
+        input_channels = list(input_channels or [0])
+        device = IO_manager().get_selected_input()
+        available = device.get('max_input_channels', 1)
+        if Mixer().is_monitoring():
+            # the takes come from the mixer's duplex stream
+            available = Mixer().input_channels
+        if max(input_channels) >= available or min(input_channels) < 0:
+            print(f"Unable to record input channels {input_channels}. "
+                  f"The input has {available}")
+            return
         if not os.path.exists(self.output_directory):
             os.makedirs(self.output_directory)
+        self._file_name_prefix = file_name_prefix
+        self._input_channels = input_channels
+        self._loop = loop
+        self._quantum = quantum
+        self._loop_frames = None
+        self._quantum_frames = None
+        self._align = True
+        self.recorded_data = [
+            TakeWriter(
+                self._unique_path(file_name_prefix, channel),
+                self.sample_rate,
+                channels=1
+                )
+            for channel in input_channels
+        ]
         self.is_recording = True
-        self.recorded_data = []
         print("Recording started...")
-        sd.default.samplerate = self.sample_rate
-        sd.default.channels = 1
-        self.stream = sd.InputStream(callback=self._callback)
+        if Mixer().is_monitoring():
+            # one callback passes each block from the input to the output
+            # and to the takes
+            self.stream = None
+            Mixer().add_input_callback(self._callback)
+            return
+        self.stream = AudioBackend().input_stream(
+            samplerate=self.sample_rate,
+            device=device.get('index'),
+            channels=max(input_channels) + 1,
+            callback=self._callback
+            )
         self.stream.start()
 
     def _callback(self, indata, frames, time, status):
-        """Callback function for streaming audio input."""
+        """Callback function for streaming audio input. Each take gets a
+        view of its channel, which it copies straight into its buffer."""
         if self.is_recording:
-            self.recorded_data.append(indata.copy())
+            if self._align:
+                self._align = False
+                self._align_takes(time)
+            for take, channel in zip(self.recorded_data,
+                                     self._input_channels):
+                take.write(indata[:, channel:channel + 1])
 
-    def stop_recording(self, file_name_prefix="recording"):
-        """Stops audio recording and saves the file with a unique name."""
-        import numpy as np
-        import time
+    def _align_takes(self, time):
+        """Sets how many frames of the takes to drop, counted from the
+        first block, and how much silence goes before them, so they start
+        latency compensated on the next boundary of their loop."""
+        skip, pad = self.latency_frames, 0
+        clock = None
+        if self._loop is not None and time is not None:
+            clock = Mixer().position_at(self._loop, time.currentTime)
+        if clock is not None:
+            position, self._loop_frames = clock
+            self._quantum_frames = min(self._quantum or self._loop_frames,
+                                       self._loop_frames)
+            # loop position the first frame was played at
+            heard = (position - self.latency_frames) % self._loop_frames
+            start = self._next_boundary(heard)
+            skip, pad = start - heard, start % self._loop_frames
+            # the loop only plays the first repeat of a track
+            limit = self._loop_frames
+        else:
+            self._quantum_frames = self._quantum
+            limit = None
+        for take in self.recorded_data:
+            take.skip = skip
+            take.pad = pad
+            take.limit = limit
+
+    def _next_boundary(self, frame):
+        """Returns the first boundary at or after a frame of the take's
+        file, which starts at the loop's start"""
+        if self._loop_frames is None:
+            return -(-frame // self._quantum_frames) * self._quantum_frames
+        repeat_start = frame - frame % self._loop_frames
+        boundary = -(-(frame % self._loop_frames) // self._quantum_frames)
+        return repeat_start + min(boundary * self._quantum_frames,
+                                  self._loop_frames)
 
+    def _last_boundary(self, frame):
+        """Returns the last boundary at or before a frame of the take's
+        file"""
+        if self._loop_frames is None:
+            return frame // self._quantum_frames * self._quantum_frames
+        repeat_start = frame - frame % self._loop_frames
+        return repeat_start + (frame % self._loop_frames //
+                               self._quantum_frames * self._quantum_frames)
+
+    def punch_out(self):
+        """Ends the takes on the next boundary and returns at once. They
+        keep recording until then, see is_take_complete. Takes without a
+        quantum or a loop to snap to end now."""
+        if not self.recorded_data:
+            return
+        take = self.recorded_data[0]
+        if self._quantum_frames is None:
+            limit = take.length
+        else:
+            # at least one quantum after the punch in
+            limit = self._next_boundary(max(take.length, take.pad + 1))
+        for take in self.recorded_data:
+            take.limit = limit
+
+    def frames_to_punch_out(self):
+        """Returns how many frames punched out takes still need before
+        they are complete, 0 when they are"""
+        return max((max(take.limit - take.length, 0)
+                    for take in self.recorded_data
+                    if take.limit is not None), default=0)
+
+    def is_take_complete(self):
+        """Returns True once punched out takes have reached their end and
+        can be stopped without cutting them"""
+        return all(take.complete for take in self.recorded_data)
+
+    def stop_recording(self, file_name_prefix="recording"):
+        """Stops audio recording. The takes are already on disk, they are
+        only renamed when file_name_prefix differs from the one they
+        started with. Aligned or quantized takes stopped without punch_out
+        are cut back to their last boundary. Returns the path of the first
+        input channel's take, see last_recordings for all of them.
+        """
         if not self.is_recording:
             print("No recording in progress.")
             return None
         print("Recording stopped. Saving audio file...")
         self.is_recording = False
-        self.stream.stop()
-        self.stream.close()
+        if self.stream is None:
+            Mixer().remove_input_callback(self._callback)
+        else:
+            self.stream.stop()
+            self.stream.close()
+        takes = self.recorded_data
+        self.recorded_data = []
+        cut = None
+        if self._quantum_frames is not None:
+            cut = self._last_boundary(takes[0].length)
+            if cut <= takes[0].pad:
+                cut = 0
 
-        # Combine recorded data into a single array
-        audio_data = np.concatenate(self.recorded_data, axis=0)
+        self.last_recordings = []
+        for take, channel in zip(takes, self._input_channels):
+            self.last_recordings.append(
+                self._save_take(take, cut, file_name_prefix, channel))
+        output_path = self.last_recordings[0]
+        self.last_take = None
+        if output_path is not None:
+            self.last_take = AudioBuffer.map_file(output_path)
+        return output_path
 
-        # Convert audio data to 16-bit PCM format
-        if audio_data.dtype != np.int16:
-            max_value = np.iinfo(np.int16).max
-            audio_data = (audio_data * max_value).astype(np.int16)
+    def _save_take(self, take, cut, file_name_prefix, channel):
+        """Closes a take and returns its path, None when it is empty"""
+        take.close(cut)
+        if take.dropped:
+            print(f"Recording lost {take.dropped} frames")
+        if take.frames == 0:
+            os.remove(take.path)
+            print("Recording is empty, it stopped before its first "
+                  "boundary. Nothing was saved")
+            return None
 
-        # Ensure the output directory exists
-        if not os.path.exists(self.output_directory):
-            os.makedirs(self.output_directory)
+        output_path = take.path
+        if file_name_prefix != self._file_name_prefix:
+            output_path = self._unique_path(file_name_prefix, channel)
+            os.replace(take.path, output_path)
+        print(f"Audio saved as {output_path}")
+        return output_path
 
-        # Generate a unique filename based on timestamp
+    def _unique_path(self, file_name_prefix, channel=0):
+        # Generate a unique filename based on timestamp, numbered by input
+        # channel when several are recorded
         timestamp = int(time.time() * 1000)
         file_name = f"{file_name_prefix}_{timestamp}.wav"
-        output_path = os.path.join(self.output_directory, file_name)
-
-        # Save the audio file
-        write(output_path, self.sample_rate, audio_data)
-        print(f"Audio saved as {output_path}")
-        return output_path
+        if len(self._input_channels) > 1:
+            file_name = f"{file_name_prefix}_{timestamp}_in{channel + 1}.wav"
+        return os.path.join(self.output_directory, file_name)
 
     def get_audio_length(self, file_path):
         """Returns the length of the audio file in milliseconds."""
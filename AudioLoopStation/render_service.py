@@ -0,0 +1,127 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, CancelledError
+from Utilities.RenderCache import RenderCache
+
+
+class RenderService:
+    '''
+    Renders effect variants across all cores using a process pool.
+
+    Jobs are submitted in named groups (the Dispatcher uses the loop name)
+    so progress can be reported and work cancelled per loop. Finished
+    renders are registered with the RenderCache from the parent process.
+    The pool is only started when the first job is submitted.
+    '''
+    def __init__(self, max_workers: int = None):
+        self._max_workers = max_workers or os.cpu_count() or 1
+        self._executor = None
+        self._groups = {}
+        # futures whose done callback has finished, see progress()
+        self._settled = set()
+        self._lock = threading.Lock()
+
+    def submit(self, group: str, jobs: list[tuple], on_done=None) -> None:
+        """Queues render jobs under group, replacing any work that is
+        still pending for that group.
+
+        Args:
+            group (str): name used to track progress, e.g. the loop name
+            jobs (list[tuple]): (cache_key, function, args) tuples. Each
+                job runs function(*args, new_path) in a worker process and
+                must write its render to new_path. function has to be a
+                module level function so it can be pickled
+            on_done: optional function called with the cache key of every
+                successful render once it is in the RenderCache. It runs on
+                a background thread
+        """
+        self.cancel(group)
+        if not jobs:
+            return
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self._max_workers
+                )
+        cache = RenderCache()
+        futures = []
+        with self._lock:
+            self._groups[group] = futures
+        for key, function, args in jobs:
+            future = self._executor.submit(
+                function,
+                *args,
+                cache.path_for(key)
+                )
+            # tracked before the callback so a job that is already done
+            # still counts
+            with self._lock:
+                futures.append(future)
+            future.add_done_callback(
+                lambda f, key=key: self._register(f, key, on_done)
+                )
+
+    def _register(self, future, key: str, on_done) -> None:
+        try:
+            if not future.cancelled() and future.exception() is None:
+                RenderCache().put(key)
+                if on_done is not None:
+                    on_done(key)
+        finally:
+            with self._lock:
+                # jobs of cancelled groups are no longer tracked
+                if any(future in futures
+                       for futures in self._groups.values()):
+                    self._settled.add(future)
+
+    def progress(self, group: str) -> tuple[int, int]:
+        """Returns render progress of a group. A job counts as finished
+        once its render is in the RenderCache and on_done has run.
+
+        Returns:
+            tuple[int, int]: (finished jobs, total jobs). (0, 0) when the
+            group has no jobs.
+        """
+        with self._lock:
+            futures = self._groups.get(group, [])
+            return (sum(f in self._settled for f in futures), len(futures))
+
+    def is_done(self, group: str) -> bool:
+        done, total = self.progress(group)
+        return done == total
+
+    def errors(self, group: str) -> list[BaseException]:
+        """Returns exceptions raised by finished jobs of a group"""
+        with self._lock:
+            futures = self._groups.get(group, [])
+        errors = []
+        for future in futures:
+            if not future.done():
+                continue
+            try:
+                error = future.exception()
+            except CancelledError:
+                continue
+            if error is not None:
+                errors.append(error)
+        return errors
+
+    def cancel(self, group: str) -> None:
+        """Cancels every job of group that has not started yet. Jobs that
+        are already running finish in their worker and still end up in the
+        RenderCache, but no longer count towards the group's progress.
+        """
+        with self._lock:
+            futures = self._groups.pop(group, [])
+            self._settled.difference_update(futures)
+        for future in futures:
+            future.cancel()
+
+    def shutdown(self) -> None:
+        """Cancels all pending work and stops the worker processes"""
+        with self._lock:
+            groups = list(self._groups.keys())
+        for group in groups:
+            self.cancel(group)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,236 @@
+import mmap
+import os
+import struct
+import threading
+import time
+import numpy as np
+
+# (format tag, bits per sample) -> dtype of PCM data that can be mapped as is
+_MAPPABLE_FORMATS = {
+    (1, 16): np.dtype("<i2"),
+    (3, 32): np.dtype("<f4"),
+}
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def map_wav(path: str) -> tuple[np.memmap, int]:
+    """Memory maps the sample data of a 16 bit PCM or 32 bit float WAV file.
+    Nothing is read until the returned array is indexed.
+
+    Args:
+        path (str): path of the wav file
+
+    Raises:
+        ValueError: the file is not a WAV file or its format can't be mapped
+
+    Returns:
+        tuple[np.memmap, int]: read only array shaped (frames, channels)
+        and the sample rate
+    """
+    with open(path, "rb") as file:
+        riff, _, wave = struct.unpack("<4sI4s", file.read(12))
+        if riff != b"RIFF" or wave != b"WAVE":
+            raise ValueError(f"{path} is not a WAV file")
+
+        format_key = None
+        while True:
+            header = file.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{path} has no data chunk")
+            chunk_id, chunk_size = struct.unpack("<4sI", header)
+            if chunk_id == b"fmt ":
+                fmt = file.read(chunk_size + (chunk_size & 1))
+                tag, channels, sample_rate = struct.unpack("<HHI", fmt[:8])
+                bits = struct.unpack("<H", fmt[14:16])[0]
+                if tag == _WAVE_FORMAT_EXTENSIBLE:
+                    tag = struct.unpack("<H", fmt[24:26])[0]
+                format_key = (tag, bits)
+            elif chunk_id == b"data":
+                offset = file.tell()
+                break
+            else:
+                file.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+    if format_key not in _MAPPABLE_FORMATS:
+        raise ValueError(f"{path} has an unsupported sample format")
+    dtype = _MAPPABLE_FORMATS[format_key]
+    # files still being written can have a stale data chunk size
+    data_bytes = min(chunk_size, os.path.getsize(path) - offset)
+    frames = data_bytes // (dtype.itemsize * channels)
+    samples = np.memmap(path, dtype=dtype, mode="r", offset=offset,
+                        shape=(frames, channels))
+    return samples, sample_rate
+
+
+class StreamingSource:
+    '''
+    Feeds a memory mapped track into the mixer without loading it.
+
+    A reader thread keeps the chunks just ahead of the playback position
+    (plus the first chunk, where the loop wraps to) converted to float32 in
+    a fixed pool of buffers, and tells the kernel it may drop the mapped
+    pages of chunks that were played. Resident memory therefore depends on
+    chunk_frames and read_ahead, not on the length of the track.
+
+    The mixer reads through add_into(), which only copies from the pool. If
+    the reader falls behind, the missing frames are read from the map
+    directly and counted in underruns. The reader stops by itself once the
+    mixer hasn't read for idle_time seconds; prime() starts it again.
+    '''
+    def __init__(
+            self,
+            samples: np.ndarray,
+            channels: int,
+            sample_rate: int = 44100,
+            reverse: bool = False,
+            chunk_frames: int = 16384,
+            read_ahead: int = 3,
+            idle_time: float = 2.0
+            ):
+        self._samples = samples
+        self._channels = channels
+        self._sample_rate = sample_rate
+        self._reverse = reverse
+        self._chunk_frames = chunk_frames
+        self._read_ahead = read_ahead
+        self._chunk_count = -(-len(samples) // chunk_frames)
+        self._scale = (np.float32(1 / 32768)
+                       if samples.dtype == np.int16 else np.float32(1))
+        self._pool = [
+            np.zeros((chunk_frames, channels), dtype=np.float32)
+            for _ in range(read_ahead + 1)
+        ]
+        # chunk index -> pool buffer. Replaced as a whole by the reader
+        self._chunks = {}
+        # last position read by the mixer
+        self._cursor = 0
+        self._idle_time = idle_time
+        self._thread = None
+        self._running = False
+        self._thread_lock = threading.Lock()
+        # held by _fill, which prime() and the reader thread both call, so
+        # they never hand out the same pool buffer twice. Never taken by
+        # the audio thread
+        self._fill_lock = threading.Lock()
+        self.underruns = 0
+
+    def __len__(self):
+        return len(self._samples)
+
+    # Public functions
+    def prime(self, position: int = 0) -> None:
+        """Loads the chunks around position and starts the reader thread.
+        Called from the control thread before the voice starts.
+        """
+        self._cursor = position
+        self._fill()
+        with self._thread_lock:
+            if self._thread is None:
+                self._running = True
+                self._thread = threading.Thread(target=self._run,
+                                                daemon=True)
+                self._thread.start()
+
+    def close(self) -> None:
+        """Stops the reader thread; prime() starts it again"""
+        with self._thread_lock:
+            thread = self._thread
+            self._running = False
+        if thread is not None:
+            thread.join()
+
+    def add_into(self, out: np.ndarray, position: int) -> None:
+        """Audio thread: adds len(out) frames starting at position to out"""
+        self._cursor = position
+        chunks = self._chunks
+        written = 0
+        total = len(out)
+        while written < total:
+            chunk, offset = divmod(position + written, self._chunk_frames)
+            n = min(total - written, self._chunk_frames - offset)
+            buffer = chunks.get(chunk)
+            if buffer is None:
+                self.underruns += 1
+                out[written:written + n] += self._read(
+                    position + written, n)
+            else:
+                out[written:written + n] += buffer[offset:offset + n]
+            written += n
+
+    # Private functions
+    def _run(self):
+        poll = self._chunk_frames / self._sample_rate / 4
+        idle_polls = max(1, int(self._idle_time / poll))
+        idle = 0
+        last_cursor = self._cursor
+        while True:
+            self._fill()
+            time.sleep(poll)
+            with self._thread_lock:
+                if self._cursor != last_cursor:
+                    idle = 0
+                    last_cursor = self._cursor
+                else:
+                    idle += 1
+                if not self._running or idle >= idle_polls:
+                    self._running = False
+                    self._thread = None
+                    return
+
+    def _fill(self):
+        with self._fill_lock:
+            self._fill_chunks()
+
+    def _fill_chunks(self):
+        first = self._cursor // self._chunk_frames
+        wanted = [0] + [
+            chunk for chunk in range(first, first + self._read_ahead)
+            if chunk < self._chunk_count
+        ]
+        chunks = self._chunks
+        if all(chunk in chunks for chunk in wanted):
+            return
+
+        kept = {c: b for c, b in chunks.items() if c in wanted}
+        in_use = [id(b) for b in kept.values()]
+        free = [b for b in self._pool if id(b) not in in_use]
+        for chunk in wanted:
+            if chunk in kept:
+                continue
+            buffer = free.pop()
+            start = chunk * self._chunk_frames
+            n = min(self._chunk_frames, len(self._samples) - start)
+            buffer[:n] = self._read(start, n)
+            kept[chunk] = buffer
+        self._chunks = kept
+
+        for chunk in chunks:
+            if chunk not in kept:
+                self._release(chunk)
+
+    def _read(self, start: int, n: int) -> np.ndarray:
+        """Reads n frames from start in playback order as float32"""
+        if self._reverse:
+            end = len(self._samples) - start
+            frames = self._samples[end - n:end][::-1]
+        else:
+            frames = self._samples[start:start + n]
+        return np.multiply(frames, self._scale, dtype=np.float32)
+
+    def _release(self, chunk: int) -> None:
+        """Lets the kernel drop the mapped pages of a played chunk"""
+        mapping = getattr(self._samples, "_mmap", None)
+        if mapping is None or not hasattr(mmap, "MADV_DONTNEED"):
+            return
+        frame_bytes = self._samples.strides[0]
+        start = chunk * self._chunk_frames
+        if self._reverse:
+            start = max(len(self._samples) - start - self._chunk_frames, 0)
+        # byte range of the chunk inside the mapping, shrunk to whole pages
+        base = self._samples.offset % mmap.ALLOCATIONGRANULARITY
+        first = base + start * frame_bytes
+        last = first + self._chunk_frames * frame_bytes
+        first = -(-first // mmap.PAGESIZE) * mmap.PAGESIZE
+        last = min(last // mmap.PAGESIZE * mmap.PAGESIZE, len(mapping))
+        if last > first:
+            mapping.madvise(mmap.MADV_DONTNEED, first, last - first)
@@ -0,0 +1,11 @@
+import os
+import sys
+
+# modules inside AudioLoopStation import each other by their flat names
+# (e.g. "from loop import Track"), as they do when the app is started
+# from that directory
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                 "AudioLoopStation")
+    )
@@ -0,0 +1,239 @@
+"""
+Benchmarks of loading, effects, mixing and saving on the bundled
+Audio/*.wav files. Results are written as JSON so runs of two releases can
+be compared with --compare.
+
+Run from the project root:
+
+    python -m Tests.benchmarks --output benchmarks.json
+    python -m Tests.benchmarks --compare old.json --output new.json
+
+or through sh runTests.sh --bench. No audio device is needed: the mixer
+callback is called directly.
+"""
+import os
+import sys
+import json
+import time
+import glob
+import argparse
+import platform
+import statistics
+import numpy as np
+# Tests/__init__.py has put AudioLoopStation on sys.path
+from loop import Track
+from mixer import _Mixer
+from effects import EFFECT_TYPES, create_effect, time_stretch
+from dispatcher import Dispatcher
+from Utilities.SaveManager import SaveManager
+
+AUDIO_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "Audio")
+LOOP_PREFIX = "benchmark_loop_"
+
+
+def _measure(function, repeat: int) -> dict:
+    """Runs function repeat times and returns timing statistics in ms"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    return {
+        "runs": repeat,
+        "mean_ms": statistics.fmean(times),
+        "median_ms": statistics.median(times),
+        "min_ms": min(times),
+        "max_ms": max(times)
+    }
+
+
+def _audio_files() -> list[str]:
+    files = sorted(glob.glob(os.path.join(AUDIO_DIR, "*.wav")))
+    if not files:
+        raise SystemExit(f"No wav files found in {AUDIO_DIR}")
+    return files
+
+
+def bench_track_construction(repeat: int) -> dict:
+    return {
+        os.path.basename(path): _measure(lambda: Track(path), repeat)
+        for path in _audio_files()
+    }
+
+
+def bench_effects(repeat: int, block_size: int = 512) -> dict:
+    """Times every effect variant of one track: the reverse view, both
+    time stretches and one mixer block of each live effect
+    """
+    path = _audio_files()[0]
+    track = Track(path)
+    samples = track.track.samples
+    results = {
+        "reverse": _measure(track.track.reversed, repeat),
+        "time_stretch_preview": _measure(
+            lambda: time_stretch(samples, 1.25, preview=True), repeat),
+        # the high quality stretch takes seconds, one run is enough
+        "time_stretch_high_quality": _measure(
+            lambda: time_stretch(samples, 1.25), 1),
+    }
+    block = np.ascontiguousarray(samples[:block_size])
+    for name in EFFECT_TYPES:
+        effect = create_effect(name, samples.shape[1], 44100)
+        if name == "pitch":
+            effect.set_params(semitones=5)
+        # warm up so one-time setup isn't measured
+        effect.process(block.copy())
+        work = block.copy()
+        results[f"live_{name}_per_block"] = _measure(
+            lambda: effect.process(work), repeat * 20)
+    return results
+
+
+def bench_load_loop(repeat: int, max_tracks: int = 12) -> dict:
+    """Times Dispatcher.load_loop for loops of 1 to max_tracks tracks"""
+    files = _audio_files()
+    save_manager = SaveManager()
+    dispatcher = Dispatcher()
+    results = {}
+    try:
+        for count in range(1, max_tracks + 1):
+            name = f"{LOOP_PREFIX}{count}"
+            save_manager.save("loop", {
+                "loop_name": name,
+                "tracks": [files[i % len(files)] for i in range(count)]
+            })
+            results[f"{count}_tracks"] = _measure(
+                lambda: dispatcher.load_loop(name), repeat)
+    finally:
+        dispatcher.shutdown()
+        _remove_benchmark_loops(save_manager)
+    return results
+
+
+def bench_mixer_callback(repeat: int, block_size: int = 512,
+                         track_counts=(1, 2, 4, 8, 12)) -> dict:
+    """Times the output callback per block for loops of N tracks, plain
+    and with a live effect chain on every track
+    """
+    files = _audio_files()
+    tracks = [Track(path) for path in files]
+    budget_ms = block_size / 44100 * 1000
+    results = {"block_budget_ms": budget_ms}
+    for with_effects in (False, True):
+        for count in track_counts:
+            mixer = _Mixer(block_size=block_size)
+            mixer._open_stream = lambda: None
+            voices = {}
+            for i in range(count):
+                track = tracks[i % len(tracks)]
+                chain = track.effect_chain.copy(2, 44100)
+                if with_effects:
+                    chain.add(create_effect("eq", 2, 44100, gain_db=3))
+                voices[i] = (track.track.samples, chain)
+            mixer.start_loop("loop", tracks[0].get_frames(), voices)
+            out = np.zeros((block_size, 2), dtype=np.float32)
+            key = f"{count}_tracks" + ("_eq" if with_effects else "")
+            results[key] = _measure(
+                lambda: mixer._callback(out, block_size, None, None),
+                repeat * 100)
+    return results
+
+
+def bench_save_manager(repeat: int) -> dict:
+    save_manager = SaveManager()
+    name = f"{LOOP_PREFIX}save"
+    loop = {"loop_name": name, "tracks": _audio_files()}
+    try:
+        return {
+            "save": _measure(lambda: save_manager.save("loop", loop),
+                             repeat),
+            "load": _measure(lambda: save_manager.load("loop", name),
+                             repeat),
+            "get_loop_options": _measure(save_manager.get_loop_options,
+                                         repeat)
+        }
+    finally:
+        _remove_benchmark_loops(save_manager)
+
+
+def _remove_benchmark_loops(save_manager):
+    for path in glob.glob(os.path.join(os.fspath(save_manager._loop_dir),
+                                       f"{LOOP_PREFIX}*.json")):
+        os.remove(path)
+
+
+BENCHMARKS = {
+    "track_construction": bench_track_construction,
+    "effects": bench_effects,
+    "load_loop": bench_load_loop,
+    "mixer_callback": bench_mixer_callback,
+    "save_manager": bench_save_manager,
+}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Lists benchmarks whose mean time grew by more than threshold"""
+    slower = []
+    for group, entries in results["results"].items():
+        for name, entry in entries.items():
+            old = baseline.get("results", {}).get(group, {}).get(name)
+            if not isinstance(entry, dict) or not isinstance(old, dict):
+                continue
+            ratio = entry["mean_ms"] / old["mean_ms"]
+            if ratio > 1 + threshold:
+                slower.append(f"{group}/{name}: {old['mean_ms']:.3f} ms -> "
+                              f"{entry['mean_ms']:.3f} ms ({ratio:.2f}x)")
+    return slower
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-o", "--output", default="benchmarks.json",
+                        help="JSON file the results are written to")
+    parser.add_argument("-r", "--repeat", type=int, default=5,
+                        help="runs per measurement")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS),
+                        help="run only these benchmarks")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="JSON results of an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="slowdown reported by --compare, 0.1 is 10%%")
+    args = parser.parse_args(argv)
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeat": args.repeat
+        },
+        "results": {}
+    }
+    # the app resolves its relative paths from AudioLoopStation
+    cwd = os.getcwd()
+    output = os.path.abspath(args.output)
+    os.chdir(os.path.join(os.path.dirname(AUDIO_DIR), "AudioLoopStation"))
+    try:
+        for name in args.only or BENCHMARKS:
+            print(f"Running {name}...")
+            results["results"][name] = BENCHMARKS[name](args.repeat)
+    finally:
+        os.chdir(cwd)
+
+    with open(output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, "r") as file:
+            slower = compare(results, json.load(file), args.threshold)
+        for line in slower:
+            print(f"SLOWER {line}")
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
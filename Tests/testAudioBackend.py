@@ -0,0 +1,321 @@
+import time
+import pathlib
+import threading
+import tempfile
+import unittest
+import numpy as np
+import audio_backend
+from audio_backend import VirtualBackend, set_audio_backend
+from io_manager import _IO_manager, IO_manager
+from mixer import _Mixer
+from recorder import Recorder
+
+
+class Test_AutoTune(unittest.TestCase):
+    def setUp(self):
+        self.backend = VirtualBackend(speed=1, latency=0.05)
+        set_audio_backend(self.backend)
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.directory.name) / 'tuning.json'
+
+    def tearDown(self):
+        set_audio_backend(None)
+        self.directory.cleanup()
+
+    def test_picks_lowest_stable_setting(self):
+        manager = _IO_manager(tuning_path=self.path,
+                              devices_path=self.path.with_name('d.json'))
+        self.assertEqual(manager.get_stream_settings(1000), {})
+        result = manager.auto_tune(sample_rate=1000, channels=1,
+                                   block_sizes=[64, 16], probe_seconds=0.2)
+        self.assertEqual(result['blocksize'], 16)
+        self.assertEqual(result['latency'], 0.05)
+        self.assertEqual(result['xruns'], 0)
+        self.assertEqual(manager.get_stream_settings(1000), result)
+
+    def test_result_is_cached_per_device(self):
+        _IO_manager(tuning_path=self.path).auto_tune(
+            sample_rate=1000, channels=1, block_sizes=[16],
+            probe_seconds=0.2)
+        opened = []
+        self.backend.output_stream = lambda **kwargs: opened.append(kwargs)
+        manager = _IO_manager(tuning_path=self.path)
+        result = manager.auto_tune(sample_rate=1000, channels=1,
+                                   block_sizes=[16])
+        self.assertEqual(result['blocksize'], 16)
+        self.assertEqual(opened, [])
+        self.assertEqual(manager.get_stream_settings(44100), {})
+
+    def test_background_tune_skips_streams_that_fail_to_start(self):
+        open_stream = self.backend.output_stream
+
+        def output_stream(**kwargs):
+            stream = open_stream(**kwargs)
+            if kwargs['blocksize'] == 16:
+                def fail():
+                    raise RuntimeError("device busy")
+                stream.start = fail
+            return stream
+
+        self.backend.output_stream = output_stream
+        manager = _IO_manager(tuning_path=self.path,
+                              devices_path=self.path.with_name('d.json'))
+        manager.start_auto_tune(sample_rate=1000, channels=1,
+                                block_sizes=[64, 16],
+                                probe_seconds=0.2).join()
+        self.assertEqual(manager.get_stream_settings(1000)['blocksize'], 64)
+
+
+class Test_DeviceEnumeration(unittest.TestCase):
+    def setUp(self):
+        self.backend = VirtualBackend(speed=None)
+        # stands in for a backend that is slow to list its devices
+        self.backend.cache_devices = True
+        set_audio_backend(self.backend)
+        self.directory = tempfile.TemporaryDirectory()
+        directory = pathlib.Path(self.directory.name)
+        self.paths = {"tuning_path": directory / 'tuning.json',
+                      "devices_path": directory / 'devices.json'}
+
+    def tearDown(self):
+        set_audio_backend(None)
+        self.directory.cleanup()
+
+    def test_cached_devices_are_used_while_querying(self):
+        # the first launch lists the devices in the background and caches
+        # them
+        _IO_manager(**self.paths).refresh(block=True)
+        self.backend.add_device("USB Interface", 2, 2)
+        gate = threading.Event()
+        query = self.backend.query_devices
+        self.backend.query_devices = \
+            lambda rescan=False: gate.wait() and query(rescan)
+
+        manager = _IO_manager(**self.paths)
+        self.assertEqual(manager.get_selected_input()['name'],
+                         "Virtual Input")
+        self.assertEqual(manager.get_device("USB Interface"), {})
+        changes = []
+        manager.add_device_listener(lambda: changes.append(True))
+        thread = manager._refresh_thread
+        gate.set()
+        thread.join()
+        self.assertEqual(manager.get_device("USB Interface")['index'], 2)
+        self.assertEqual(manager.get_device(2, output=True)['name'],
+                         "USB Interface")
+        self.assertEqual(changes, [True])
+
+    def test_first_launch_lists_devices_in_background(self):
+        gate = threading.Event()
+        query = self.backend.query_devices
+        self.backend.query_devices = \
+            lambda rescan=False: gate.wait() and query(rescan)
+
+        manager = _IO_manager(**self.paths)
+        self.assertEqual(manager.get_inputs(), [])
+        changes = []
+        manager.add_device_listener(lambda: changes.append(True))
+        thread = manager._refresh_thread
+        gate.set()
+        # looking up the selection waits for the query
+        self.assertEqual(manager.get_selected_input()['name'],
+                         "Virtual Input")
+        self.assertEqual(len(manager.get_outputs()), 1)
+        thread.join()
+        self.assertEqual(changes, [True])
+
+    def test_refresh_keeps_selection_by_name(self):
+        manager = _IO_manager(**self.paths)
+        self.backend.add_device("USB Interface", 2, 0)
+        manager.refresh(block=True)
+        manager.select_input("USB Interface")
+        self.assertEqual(manager.get_selected_input()['index'], 2)
+
+        self.backend.remove_device("Virtual Input")
+        manager.refresh(block=True)
+        self.assertEqual(manager.get_selected_input()['name'],
+                         "USB Interface")
+        self.backend.remove_device("USB Interface")
+        manager.refresh(block=True)
+        self.assertEqual(manager.get_selected_input(), {})
+        self.assertEqual(manager.get_inputs(), [])
+
+
+class Test_VirtualBackend(unittest.TestCase):
+    def setUp(self):
+        self.blocks = []
+        self.backend = VirtualBackend(speed=None,
+                                      output_sink=self.blocks.append)
+        set_audio_backend(self.backend)
+
+    def tearDown(self):
+        set_audio_backend(None)
+
+    def test_io_manager_lists_virtual_devices(self):
+        manager = _IO_manager()
+        self.assertEqual(manager.get_selected_input()['name'],
+                         "Virtual Input")
+        self.assertEqual(manager.get_selected_output()['index'], 1)
+        self.assertEqual(len(manager.get_inputs()), 1)
+        self.assertEqual(len(manager.get_outputs()), 1)
+
+    def test_mixer_plays_on_simulated_clock(self):
+        mixer = _Mixer(sample_rate=1000, channels=1, block_size=100)
+        ones = np.ones((1000, 1), dtype=np.float32) * 0.5
+        mixer.start_loop("loop", 1000, {"track": (ones, None)})
+        self.backend.advance(0.5)
+        self.assertEqual(len(self.blocks), 5)
+        self.assertEqual(mixer.get_position("loop"), 500)
+        self.assertTrue(np.allclose(np.concatenate(self.blocks), 0.5))
+        mixer.close()
+
+    def test_recorder_captures_input_signal(self):
+        ramp = np.linspace(-1, 1, 300, dtype=np.float32)
+        self.backend.input_signal = ramp
+        with tempfile.TemporaryDirectory() as directory:
+            recorder = Recorder(output_directory=directory, sample_rate=1000)
+            recorder.start_recording()
+            self.backend.advance(1)
+            recorder.stop_recording()
+            take = recorder.last_take.as_float32().samples[:, 0]
+        self.assertEqual(len(take), 1024)
+        self.assertTrue(np.allclose(take[:300], ramp, atol=1e-4))
+        self.assertTrue(np.allclose(take[300:600], ramp, atol=1e-4))
+
+    def test_mixer_waits_for_probe_to_open(self):
+        mixer = _Mixer(sample_rate=1000, channels=1, block_size=100)
+        ones = np.ones((1000, 1), dtype=np.float32)
+        with IO_manager().stream_lock:
+            thread = threading.Thread(target=mixer.start_loop, args=(
+                "loop", 1000, {"track": (ones, None)}))
+            thread.start()
+            thread.join(0.05)
+            self.assertIsNone(mixer._stream)
+        thread.join()
+        self.assertIsNotNone(mixer._stream)
+        mixer.close()
+
+    def test_mixer_survives_stream_start_failure(self):
+        open_stream = self.backend.output_stream
+
+        def output_stream(**kwargs):
+            stream = open_stream(**kwargs)
+
+            def fail():
+                raise RuntimeError("device busy")
+            stream.start = fail
+            return stream
+
+        self.backend.output_stream = output_stream
+        mixer = _Mixer(sample_rate=1000, channels=1, block_size=100)
+        ones = np.ones((1000, 1), dtype=np.float32)
+        mixer.start_loop("loop", 1000, {"track": (ones, None)})
+        self.assertIsNone(mixer._stream)
+        # the next loop started opens the output again
+        self.backend.output_stream = open_stream
+        mixer.start_loop("other", 1000, {"track": (ones, None)})
+        self.assertIsNotNone(mixer._stream)
+        mixer.close()
+
+    def test_monitoring_mixes_input_into_output(self):
+        self.backend.input_signal = np.full(1000, 0.25, dtype=np.float32)
+        mixer = _Mixer(sample_rate=1000, channels=2, block_size=100)
+        mixer.set_monitoring(True, 2.0)
+        self.backend.advance(0.3)
+        self.assertTrue(mixer.is_monitoring())
+        self.assertEqual(mixer._stream.kind, "duplex")
+        # gain ramps up over the first block, the mono input plays on both
+        self.assertTrue(np.allclose(self.blocks[-1], 0.5))
+        mixer.set_monitoring(False)
+        self.assertIsNone(mixer._stream)
+        mixer.close()
+
+    def test_recorder_reads_monitoring_stream(self):
+        ramp = np.linspace(-1, 1, 300, dtype=np.float32)
+        self.backend.input_signal = ramp
+        mixer = _Mixer(sample_rate=1000, channels=1, block_size=128)
+        _Mixer._instance = mixer
+        mixer.set_monitoring(True, 0.0)
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                recorder = Recorder(output_directory=directory,
+                                    sample_rate=1000)
+                recorder.start_recording()
+                self.assertIsNone(recorder.stream)
+                self.backend.advance(1)
+                recorder.stop_recording()
+                take = recorder.last_take.as_float32().samples[:, 0]
+        finally:
+            mixer.close()
+            _Mixer._instance = None
+        self.assertFalse(mixer._input_callbacks)
+        self.assertEqual(len(take), 1024)
+        self.assertTrue(np.allclose(take[:300], ramp, atol=1e-4))
+
+    def test_monitoring_switch_waits_for_recording(self):
+        mixer = _Mixer(sample_rate=1000, channels=1, block_size=128)
+        _Mixer._instance = mixer
+        mixer.set_monitoring(True, 1.0)
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                recorder = Recorder(output_directory=directory,
+                                    sample_rate=1000)
+                recorder.start_recording()
+                self.backend.advance(0.5)
+                mixer.set_monitoring(False, 0.0)
+                self.assertTrue(mixer.is_monitoring())
+                self.assertEqual(mixer.get_monitor_gain(), 0)
+                self.backend.advance(0.5)
+                recorder.stop_recording()
+                self.assertFalse(mixer.is_monitoring())
+                self.assertIsNone(mixer._stream)
+                take = recorder.last_take.as_float32().samples
+        finally:
+            mixer.close()
+            _Mixer._instance = None
+        self.assertEqual(len(take), 1024)
+
+    def test_unthrottled_stream_runs_by_itself(self):
+        backend = VirtualBackend(speed=float("inf"))
+        calls = []
+        stream = backend.output_stream(
+            samplerate=1000, blocksize=10, channels=1,
+            callback=lambda out, frames, time, status: calls.append(frames))
+        stream.start()
+        while len(calls) < 50:
+            pass
+        stream.close()
+        self.assertGreater(backend.time, 0)
+        self.assertTrue(stream.closed)
+
+    def test_late_callback_reports_underflow(self):
+        backend = VirtualBackend(speed=1)
+        statuses = []
+
+        def callback(outdata, frames, time_info, status):
+            statuses.append(status)
+            if len(statuses) == 3:
+                time.sleep(0.05)
+
+        stream = backend.output_stream(samplerate=1000, blocksize=10,
+                                       channels=1, callback=callback)
+        stream.start()
+        while len(statuses) < 6:
+            time.sleep(0.01)
+        stream.close()
+        self.assertFalse(any(statuses[:3]))
+        self.assertTrue(statuses[3].output_underflow)
+        self.assertFalse(statuses[3].input_overflow)
+
+    def test_sounddevice_unavailable_falls_back_to_virtual(self):
+        set_audio_backend(None)
+        try:
+            import sounddevice  # noqa: F401
+            self.skipTest("sounddevice is available here")
+        except OSError:
+            pass
+        self.assertIsInstance(audio_backend.AudioBackend(), VirtualBackend)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from loop import AudioBuffer
+
+
+class Test_AudioBuffer(unittest.TestCase):
+    def setUp(self):
+        samples = np.linspace(-1, 1, 200, dtype=np.float32).reshape(100, 2)
+        self.buffer = AudioBuffer(samples, 1000)
+
+    def test_shape(self):
+        self.assertEqual(self.buffer.frames, 100)
+        self.assertEqual(self.buffer.channels, 2)
+        self.assertEqual(self.buffer.get_length(), 100)
+
+    def test_mono_gets_channel_axis(self):
+        mono = AudioBuffer(np.zeros(10, dtype=np.int16), 1000)
+        self.assertEqual(mono.samples.shape, (10, 1))
+
+    def test_slices_are_views(self):
+        trimmed = self.buffer.trim(10, 20)
+        reversed_buffer = self.buffer.reversed()
+        self.assertEqual(len(trimmed), 10)
+        self.assertTrue(np.shares_memory(trimmed.samples,
+                                         self.buffer.samples))
+        self.assertTrue(np.shares_memory(reversed_buffer.samples,
+                                         self.buffer.samples))
+        self.assertTrue(np.array_equal(reversed_buffer.samples[0],
+                                       self.buffer.samples[-1]))
+
+    def test_index_is_rejected(self):
+        with self.assertRaises(TypeError):
+            self.buffer[3]
+
+    def test_ms_to_frames(self):
+        self.assertEqual(AudioBuffer(np.zeros((1, 1)), 44100)
+                         .ms_to_frames(1000), 44100)
+
+    def test_int16_roundtrip(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "take.wav")
+            self.buffer.as_int16().write(path)
+            loaded = AudioBuffer.from_file(path)
+        self.assertEqual(loaded.sample_rate, 1000)
+        self.assertTrue(np.allclose(loaded.samples, self.buffer.samples,
+                                    atol=1e-4))
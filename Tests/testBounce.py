@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import soundfile
+from loop import LoopChannel
+
+
+class Test_Bounce(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(2)
+        self.audio = (rng.standard_normal((4410, 2)) * 0.1).astype(np.float32)
+        self.track_path = os.path.join(self.tmp_dir.name, "track.wav")
+        soundfile.write(self.track_path, self.audio, 44100, subtype="FLOAT")
+        self.out_path = os.path.join(self.tmp_dir.name, "bounce.wav")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_repeats_loop(self):
+        loop = LoopChannel("bounce", self.track_path)
+        frames = loop.bounce(self.out_path, repetitions=3, subtype="FLOAT",
+                             block_size=1000)
+        bounced, sample_rate = soundfile.read(self.out_path, dtype="float32")
+        self.assertEqual(frames, 3 * len(self.audio))
+        self.assertEqual(sample_rate, 44100)
+        self.assertTrue(np.allclose(bounced, np.tile(self.audio, (3, 1))))
+
+    def test_uses_reverse_and_gain(self):
+        loop = LoopChannel("bounce", self.track_path, self.track_path)
+        loop.tracks[1].set_reverse(1)
+        loop.set_gain(0.5)
+        loop.bounce(self.out_path, subtype="FLOAT")
+        bounced, _ = soundfile.read(self.out_path, dtype="float32")
+        expected = (self.audio + self.audio[::-1]) * 0.5
+        self.assertTrue(np.allclose(bounced, expected, atol=1e-6))
+        self.assertEqual(os.listdir(self.tmp_dir.name).count(
+            "bounce.wav"), 1)
+        self.assertFalse(any(name.endswith(".part")
+                             for name in os.listdir(self.tmp_dir.name)))
+
+    def test_pitch_shifter_latency_is_compensated(self):
+        loop = LoopChannel("bounce", self.track_path)
+        loop.tracks[0].set_pitch(12)
+        loop.tracks[0].pitch_shifter.set_semitones(0, glide=False)
+        loop.bounce(self.out_path, repetitions=2, subtype="FLOAT")
+        bounced, _ = soundfile.read(self.out_path, dtype="float32")
+        self.assertTrue(np.allclose(bounced, np.tile(self.audio, (2, 1)),
+                                    atol=1e-4))
+
+    def test_pitch_back_to_zero_removes_shifter(self):
+        loop = LoopChannel("bounce", self.track_path)
+        loop.tracks[0].set_pitch(12)
+        loop.tracks[0].set_pitch(0)
+        self.assertIsNone(loop.tracks[0].pitch_shifter)
+        self.assertEqual(len(loop.tracks[0].effect_chain), 0)
+        loop.bounce(self.out_path, subtype="FLOAT")
+        bounced, _ = soundfile.read(self.out_path, dtype="float32")
+        self.assertTrue(np.array_equal(bounced, self.audio))
+
+
+if __name__ == '__main__':
+    unittest.main()
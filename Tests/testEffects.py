@@ -0,0 +1,123 @@
+import unittest
+import numpy as np
+from scipy.signal import lfilter
+from effects import (PitchShifter, BiquadFilter, FeedbackDelay,
+                     SchroederReverb, EffectChain, create_effect)
+
+
+class Test_PitchShifter(unittest.TestCase):
+    def setUp(self):
+        self.sample_rate = 44100
+        t = np.arange(self.sample_rate) / self.sample_rate
+        self.sine = (0.5 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+
+    def _shift(self, signal, semitones, block_size=512):
+        shifter = PitchShifter(1, self.sample_rate)
+        shifter.set_semitones(semitones, glide=False)
+        block = signal[:, np.newaxis].copy()
+        for i in range(0, len(block), block_size):
+            shifter.process(block[i:i + block_size])
+        return block[:, 0], shifter
+
+    def _peak_frequency(self, signal):
+        tail = signal[len(signal) // 2:]
+        spectrum = np.abs(np.fft.rfft(tail * np.hanning(len(tail))))
+        return np.fft.rfftfreq(len(tail), 1 / self.sample_rate)[
+            np.argmax(spectrum)]
+
+    def test_octave_up(self):
+        shifted, _ = self._shift(self.sine, 12)
+        self.assertAlmostEqual(self._peak_frequency(shifted), 880, delta=2)
+
+    def test_fifth_down(self):
+        shifted, _ = self._shift(self.sine, -7)
+        self.assertAlmostEqual(self._peak_frequency(shifted),
+                               440 * 2 ** (-7 / 12), delta=2)
+
+    def test_level_is_kept(self):
+        t = np.arange(self.sample_rate) / self.sample_rate
+        for frequency in (440, 1000):
+            sine = (0.5 * np.sin(2 * np.pi * frequency * t)).astype(
+                np.float32)
+            for semitones in (12, -12, 7):
+                shifted, _ = self._shift(sine, semitones)
+                tail = shifted[len(shifted) // 2:]
+                level = 20 * np.log10(np.sqrt(np.mean(tail ** 2))
+                                      / np.sqrt(np.mean(sine ** 2)))
+                self.assertLess(abs(level), 1,
+                                f"{frequency} Hz by {semitones}")
+
+    def test_no_shift_only_delays(self):
+        noise = np.random.default_rng(0).standard_normal(
+            self.sample_rate).astype(np.float32) * 0.1
+        shifted, shifter = self._shift(noise, 0, block_size=300)
+        latency = shifter.frame_size
+        self.assertTrue(np.allclose(shifted[latency + 4000:latency + 8000],
+                                    noise[4000:8000], atol=1e-4))
+
+    def test_reports_cost(self):
+        _, shifter = self._shift(self.sine, 5)
+        self.assertGreater(shifter.peak_cost, 0)
+        self.assertGreaterEqual(shifter.peak_cost, shifter.last_cost)
+
+
+class Test_EffectChain(unittest.TestCase):
+    def setUp(self):
+        self.sample_rate = 44100
+        self.noise = np.random.default_rng(1).standard_normal(
+            (8000, 2)).astype(np.float32) * 0.1
+
+    def _run(self, effect, signal, block_size=512):
+        block = signal.copy()
+        for i in range(0, len(block), block_size):
+            effect.process(block[i:i + block_size])
+        return block
+
+    def test_biquad_blocks_match_whole_signal(self):
+        eq = create_effect("eq", 2, self.sample_rate, kind="lowshelf",
+                           frequency=200, gain_db=6)
+        b, a = eq._coefficients
+        expected = lfilter(b, a, self.noise, axis=0)
+        self.assertTrue(np.allclose(self._run(eq, self.noise, 300),
+                                    expected, atol=1e-5))
+
+    def test_delay_echoes_impulse(self):
+        delay = FeedbackDelay(1, 1000)
+        delay.set_params(time=0.1, feedback=0.5, mix=1)
+        impulse = np.zeros((400, 1), dtype=np.float32)
+        impulse[0] = 1
+        out = self._run(delay, impulse, block_size=64)[:, 0]
+        self.assertTrue(np.allclose(out[[0, 100, 200, 300]],
+                                    [1, 1, 0.5, 0.25]))
+        self.assertEqual(np.count_nonzero(out), 4)
+
+    def test_reverb_tail_decays(self):
+        reverb = SchroederReverb(2, self.sample_rate)
+        signal = np.zeros((self.sample_rate * 2, 2), dtype=np.float32)
+        signal[:100] = self.noise[:100]
+        out = self._run(reverb, signal)
+        early = np.abs(out[2000:12000]).mean()
+        late = np.abs(out[-10000:]).mean()
+        self.assertGreater(early, 0)
+        self.assertLess(late, early)
+
+    def test_chain_order_and_costs(self):
+        chain = EffectChain()
+        self.assertFalse(chain)
+        chain.add(BiquadFilter(2, self.sample_rate))
+        chain.add(SchroederReverb(2, self.sample_rate), 0)
+        self.assertEqual([name for name, _, _ in chain.get_costs()],
+                         ["reverb", "eq"])
+        self._run(chain, self.noise)
+        self.assertTrue(all(peak > 0 for _, _, peak in chain.get_costs()))
+        self.assertEqual(chain.remove(0).name, "reverb")
+        self.assertEqual(len(chain), 1)
+
+    def test_invalid_params(self):
+        with self.assertRaises(ValueError):
+            create_effect("flanger", 2, self.sample_rate)
+        with self.assertRaises(ValueError):
+            create_effect("delay", 2, self.sample_rate, feedback=1.5)
+        with self.assertRaises(ValueError):
+            create_effect("eq", 2, self.sample_rate, color="red")
+
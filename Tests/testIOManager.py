@@ -1,3 +1,5 @@
+import pathlib
+import tempfile
 import unittest
 import sounddevice
 import AudioLoopStation.io_manager
@@ -5,7 +7,16 @@ import AudioLoopStation.io_manager
 
 class Test_ioManager(unittest.TestCase):
     def setUp(self):
+        # caches go to a temporary directory instead of the app's .save
+        self.directory = tempfile.TemporaryDirectory()
+        directory = pathlib.Path(self.directory.name)
+        AudioLoopStation.io_manager._IO_manager._instance = \
+            AudioLoopStation.io_manager._IO_manager(
+                tuning_path=directory / 'tuning.json',
+                devices_path=directory / 'devices.json')
         self.io_manager = AudioLoopStation.io_manager.IO_manager()
+        # devices are listed in the background, wait for the first query
+        self.io_manager.refresh(block=True)
         self.valid_input = self.io_manager._inputs[0]['index'] if \
             self.io_manager._inputs != [] else 0
         self.valid_output = self.io_manager._outputs[0]['index'] if \
@@ -13,6 +24,7 @@ class Test_ioManager(unittest.TestCase):
 
     def tearDown(self):
         AudioLoopStation.io_manager._IO_manager._instance = None
+        self.directory.cleanup()
 
     def test_modify_singleton(self):
         new_io_manger = AudioLoopStation.io_manager.IO_manager()
@@ -0,0 +1,55 @@
+import unittest
+import numpy as np
+from mixer import _Mixer
+
+
+class Test_MixerGain(unittest.TestCase):
+    def setUp(self):
+        self.mixer = _Mixer(sample_rate=1000, channels=1, block_size=100)
+        # no audio device here, blocks are pulled through _callback
+        self.mixer._open_stream = lambda: None
+        self.ones = np.ones((1000, 1), dtype=np.float32) * 0.5
+        self.mixer.start_loop("loop", 1000, {"track": (self.ones, None)})
+
+    def _block(self):
+        out = np.zeros((100, 1), dtype=np.float32)
+        self.mixer._callback(out, 100, None, None)
+        return out[:, 0]
+
+    def test_unity_by_default(self):
+        self.assertTrue(np.allclose(self._block(), 0.5))
+
+    def test_gain_ramps_over_one_block(self):
+        self._block()
+        self.mixer.set_gain("track", 0.5)
+        ramp = self._block()
+        self.assertTrue(np.all(np.diff(ramp) < 0))
+        self.assertAlmostEqual(ramp[-1], 0.25)
+        self.assertTrue(np.allclose(self._block(), 0.25))
+
+    def test_track_loop_and_master_gains_multiply(self):
+        self.mixer.set_gain("track", 0.5)
+        self.mixer.set_gain("loop", 0.5)
+        self.mixer.set_master_gain(2)
+        self._block()
+        self.assertTrue(np.allclose(self._block(), 0.25))
+
+    def test_scheduled_voice_waits_for_loop_boundary(self):
+        self._block()
+        self.mixer.schedule_voice("track", self.ones * 2)
+        self.assertTrue(np.allclose(self._block(), 0.5))
+        for _ in range(8):
+            self._block()
+        self.assertTrue(np.allclose(self._block(), 1.0))
+
+    def test_gain_survives_voice_swap(self):
+        self.mixer.set_gain("track", 0)
+        self._block()
+        self.mixer.set_voice("track", self.ones * 2)
+        self.assertTrue(np.allclose(self._block(), 0))
+        self.mixer.remove_gain("track")
+        self.assertTrue(np.allclose(self._block(), 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
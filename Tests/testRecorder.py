@@ -0,0 +1,230 @@
+import os
+import pathlib
+import tempfile
+import unittest
+import numpy as np
+import threading
+import soundfile
+from audio_backend import VirtualBackend, set_audio_backend
+from mixer import Mixer
+from io_manager import _IO_manager
+from recorder import TakeWriter, Recorder, measure_latency
+
+
+class Test_TakeWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "take.wav")
+        self.audio = np.linspace(-1, 1, 1000, dtype=np.float32)[:, np.newaxis]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _writer(self, spare_chunks=4, **kwargs):
+        return TakeWriter(self.path, 1000, chunk_frames=100,
+                          spare_chunks=spare_chunks, poll_interval=0.001,
+                          **kwargs)
+
+    def _write(self, writer, audio, block_size=64):
+        for start in range(0, len(audio), block_size):
+            writer.write(audio[start:start + block_size])
+            # give the writer time to recycle chunks like it would between
+            # audio blocks
+            while writer._ready:
+                pass
+
+    def test_writes_take_across_chunks(self):
+        writer = self._writer()
+        self._write(writer, self.audio)
+        self.assertEqual(writer.close(), 1000)
+        written, sample_rate = soundfile.read(self.path, dtype="float32",
+                                              always_2d=True)
+        self.assertEqual(sample_rate, 1000)
+        self.assertTrue(np.allclose(written, self.audio, atol=1e-4))
+
+    def test_memory_stays_constant(self):
+        # at most three chunks are out of the pool at once: the one being
+        # filled, one handed over and one being written
+        writer = self._writer(spare_chunks=6)
+        for _ in range(10):
+            self._write(writer, self.audio)
+        writer.close()
+        self.assertEqual(writer.dropped, 0)
+        self.assertEqual(writer.allocated, 6)
+        self.assertEqual(soundfile.info(self.path).frames, 10000)
+
+    def test_header_flushed_while_recording(self):
+        writer = self._writer(flush_interval=0)
+        self._write(writer, self.audio[:500])
+        # full chunks reach the file header before the take is closed
+        while soundfile.info(self.path).frames < 400:
+            pass
+        writer.close()
+        self.assertEqual(soundfile.info(self.path).frames, 500)
+
+    def test_counts_dropped_frames_when_writer_stalls(self):
+        writer = self._writer()
+        writer._spare.clear()
+        writer.write(self.audio[:50])
+        writer.close()
+        self.assertEqual(writer.dropped, 50)
+        self.assertEqual(soundfile.info(self.path).frames, 0)
+
+
+class Test_AlignedRecording(unittest.TestCase):
+    def setUp(self):
+        # the output is heard by the input 50 ms later
+        self.backend = VirtualBackend(speed=None, loopback=0.05)
+        set_audio_backend(self.backend)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        Mixer().close()
+        set_audio_backend(None)
+        self.tmp_dir.cleanup()
+
+    def test_measures_loopback_latency(self):
+        devices = []
+        input_stream = self.backend.input_stream
+        self.backend.input_stream = lambda **kwargs: (
+            devices.append(kwargs.get('device')) or input_stream(**kwargs))
+        result = []
+        thread = threading.Thread(target=lambda: result.append(
+            measure_latency(44100, capture_seconds=0.5)))
+        thread.start()
+        while thread.is_alive():
+            self.backend.advance(0.05)
+        self.assertEqual(result, [2205])
+        # the burst is listened for on the selected input
+        self.assertEqual(devices, [_IO_manager._instance.get_selected_input()[
+            'index']])
+
+    def test_calibrated_latency_is_kept_per_device(self):
+        directory = pathlib.Path(self.tmp_dir.name)
+        _IO_manager._instance = _IO_manager(
+            tuning_path=directory / "tuning.json",
+            devices_path=directory / "devices.json")
+        self.addCleanup(setattr, _IO_manager, "_instance", None)
+        recorder = Recorder(output_directory=self.tmp_dir.name)
+        recorder.load_latency()
+        self.assertEqual(recorder.latency_frames, 0)
+        thread = threading.Thread(target=recorder.calibrate_latency)
+        thread.start()
+        while thread.is_alive():
+            self.backend.advance(0.05)
+        self.assertEqual(recorder.latency_frames, 2205)
+
+        # a later launch reads it back from the cache
+        _IO_manager._instance = _IO_manager(
+            tuning_path=directory / "tuning.json",
+            devices_path=directory / "devices.json")
+        recorder = Recorder(output_directory=self.tmp_dir.name)
+        recorder.load_latency()
+        self.assertEqual(recorder.latency_frames, 2205)
+
+    def test_overdub_lands_on_loop_boundary(self):
+        loop_frames = 22050
+        click = np.zeros((loop_frames, 2), dtype=np.float32)
+        click[0] = 0.9
+        Mixer().start_loop("loop", loop_frames, {"click": (click, None)})
+        self.backend.advance(0.3)
+
+        recorder = Recorder(output_directory=self.tmp_dir.name)
+        recorder.latency_frames = 2205
+        recorder.start_recording(loop="loop")
+        self.backend.advance(1.3)
+        path = recorder.stop_recording()
+
+        # the take ends after one repeat of the loop, however long the
+        # recording ran
+        take, _ = soundfile.read(path, dtype="float32")
+        self.assertEqual(len(take), loop_frames)
+        self.assertEqual(list(np.flatnonzero(np.abs(take) > 0.5)), [0])
+
+    def test_punch_in_and_out_on_bars(self):
+        loop_frames, bar_frames = 44100, 11025
+        clicks = np.zeros((loop_frames, 2), dtype=np.float32)
+        clicks[::bar_frames] = 0.9
+        Mixer().start_loop("loop", loop_frames, {"clicks": (clicks, None)})
+        self.backend.advance(0.35)
+
+        recorder = Recorder(output_directory=self.tmp_dir.name)
+        recorder.latency_frames = 2205
+        recorder.start_recording(loop="loop", quantum=bar_frames)
+        self.backend.advance(0.5)
+        recorder.punch_out()
+        self.assertFalse(recorder.is_take_complete())
+        while not recorder.is_take_complete():
+            self.backend.advance(0.01)
+        self.backend.advance(0.2)
+        path = recorder.stop_recording()
+
+        take, _ = soundfile.read(path, dtype="float32")
+        # punched in on the bar after 0.35 s minus the latency, and out on
+        # the bar after 0.85 s
+        self.assertEqual(len(take), 4 * bar_frames)
+        self.assertTrue(np.all(take[:2 * bar_frames] == 0))
+        self.assertEqual(list(np.flatnonzero(np.abs(take) > 0.5)),
+                         [2 * bar_frames, 3 * bar_frames])
+
+    def test_first_take_ends_on_a_bar(self):
+        bar_frames = 11025
+        recorder = Recorder(output_directory=self.tmp_dir.name)
+        recorder.start_recording(loop="loop", quantum=bar_frames)
+        self.backend.advance(0.6)
+        recorder.punch_out()
+        self.assertFalse(recorder.is_take_complete())
+        while not recorder.is_take_complete():
+            self.backend.advance(0.01)
+        self.backend.advance(0.2)
+        path = recorder.stop_recording()
+
+        # nothing plays, so the take starts at once and ends on the bar
+        # after 0.6 s
+        self.assertEqual(soundfile.info(path).frames, 3 * bar_frames)
+
+
+class Test_MultiInputRecording(unittest.TestCase):
+    def setUp(self):
+        signal = np.zeros((1000, 3), dtype=np.float32)
+        signal[:, 0] = 0.25
+        signal[:, 2] = np.linspace(-0.5, 0.5, 1000)
+        self.signal = signal
+        self.backend = VirtualBackend(speed=None, input_signal=signal,
+                                      channels=3)
+        set_audio_backend(self.backend)
+        _IO_manager._instance = None
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        set_audio_backend(None)
+        _IO_manager._instance = None
+        self.tmp_dir.cleanup()
+
+    def test_each_channel_gets_its_own_take(self):
+        recorder = Recorder(output_directory=self.tmp_dir.name,
+                            sample_rate=1000)
+        recorder.start_recording(input_channels=[2, 0])
+        self.assertEqual(recorder.stream.channels, 3)
+        self.backend.advance(1)
+        first = recorder.stop_recording()
+
+        self.assertEqual(len(recorder.last_recordings), 2)
+        self.assertEqual(first, recorder.last_recordings[0])
+        self.assertTrue(first.endswith("_in3.wav"))
+        ramp, _ = soundfile.read(recorder.last_recordings[0],
+                                 dtype="float32")
+        level, _ = soundfile.read(recorder.last_recordings[1],
+                                  dtype="float32")
+        self.assertTrue(np.allclose(ramp[:1000], self.signal[:, 2],
+                                    atol=1e-4))
+        self.assertTrue(np.allclose(level, 0.25, atol=1e-4))
+
+    def test_refuses_channels_the_input_lacks(self):
+        recorder = Recorder(output_directory=self.tmp_dir.name)
+        recorder.start_recording(input_channels=[3])
+        self.assertFalse(recorder.is_recording)
+
+
+if __name__ == '__main__':
+    unittest.main()
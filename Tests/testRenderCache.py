@@ -0,0 +1,74 @@
+import os
+import pathlib
+import tempfile
+import unittest
+import AudioLoopStation.Utilities.RenderCache as RenderCache
+
+
+class Test_RenderCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmp_dir.name)
+        self.source = os.fspath(self.root / "source.wav")
+        self._write(self.source, 100)
+        self.cache = RenderCache._RenderCache(
+            cache_dir=self.root / "cache",
+            max_bytes=250
+            )
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _write(self, path, size, fill=b"a"):
+        with open(path, "wb") as file:
+            file.write(fill * size)
+
+    def _render(self, key, size=100):
+        self._write(self.cache.path_for(key), size)
+        self.cache.put(key)
+
+    def test_key_depends_on_params(self):
+        self.assertNotEqual(
+            self.cache.key(self.source, n_steps=12),
+            self.cache.key(self.source, n_steps=-12)
+            )
+
+    def test_key_follows_content(self):
+        key = self.cache.key(self.source, reverse=1)
+        self._write(self.source, 100, fill=b"b")
+        os.utime(self.source, ns=(0, 0))
+        self.assertNotEqual(key, self.cache.key(self.source, reverse=1))
+
+    def test_hit_and_miss_counters(self):
+        key = self.cache.key(self.source, reverse=1)
+        self.assertIsNone(self.cache.get(key))
+        self._render(key)
+        self.assertEqual(self.cache.get(key), self.cache.path_for(key))
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_evicts_least_recently_used(self):
+        first = self.cache.key(self.source, n_steps=1)
+        second = self.cache.key(self.source, n_steps=2)
+        third = self.cache.key(self.source, n_steps=3)
+        self._render(first)
+        self._render(second)
+        self.cache._index[first]["last_used"] += 10
+        self._render(third)
+        self.cache._index[third]["last_used"] += 10
+
+        self.assertTrue(self.cache.contains(first))
+        self.assertFalse(self.cache.contains(second))
+        self.assertFalse(os.path.exists(self.cache.path_for(second)))
+        self.assertLessEqual(self.cache.stats()["bytes"], 250)
+
+    def test_index_survives_restart(self):
+        key = self.cache.key(self.source, reverse=1)
+        self._render(key)
+        self._write(os.fspath(self.root / "cache" / "orphan.wav"), 10)
+        reopened = RenderCache._RenderCache(
+            cache_dir=self.root / "cache",
+            max_bytes=250
+            )
+        self.assertTrue(reopened.contains(key))
+        self.assertFalse((self.root / "cache" / "orphan.wav").exists())
@@ -0,0 +1,159 @@
+import os
+import json
+import pathlib
+import tempfile
+import unittest
+import numpy as np
+import soundfile
+from Utilities.SaveManager import SaveManager
+from Utilities.RenderCache import _RenderCache
+from loop import LoopChannel
+from dispatcher import Dispatcher
+
+
+class Test_SaveIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmp_dir.name)
+        self.wav = os.fspath(self.root / "take.wav")
+        soundfile.write(self.wav, np.zeros((2000, 1)), 1000)
+        self.manager = SaveManager(save_dir=self.root / ".save")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _loop(self, name, tracks=()):
+        return {"loop_name": name, "tracks": list(tracks)}
+
+    def test_save_adds_entry_with_metadata(self):
+        self.manager.save("loop", self._loop("groove", [self.wav,
+                                                        "missing.wav"]))
+        self.assertTrue(self.manager.has_loop("groove"))
+        info = self.manager.get_info("loop", "groove")
+        self.assertEqual(info["tracks"], 2)
+        self.assertAlmostEqual(info["duration"], 2.0)
+        self.assertIsNone(self.manager.get_info("loop", "other"))
+
+    def test_delete_removes_file_and_entry(self):
+        self.manager.save("loop", self._loop("groove"))
+        self.assertTrue(self.manager.delete("loop", "groove"))
+        self.assertFalse(self.manager.has_loop("groove"))
+        self.assertFalse((self.root / ".save/loops/groove.json").exists())
+        self.assertFalse(self.manager.delete("loop", "groove"))
+
+    def test_index_survives_restart_without_reading_files(self):
+        self.manager.save("loop", self._loop("groove", [self.wav]))
+        manager = SaveManager(save_dir=self.root / ".save")
+        manager._describe = None    # fails if a saved file is read again
+        self.assertEqual(manager.get_loop_options(), ["groove"])
+        self.assertEqual(manager.get_info("loop", "groove")["tracks"], 1)
+
+    def test_files_changed_behind_its_back_are_found(self):
+        self.manager.save("loop", self._loop("groove"))
+        loop_dir = self.root / ".save" / "loops"
+        with open(os.fspath(loop_dir / "copied.json"), "w") as file:
+            json.dump(self._loop("copied", [self.wav]), file)
+        os.remove(os.fspath(loop_dir / "groove.json"))
+        self.assertEqual(self.manager.get_loop_options(), ["copied"])
+
+    def test_other_instances_see_saves(self):
+        other = SaveManager(save_dir=self.root / ".save")
+        self.manager.save("loop", self._loop("groove"))
+        self.manager.save("loop", self._loop("groove", [self.wav]))
+        self.assertEqual(other.get_info("loop", "groove")["tracks"], 1)
+
+
+class Test_LoopSaveFormat(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmp_dir.name)
+        self.wav = os.fspath(self.root / "take.wav")
+        audio = np.zeros((4410, 2), dtype=np.float32)
+        audio[:2205] = 0.5
+        soundfile.write(self.wav, audio, 44100, subtype="FLOAT")
+        self.manager = SaveManager(save_dir=self.root / ".save")
+        # track hashes go through the render cache, keep it out of the app
+        _RenderCache._instance = _RenderCache(
+            cache_dir=self.root / ".save" / "cache")
+        self.dispatcher = Dispatcher(save_manager=self.manager)
+
+    def tearDown(self):
+        self.dispatcher.shutdown()
+        _RenderCache._instance = None
+        self.tmp_dir.cleanup()
+
+    def test_tracks_carry_metadata(self):
+        loop = LoopChannel("rich", self.wav, self.wav)
+        loop.tracks[1].set_reverse(1)
+        track = loop.get_data()["tracks"][1]
+        self.assertEqual(track["path"], self.wav)
+        self.assertEqual((track["sample_rate"], track["frames"],
+                          track["channels"]), (44100, 4410, 2))
+        self.assertEqual(track["reverse"], 1)
+        self.assertTrue(track["active"])
+        self.assertEqual(len(track["hash"]), 40)
+        self.assertEqual(len(track["peaks"]), 64)
+        self.assertEqual(track["peaks"][0], 0.5)
+        self.assertEqual(track["peaks"][-1], 0.0)
+
+    def test_length_is_known_without_the_audio(self):
+        self.manager.save("loop", LoopChannel("rich", self.wav).get_data())
+        os.remove(self.wav)
+        self.assertAlmostEqual(
+            self.manager.get_info("loop", "rich")["duration"], 0.1)
+
+    def test_load_restores_effects(self):
+        loop = LoopChannel("rich", self.wav, self.wav)
+        loop.tracks[0].set_reverse(1)
+        loop.tracks[1].set_pitch(12)
+        self.manager.save("loop", loop.get_data())
+        self.assertEqual(self.dispatcher.load_loop("rich"), 2)
+        self.assertEqual(self.dispatcher.get_track_effects("rich"),
+                         [(1, 0), (0, 12)])
+
+    def test_load_reuses_saved_peaks(self):
+        self.manager.save("loop", LoopChannel("rich", self.wav).get_data())
+        # fails if the content is hashed while loading
+        _RenderCache._instance.source_hash = None
+        self.assertEqual(self.dispatcher.load_loop("rich"), 1)
+        track = self.dispatcher.get_loop("rich").tracks[0]
+        track._original = None    # fails if the peaks are computed again
+        self.assertEqual(track.get_peaks()[0], 0.5)
+
+    def test_changed_file_drops_saved_peaks(self):
+        self.manager.save("loop", LoopChannel("rich", self.wav).get_data())
+        audio = np.full((4410, 2), 0.25, dtype=np.float32)
+        soundfile.write(self.wav, audio, 44100, subtype="FLOAT")
+        self.assertEqual(self.dispatcher.load_loop("rich"), 1)
+        track = self.dispatcher.get_loop("rich").tracks[0]
+        self.assertEqual(track.get_peaks()[-1], 0.25)
+
+    def test_overdub_keeps_its_recorded_tempo(self):
+        loop = LoopChannel("rich", self.wav)
+        loop.set_tempo_ratio(2)
+        overdub = os.fspath(self.root / "overdub.wav")
+        soundfile.write(overdub, np.zeros((2205, 2)), 44100,
+                        subtype="FLOAT")
+        loop.add_track(overdub)
+        self.assertEqual(loop.tracks[1].get_frames(), 2205)
+        loop.set_tempo_ratio(1)
+        self.assertEqual(loop.tracks[1].tempo_ratio, 0.5)
+        self.assertEqual(loop.tracks[1].get_frames(), 4410)
+
+        # a loaded loop plays the overdub at the tempo of the first track
+        loop.set_tempo_ratio(2)
+        self.manager.save("loop", loop.get_data())
+        self.assertEqual(self.dispatcher.load_loop("rich"), 2)
+        self.assertEqual([track.get_frames() for track in
+                          self.dispatcher.get_loop("rich").tracks],
+                         [4410, 4410])
+
+    def test_loads_plain_paths_and_skips_missing(self):
+        self.manager.save("loop", {"loop_name": "old",
+                                   "tracks": [self.wav, "missing.wav"]})
+        self.assertEqual(self.dispatcher.load_loop("old"), 1)
+        self.assertEqual(self.dispatcher.get_loop_length("old"), 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
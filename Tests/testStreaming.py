@@ -0,0 +1,91 @@
+import os
+import tempfile
+import threading
+import unittest
+import numpy as np
+import soundfile
+from streaming import map_wav, StreamingSource
+
+
+class Test_Streaming(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        self.pcm = rng.integers(-32768, 32767, (10000, 2), dtype=np.int16)
+        self.path = os.path.join(self.tmp_dir.name, "track.wav")
+        soundfile.write(self.path, self.pcm, 44100, subtype="PCM_16")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _play(self, source, frames, block=512):
+        out = np.zeros((frames, 2), dtype=np.float32)
+        for start in range(0, frames, block):
+            source.add_into(out[start:start + block], start)
+        return out
+
+    def test_map_wav_matches_decoder(self):
+        samples, sample_rate = map_wav(self.path)
+        self.assertIsInstance(samples, np.memmap)
+        self.assertEqual(sample_rate, 44100)
+        self.assertTrue(np.array_equal(samples, self.pcm))
+
+    def test_map_wav_rejects_unsupported_format(self):
+        path = os.path.join(self.tmp_dir.name, "track24.wav")
+        soundfile.write(path, self.pcm, 44100, subtype="PCM_24")
+        with self.assertRaises(ValueError):
+            map_wav(path)
+
+    def test_source_plays_whole_track(self):
+        samples, _ = map_wav(self.path)
+        for reverse in (False, True):
+            source = StreamingSource(samples, 2, reverse=reverse,
+                                     chunk_frames=1024)
+            source.prime()
+            out = self._play(source, len(samples))
+            source.close()
+            expected = self.pcm[::-1] if reverse else self.pcm
+            self.assertTrue(np.allclose(out, expected / 32768))
+
+    def test_source_memory_is_bounded(self):
+        samples, _ = map_wav(self.path)
+        source = StreamingSource(samples, 2, chunk_frames=1024, read_ahead=2)
+        source.prime(5000)
+        self.assertEqual(len(source._pool), 3)
+        self.assertLessEqual(len(source._chunks), 3)
+        self.assertIn(0, source._chunks)
+        self.assertIn(4, source._chunks)
+        source.close()
+
+    def test_concurrent_fills_never_share_buffers(self):
+        samples, _ = map_wav(self.path)
+        source = StreamingSource(samples, 2, chunk_frames=256, read_ahead=2)
+        threads = [
+            threading.Thread(target=lambda position=position: [
+                source.prime(position + step * 256) for step in range(30)])
+            for position in (0, 1000, 2000, 3000)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        source.close()
+        chunks = source._chunks
+        self.assertEqual(len({id(b) for b in chunks.values()}), len(chunks))
+        for chunk, buffer in chunks.items():
+            start = chunk * 256
+            n = min(256, len(samples) - start)
+            self.assertTrue(np.allclose(buffer[:n],
+                                        self.pcm[start:start + n] / 32768))
+
+    def test_mono_is_spread_to_channels(self):
+        path = os.path.join(self.tmp_dir.name, "mono.wav")
+        soundfile.write(path, self.pcm[:, 0], 44100, subtype="PCM_16")
+        samples, _ = map_wav(path)
+        source = StreamingSource(samples, 2, chunk_frames=1024)
+        out = self._play(source, len(samples))
+        self.assertTrue(np.allclose(out[:, 1], self.pcm[:, 0] / 32768))
+
+
+if __name__ == '__main__':
+    unittest.main()
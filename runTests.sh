@@ -1 +1,6 @@
-python3 -m unittest discover -v
\ No newline at end of file
+if [ "$1" = "--bench" ]; then
+  shift
+  python3 -m Tests.benchmarks "$@"
+else
+  python3 -m unittest discover -v
+fi